@@ -0,0 +1,170 @@
+## Performance suite for encode_bytes / decode_bytes (header format), Encode_Image / Decode_Image (legacy text format)
+## and PSNR.
+## It needs only the requirements of the repo and runs offline. From the root folder:
+##
+##   python bench/bench.py --quick                       # small matrix, prints the results
+##   python bench/bench.py --save bench/baseline.json    # record a baseline on this machine
+##   python bench/bench.py --compare bench/baseline.json --threshold 0.25
+##
+## With --compare the exit code is 1 if any case is slower than the baseline by more than the threshold.
+## Baselines are only meaningful on the machine that recorded them.
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.steg import encode_bytes, decode_bytes, Encode_Image, Decode_Image, PSNR, capacity  # noqa: E402
+
+LENNA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Lenna.png")
+
+#(name, width, height). 8K is 7680x4320.
+SIZES = [("256", 256, 256), ("1024", 1024, 1024), ("2048", 2048, 2048), ("4096", 4096, 4096), ("8K", 7680, 4320)]
+QUICK_SIZES = SIZES[:2]
+PAYLOADS = [16, 1024, 65536]
+
+
+def make_carrier(width, height):
+    """
+    A reproducible noisy RGB carrier (noise keeps the PNG codecs and the LSBs realistic).
+    """
+
+    rng = np.random.default_rng(width * 7 + height)
+    return Image.fromarray(rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8), "RGB")
+
+
+def measure(function, repeats):
+    """
+    Run function repeats times.
+
+    Returns:
+        (seconds, peak_mb, result): The best time, the peak of the memory allocated during one run
+        (NumPy and PIL buffers included, as traced by tracemalloc) and the last result.
+    """
+
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 2**20, result
+
+
+def run_suite(sizes, payloads, repeats, with_lenna=True):
+    """
+    Run encode, decode and PSNR over every (carrier, payload) pair that fits, in the header format
+    (encode_bytes / decode_bytes) and in the legacy text format (Encode_Image / Decode_Image, cases
+    "encode_legacy" and "decode_legacy").
+
+    Returns:
+        dict: case name -> {"seconds", "pixel_mb_s", "payload_b_s", "peak_mb"}.
+    """
+
+    carriers = [(name, make_carrier(w, h)) for name, w, h in sizes]
+    if with_lenna and os.path.exists(LENNA):
+        with Image.open(LENNA) as im:
+            carriers.append(("lenna", im.convert("RGB")))
+
+    results = {}
+    for carrier_name, img in carriers:
+        pixel_mb = img.width * img.height * 3 / 2**20
+        for size in payloads:
+            if size > capacity(img):
+                continue
+            payload = np.random.default_rng(size).integers(0, 256, size, dtype=np.uint8).tobytes()
+
+            seconds, peak, encoded = measure(lambda: encode_bytes(img, payload), repeats)
+            cases = {"encode": (seconds, peak)}
+            cases["decode"] = measure(lambda: decode_bytes(encoded), repeats)[:2]
+            cases["psnr"] = measure(lambda: PSNR(img, encoded), repeats)[:2]
+            #The legacy format holds text ended by a NUL: printable ASCII of the same size.
+            text = bytes(b % 95 + 32 for b in payload).decode("ascii")
+            seconds, peak, legacy = measure(lambda: Encode_Image(img, text), repeats)
+            cases["encode_legacy"] = (seconds, peak)
+            cases["decode_legacy"] = measure(lambda: Decode_Image(legacy), repeats)[:2]
+
+            for op, (seconds, peak) in cases.items():
+                results[f"{op}/{carrier_name}/{size}"] = {
+                    "seconds": seconds,
+                    "pixel_mb_s": pixel_mb / seconds,
+                    "payload_b_s": size / seconds,
+                    "peak_mb": peak,
+                }
+                print(f"{op:13s} {carrier_name:>6s} {size:>7d} B  {seconds * 1000:9.2f} ms  "
+                      f"{pixel_mb / seconds:9.1f} MB/s  {peak:8.1f} MB peak", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare the results with a baseline.
+
+    Returns:
+        list: (case, baseline seconds, seconds) of the cases slower than baseline * (1 + threshold).
+    """
+
+    regressions = []
+    for case, base in baseline["results"].items():
+        if case in results and results[case]["seconds"] > base["seconds"] * (1 + threshold):
+            regressions.append((case, base["seconds"], results[case]["seconds"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark encode, decode and PSNR.")
+    parser.add_argument("--quick", action="store_true", help="Only the 256 and 1024 carriers (and Lenna).")
+    parser.add_argument("--sizes", nargs="+", help=f"Carrier sizes to run, among {[s[0] for s in SIZES]}.")
+    parser.add_argument("--payloads", nargs="+", type=int, default=PAYLOADS, help="Payload sizes in bytes.")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per case, the best time is kept.")
+    parser.add_argument("--no-lenna", action="store_true", help="Skip the bundled Lenna.png.")
+    parser.add_argument("--save", help="Write the results as a JSON baseline.")
+    parser.add_argument("--compare", help="JSON baseline to compare with.")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before failing (0.25 = 25%%).")
+    args = parser.parse_args(argv)
+
+    if args.sizes:
+        sizes = [s for s in SIZES if s[0] in args.sizes]
+    else:
+        sizes = QUICK_SIZES if args.quick else SIZES
+
+    results = run_suite(sizes, args.payloads, args.repeats, with_lenna=not args.no_lenna)
+    report = {
+        "machine": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform()},
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, #KB on Linux
+        "results": results,
+    }
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for case, before, after in regressions:
+            print(f"REGRESSION {case}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms", file=sys.stderr)
+        if regressions:
+            return 1
+
+    if not args.save:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,12 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 import os
-from PIL import Image
 ## TO RUN IT WITHOUT PROBLEMS, ensure __init__.py exists in the src folder and run it from the root folder with 'python gui\CTgui.py' in windows or 'python gui/CTgui.py' 
-from src.steg import Encode_Image, Decode_Image, PSNR  # Assuming these functions are in steganography.py
+from src.output import PROFILES, EXTENSIONS
+from src.tracing import format_breakdown
+from gui.worker import JobQueue, encode_file, decode_file
+
+POLL_MS = 100 #How often the GUI collects the events of the background jobs.
 
 
 class SteganographyGUI(ctk.CTk):
@@ -12,14 +15,14 @@ class SteganographyGUI(ctk.CTk):
         super().__init__()
         #Define basic attributes and widget.
         self.title("Image Steganography Tool")
-        self.geometry("630x700")
+        self.geometry("630x800")
 
 
         # Input Frame
         self.input_frame = ctk.CTkFrame(self) #Createa a background frame
         self.input_frame.pack(padx=20, pady=10, fill="x") # Aiuto, sono così negativo, veramente. 
         
-        ctk.CTkLabel(self.input_frame, text="Input Image:").pack(anchor="w") #
+        ctk.CTkLabel(self.input_frame, text="Input Images:").pack(anchor="w") #Several files are separated by ';' 
         
         self.input_entry = ctk.CTkEntry(self.input_frame, width=400) #Entry for the input
         self.input_entry.pack(side="left", padx=(0, 10)) 
@@ -82,29 +85,61 @@ class SteganographyGUI(ctk.CTk):
             value="decode"
         )
         self.decode_radio.pack(side="left", padx=20)
+
+        #Encoder settings of the saved image: fast writes, or smaller files.
+        self.profile_var = ctk.StringVar(value="fast")
+        self.profile_menu = ctk.CTkOptionMenu(self.operation_frame, values=list(PROFILES), variable=self.profile_var)
+        self.profile_menu.pack(side="right", padx=20)
+        ctk.CTkLabel(self.operation_frame, text="Save profile:").pack(side="right")
         
-        # Convert Button
+        # Convert and Cancel Buttons
+        self.buttons_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.buttons_frame.pack(pady=10)
+
         self.convert_btn = ctk.CTkButton(
-            self,
+            self.buttons_frame,
             text="Convert",
             command=self.process_image,
             height=40
         )
-        self.convert_btn.pack(pady=20)
+        self.convert_btn.pack(side="left", padx=10)
+
+        self.cancel_btn = ctk.CTkButton(
+            self.buttons_frame,
+            text="Cancel",
+            command=self.cancel_jobs,
+            height=40,
+            state="disabled"
+        )
+        self.cancel_btn.pack(side="left", padx=10)
+
+        # Progress of the running job
+        self.progress_label = ctk.CTkLabel(self, text="Idle")
+        self.progress_label.pack(padx=20, anchor="w")
+        self.progress_bar = ctk.CTkProgressBar(self)
+        self.progress_bar.set(0)
+        self.progress_bar.pack(fill="x", padx=20, pady=5)
         
         # Status Display
         self.status_text = ctk.CTkTextbox(self, height=100)
         self.status_text.pack(fill="x", padx=20, pady=10)
 
+        # The jobs run in the background, the window only polls their events.
+        self.jobs = JobQueue(trace=True)
+        self.job_names = {}
+        self.job_phases = {} #Time spent in every phase of the finished jobs, logged with their result.
+        self.after(POLL_MS, self.poll_jobs)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
     ## UI defined, we know need to create commands.     
 
     def browse_input(self):
-        filename = filedialog.askopenfilename(
-            filetypes=[("Image files", "*.png *.jpg *.jpeg *.bmp")]
+        filenames = filedialog.askopenfilenames(
+            filetypes=[("Image files", "*.png *.jpg *.jpeg *.bmp *.tif *.tiff *.webp")]
         )
-        if filename: #If filename exist, I update the string in the box
+        if filenames: #If filenames exist, I update the string in the box
             self.input_entry.delete(0, "end") #Remove the old text
-            self.input_entry.insert(0, filename)  #Create the new text
+            self.input_entry.insert(0, ";".join(filenames))  #Create the new text
             if self.same_output_var.get(): #If the value is 
                 self.update_output_path() # Note THAT THE DIRECTORY IS UPDATED ONLY IF WE CHOOSE THE INPUT AFTER CHECKING THE BOX. 
     
@@ -112,7 +147,7 @@ class SteganographyGUI(ctk.CTk):
         if self.operation_var.get() == "encode":
             filename = filedialog.asksaveasfilename(
                 defaultextension=".png",
-                filetypes=[("PNG files", "*.png")]
+                filetypes=[("PNG files", "*.png"), ("WebP lossless", "*.webp"), ("TIFF files", "*.tif *.tiff"), ("BMP files", "*.bmp")]
             )
         else:
             filename = filedialog.asksaveasfilename(
@@ -132,14 +167,37 @@ class SteganographyGUI(ctk.CTk):
             self.output_entry.configure(state="normal")
             self.browse_output_btn.configure(state="normal")
     
+    def input_paths(self):
+        return [path.strip() for path in self.input_entry.get().split(";") if path.strip()]
+
+    def output_path_for(self, input_path, output_location, many):
+        #With several inputs the output location is a directory (or the directory of the chosen file).
+        if not many and not self.same_output_var.get():
+            return output_location
+        if self.same_output_var.get():
+            directory = os.path.dirname(input_path)
+        elif os.path.isdir(output_location):
+            directory = output_location
+        else:
+            directory = os.path.dirname(output_location)
+        name, ext = os.path.splitext(os.path.basename(input_path))
+        if self.operation_var.get() == "decode":
+            return os.path.join(directory, f"{name}_decoded.txt")
+        if ext.lower() not in list(EXTENSIONS.values()) + [".tiff"]:
+            ext = ".png" #A lossy output (e.g. JPEG) would destroy the message.
+        return os.path.join(directory, f"{name}_converted{ext}")
+
     def update_output_path(self):
-        input_path = self.input_entry.get()
+        paths = self.input_paths()
+        input_path = paths[0] if paths else ""
         if input_path:
             directory = os.path.dirname(input_path)
             filename = os.path.basename(input_path)
             name, ext = os.path.splitext(filename)
             
             if self.operation_var.get() == "encode":
+                if ext.lower() not in list(EXTENSIONS.values()) + [".tiff"]:
+                    ext = ".png" #A lossy output (e.g. JPEG) would destroy the message.
                 new_filename = f"{name}_converted{ext}"
             else:
                 new_filename = f"{name}_decoded.txt"
@@ -149,51 +207,77 @@ class SteganographyGUI(ctk.CTk):
             self.output_entry.insert(0, output_path)
     
     def process_image(self):
-
-
-
-        input_path = self.input_entry.get() #check if the input path is inserted
-        output_path = self.output_entry.get() #check if the output path is inserted
+        input_paths = self.input_paths() #check if the input paths are inserted
+        output_location = self.output_entry.get() #check if the output path is inserted
         message = self.message_text.get("1.0", "end-1c")  #Check the message text
         
-        if not input_path:
+        if not input_paths:
             messagebox.showerror("Error", "Please select a valid input file")
             return
         
-        if not output_path:
+        if not output_location and not self.same_output_var.get():
             messagebox.showerror("Error", "Please select a valid output location")
             return
-        
-        try:
-            if self.operation_var.get() == "encode":
-                if not message:
-                    messagebox.showerror("Error", "Please enter a message to encode")
-                    return
-                
-                with Image.open(input_path) as im:
-                    encoded = Encode_Image(im, message)
-                    encoded.save(output_path)
-                    # Calculate PSNR
-                    psnr_value = PSNR(im, encoded)
-                    
-                    self.status_text.delete("1.0", "end")
-                    self.status_text.insert("1.0", f"Image encoded successfully!\nPSNR Value: {psnr_value:.2f} dB")
-            
-            else:  # decode
-                with Image.open(input_path) as im:
-                    decoded_text = Decode_Image(im)
-                
-                # Save decoded text to file
-                with open(output_path, 'w') as f:
-                    f.write(decoded_text)
-                
-                self.status_text.delete("1.0", "end")
-                self.status_text.insert("1.0", f"Image decoded successfully!\nDecoded text saved to: {output_path}")
-        
-        except Exception as e:
-            self.status_text.delete("1.0", "end")
-            self.status_text.insert("1.0", f"Error: {str(e)}")
-            messagebox.showerror("Error", str(e))
+
+        encode = self.operation_var.get() == "encode"
+        if encode and not message:
+            messagebox.showerror("Error", "Please enter a message to encode")
+            return
+
+        #Every file is a job of the queue: the window stays responsive while they run.
+        many = len(input_paths) > 1
+        for input_path in input_paths:
+            output_path = self.output_path_for(input_path, output_location, many)
+            if encode:
+                job_id = self.jobs.submit(encode_file, input_path, output_path, message, self.profile_var.get())
+            else:
+                job_id = self.jobs.submit(decode_file, input_path, output_path)
+            self.job_names[job_id] = os.path.basename(input_path)
+        self.cancel_btn.configure(state="normal")
+        self.progress_label.configure(text=f"{self.jobs.pending()} job(s) queued")
+
+    def cancel_jobs(self):
+        self.jobs.cancel()
+        self.progress_label.configure(text="Cancelling...")
+
+    def log(self, line):
+        self.status_text.insert("end", line + "\n")
+        self.status_text.see("end")
+
+    def poll_jobs(self):
+        #Runs on the Tk thread: the only place where the results of the jobs touch the widgets.
+        for event in self.jobs.drain():
+            kind, job_id = event[0], event[1]
+            name = self.job_names.get(job_id, "")
+            if kind == "started":
+                self.progress_bar.set(0)
+                self.progress_label.configure(text=f"{name}: started")
+            elif kind == "progress":
+                phase, done, total = event[2:]
+                self.progress_bar.set(done / total if total else 1)
+                self.progress_label.configure(text=f"{name}: {phase}")
+            elif kind == "phases":
+                self.job_phases[job_id] = event[2]
+            elif kind == "done":
+                self.log(event[2])
+                if job_id in self.job_phases:
+                    self.log(f"    {format_breakdown(self.job_phases.pop(job_id))}")
+            elif kind == "error":
+                self.log(f"{name}: Error: {event[2]}")
+                messagebox.showerror("Error", f"{name}: {event[2]}")
+            elif kind == "cancelled":
+                self.log(f"{name}: cancelled")
+            if kind in ("done", "error", "cancelled"):
+                self.job_names.pop(job_id, None)
+                if not self.job_names:
+                    self.progress_bar.set(0)
+                    self.progress_label.configure(text="Idle")
+                    self.cancel_btn.configure(state="disabled")
+        self.after(POLL_MS, self.poll_jobs)
+
+    def on_close(self):
+        self.jobs.shutdown()
+        self.destroy()
     
 
 if __name__ == "__main__":
@@ -0,0 +1,165 @@
+## Background jobs of the GUI. Tk is not thread safe, so the jobs never touch the widgets: they run on a worker
+## pool and post their progress and results on a queue, which the GUI drains with after() polling.
+## Nothing here imports Tk, so it can be tested headless. NumPy and PIL are imported by the first job, on the
+## worker thread, so the window opens without waiting for them.
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src import tracing
+
+PROGRESS_INTERVAL = 0.05 #Minimum seconds between two progress events of a job, so the queue is not flooded.
+
+
+def encode_file(input_path, output_path, message, profile="fast", progress=None):
+    """
+    Encode a message in an image file and save it (see output.save_encoded).
+
+    Returns:
+        str: The status line of the job.
+    """
+
+    from PIL import Image
+    from src.steg import encode_bytes
+    from src.metrics import psnr_from_stats
+    from src.output import save_encoded
+
+    stats = {}
+    with Image.open(input_path) as im:
+        encoded = encode_bytes(im, message.encode("utf-8"), header=False, stats=stats, progress=progress)
+    if progress is not None:
+        progress("save", 0, 1) #Last chance to cancel, the file is not written yet.
+    saved = save_encoded(encoded, output_path, profile=profile)
+    #The distortion is known from the embedding, there is no need to compare the two images.
+    return (f"{os.path.basename(input_path)}: encoded, PSNR {psnr_from_stats(stats):.2f} dB, "
+            f"saved {saved['bytes'] / 1024:.1f} KiB in {saved['seconds']:.2f} s to {output_path}")
+
+
+def decode_file(input_path, output_path, progress=None):
+    """
+    Decode the message of an image file and write it to output_path.
+
+    Returns:
+        str: The status line of the job.
+    """
+
+    from PIL import Image
+    from src.steg import decode_bytes
+
+    with Image.open(input_path) as im:
+        payload = decode_bytes(im, progress=progress)
+    try:
+        text = payload.decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise ValueError(f"Error decoding message. Invalid UTF-8 sequence: {e}")
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return f"{os.path.basename(input_path)}: decoded, text saved to {output_path}"
+
+
+class JobQueue:
+    """
+    Run jobs on a pool of worker threads and report them through the events queue.
+
+    Every job gets a progress callback (see encode_bytes) that posts ("progress", job_id, phase, done, total)
+    events and raises Cancelled once the job has been cancelled. When a job ends, one of ("done", job_id, result),
+    ("error", job_id, message) or ("cancelled", job_id) is posted.
+
+    Parameters:
+            workers(int): How many jobs run at the same time. The others wait in the queue, in order.
+
+            trace(bool): Record the phases of every job (see tracing.collect): a ("phases", job_id, phases) event
+                with the same breakdown as the command line --trace is posted just before "done".
+    """
+
+    def __init__(self, workers=1, trace=False):
+        self.trace = trace
+        self.events = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="steg-gui")
+        self._jobs = {} #job_id -> (future, cancel event)
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def submit(self, function, *args):
+        """
+        Queue function(*args, progress=callback) and return the id of the job.
+        """
+
+        with self._lock:
+            job_id = self._next_id
+            self._next_id += 1
+            cancel = threading.Event()
+            future = self._executor.submit(self._run, job_id, cancel, function, args)
+            self._jobs[job_id] = (future, cancel)
+        return job_id
+
+    def _run(self, job_id, cancel, function, args):
+        from src.steg import Cancelled
+
+        last = [0.0]
+
+        def progress(phase, done, total):
+            if cancel.is_set():
+                raise Cancelled()
+            now = time.monotonic()
+            if now - last[0] >= PROGRESS_INTERVAL or done == total:
+                last[0] = now
+                self.events.put(("progress", job_id, phase, done, total))
+
+        try:
+            if cancel.is_set():
+                raise Cancelled()
+            self.events.put(("started", job_id))
+            if self.trace:
+                with tracing.collect() as breakdown:
+                    result = function(*args, progress=progress)
+                self.events.put(("phases", job_id, breakdown.phases()))
+            else:
+                result = function(*args, progress=progress)
+        except Cancelled:
+            self.events.put(("cancelled", job_id))
+        except Exception as e:
+            self.events.put(("error", job_id, str(e)))
+        else:
+            self.events.put(("done", job_id, result))
+        finally:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+
+    def cancel(self, job_id=None):
+        """
+        Cancel a job, or every queued and running job if job_id is None. Running jobs stop at their next
+        progress call, queued jobs never start.
+        """
+
+        with self._lock:
+            jobs = list(self._jobs.values()) if job_id is None else [self._jobs[job_id]] if job_id in self._jobs else []
+        for _, cancel in jobs:
+            cancel.set()
+
+    def pending(self):
+        """
+        Return how many jobs are queued or running.
+        """
+
+        with self._lock:
+            return len(self._jobs)
+
+    def drain(self):
+        """
+        Return the events posted since the last call, without blocking.
+        """
+
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def shutdown(self, wait=False):
+        self.cancel()
+        self._executor.shutdown(wait=wait)
@@ -4,4 +4,9 @@ setup(
     name="Steg",
     version="0.1",
     packages=find_packages(),
-)
\ No newline at end of file
+    entry_points={
+        "console_scripts": [
+            "steg=src.cli:main",
+        ],
+    },
+)
@@ -1,12 +1,21 @@
-## __init__.py allows the functions and classes created with steg.py to be used in any . It actually mark directories as Python package directories. 
+## __init__.py allows the functions and classes created with steg.py to be used in any . It actually mark directories as Python package directories.
 ## WARNING: NEVER CREATE FUNCTIONS WITH THE SANE NAME OF OFFICIAL PYPI TO AVOID AMBIGUITY.
+## The names are imported on first use (see core.py), so 'import src' does not load NumPy and PIL.
 
-from .steg import Encode_Image, Decode_Image, PSNR
+from . import core as _core
 
 # Define what is going to be exported when someon do "from image_processing import *"
 
-__all__ = [
-    Encode_Image,
-    Decode_Image,
-    PSNR
-]
\ No newline at end of file
+__all__ = list(_core.EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _core.EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = _core.load(name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
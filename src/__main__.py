@@ -0,0 +1,7 @@
+## Allows to run the batch command line interface with 'python -m src'.
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,186 @@
+## asyncio facade for web backends: the CPU-bound encoding and decoding run in a thread or process pool,
+## so they never block the event loop. The NumPy core and the PIL codecs release the GIL on large arrays,
+## so a thread pool already runs the heavy parts in parallel; a process pool avoids the GIL completely.
+
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+from PIL import Image
+
+from .steg import encode_bytes, decode_bytes
+from .lazy import decode_path
+
+
+def _encode_job(img, data, kwargs):
+    """
+    Worker function of AsyncSteg.encode. img is a PIL image or the path of one.
+    """
+
+    if isinstance(img, Image.Image):
+        return encode_bytes(img, data, **kwargs)
+    with Image.open(img) as im:
+        return encode_bytes(im, data, **kwargs)
+
+
+def _decode_job(img, key=None):
+    """
+    Worker function of AsyncSteg.decode. Paths are decoded lazily (only the rows holding the payload).
+    """
+
+    if isinstance(img, Image.Image):
+        return decode_bytes(img, key=key)
+    return decode_path(img, key=key)
+
+
+class AsyncSteg:
+    """
+    Asynchronous encoder/decoder with bounded concurrency.
+
+    At most max_in_flight jobs are submitted to the pool at the same time; the others wait (without
+    using the pool) until a slot is free, which gives backpressure to the callers. Cancelling the awaiting
+    task cancels the job too, if it has not started yet; a job already running keeps its slot (and counts
+    in_flight) until it ends, since the pool cannot stop it.
+
+    Parameters:
+            executor(str or Executor): "thread" (default) or "process" to create a pool, or an existing
+                concurrent.futures.Executor (it is not shut down by close()).
+
+            max_workers(int): Size of the pool created by AsyncSteg (default: the executor default).
+
+            max_in_flight(int): Maximum number of jobs submitted to the pool at once (default: 2 x max_workers,
+                or 32).
+
+    Usage:
+            async with AsyncSteg("process", max_workers=4) as steg:
+                encoded = await steg.encode(img, b"payload")
+                payload = await steg.decode(encoded)
+    """
+
+    def __init__(self, executor="thread", max_workers: int = None, max_in_flight: int = None):
+        if isinstance(executor, Executor):
+            self._executor = executor
+            self._owns_executor = False
+        elif executor == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="steg")
+            self._owns_executor = True
+        elif executor == "process":
+            self._executor = ProcessPoolExecutor(max_workers=max_workers)
+            self._owns_executor = True
+        else:
+            raise ValueError("executor must be 'thread', 'process' or a concurrent.futures.Executor.")
+
+        if max_in_flight is None:
+            max_in_flight = 2 * max_workers if max_workers else 32
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1.")
+        self.max_in_flight = max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+        self._waiting = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+
+    @property
+    def metrics(self) -> dict:
+        """
+        Queue depth and job counters: waiting (for a slot), in_flight (submitted to the pool), completed, failed, cancelled.
+        """
+
+        return {
+            "waiting": self._waiting,
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "completed": self._completed,
+            "failed": self._failed,
+            "cancelled": self._cancelled,
+        }
+
+    async def _run(self, function, *args):
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        except asyncio.CancelledError:
+            self._cancelled += 1
+            raise
+        finally:
+            self._waiting -= 1
+
+        self._in_flight += 1
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._release()
+            raise
+        #The slot is released when the job really ends, not when the awaiting task is cancelled.
+        future.add_done_callback(lambda _: self._release_threadsafe(loop))
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            self._cancelled += 1
+            future.cancel() #Only a job that has not started is cancelled.
+            raise
+        except Exception:
+            self._failed += 1
+            raise
+
+        self._completed += 1
+        return result
+
+    def _release(self):
+        self._in_flight -= 1
+        self._slots.release()
+
+    def _release_threadsafe(self, loop):
+        #Done callbacks run in the worker thread (or wherever the future was cancelled).
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            pass #The event loop is closed, nobody waits for the slot anymore.
+
+    async def encode(self, img, data, **kwargs) -> Image.Image:
+        """
+        Embed data (bytes-like, or str encoded in UTF-8) in img (a PIL image or a path).
+        The keyword arguments are passed to encode_bytes.
+        """
+
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        elif not isinstance(data, bytes):
+            data = bytes(data) #The job may be sent to another process, memoryviews cannot be pickled.
+        return await self._run(_encode_job, img, data, kwargs)
+
+    async def decode(self, img, key=None) -> bytes:
+        """
+        Decode the payload of img (a PIL image or a path), with the key used to encode it, if any.
+        """
+
+        return await self._run(_decode_job, img, key)
+
+    async def decode_text(self, img, key=None) -> str:
+        """
+        Decode the payload of img as UTF-8 text, as Decode_Image does.
+        """
+
+        payload = await self.decode(img, key)
+        try:
+            return payload.decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise ValueError(f"Error decoding message. Invalid UTF-8 sequence: {e}")
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Shut down the pool created by AsyncSteg. Jobs not started yet are cancelled.
+        """
+
+        if self._owns_executor:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        #Shutting down waits for the running jobs, do it out of the event loop.
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
@@ -0,0 +1,192 @@
+## Cache of decoded payloads, for services that decode the same carriers again and again (re-uploads, retries).
+## Entries are keyed by a BLAKE2 hash of the file bytes (or of the pixels, mode and size of a PIL image) and of
+## the decoding key, so a repeated decode costs one hash and one lookup instead of decompressing the image.
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from .steg import decode_bytes
+from .lazy import decode_path
+from .scatter import _key_bytes
+
+MAX_BYTES = 64 << 20 #Default budget of the payloads kept in memory.
+HASH_CHUNK_BYTES = 1 << 20 #Files are hashed in chunks of this size.
+
+
+def content_hash(img_or_path, key=None) -> bytes:
+    """
+    Return the cache key of an image: a 16 byte BLAKE2b digest of its content and of the decoding key.
+
+    Files (paths or binary file objects) are hashed from their bytes, without decoding them; PIL images are
+    hashed from their pixels, mode and size. So the same image has different keys as a file and as a PIL image.
+    """
+
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(img_or_path, Image.Image):
+        h.update(b"pixels")
+        h.update(f"{img_or_path.mode}:{img_or_path.size[0]}x{img_or_path.size[1]}".encode())
+        h.update(img_or_path.tobytes())
+    elif hasattr(img_or_path, "read"):
+        start = img_or_path.tell()
+        h.update(b"file")
+        for chunk in iter(lambda: img_or_path.read(HASH_CHUNK_BYTES), b""):
+            h.update(chunk)
+        img_or_path.seek(start)
+    else:
+        h.update(b"file")
+        with open(img_or_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+                h.update(chunk)
+    h.update(b"key" + _key_bytes(key) if key is not None else b"nokey")
+    return h.digest()
+
+
+class DecodeCache:
+    """
+    Decode images through an LRU cache of their payloads, with an optional persistent SQLite tier.
+
+    The in-memory tier keeps the most recently used payloads within max_bytes (payloads larger than the budget
+    are not kept in memory). With path, every decoded payload is also stored in an SQLite database, which
+    survives restarts and is looked up on a memory miss. Failed decodes are not cached.
+
+    The counters "hits", "disk_hits" (hits of the SQLite tier, included in hits), "misses" and "evictions"
+    are returned by stats().
+
+    Parameters:
+            max_bytes(int): Budget of the payloads kept in memory.
+
+            path(str): File of the SQLite tier (created if missing). None (default) keeps the cache in memory only.
+
+    Usage:
+            with DecodeCache(path="decoded.sqlite") as cache:
+                payload = cache.decode("upload.png")
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES, path: str = None):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() #digest -> payload, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = self.evictions = 0
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(os.fspath(path), check_same_thread=False)
+            with self._db:
+                self._db.execute("CREATE TABLE IF NOT EXISTS payloads (digest BLOB PRIMARY KEY, payload BLOB NOT NULL)")
+
+    def _remember(self, digest: bytes, payload: bytes) -> None:
+        #Called with the lock held.
+        if digest in self._entries:
+            self._bytes -= len(self._entries.pop(digest))
+        if len(payload) > self.max_bytes:
+            return
+        self._entries[digest] = payload
+        self._bytes += len(payload)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def get(self, digest: bytes):
+        """
+        Return the payload cached for a content_hash digest, or None.
+        """
+
+        with self._lock:
+            payload = self._entries.get(digest)
+            if payload is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return payload
+            if self._db is not None:
+                row = self._db.execute("SELECT payload FROM payloads WHERE digest = ?", (digest,)).fetchone()
+                if row is not None:
+                    payload = bytes(row[0])
+                    self._remember(digest, payload)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return payload
+            self.misses += 1
+            return None
+
+    def put(self, digest: bytes, payload: bytes) -> None:
+        """
+        Cache the payload of a content_hash digest.
+        """
+
+        payload = bytes(payload)
+        with self._lock:
+            self._remember(digest, payload)
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("INSERT OR REPLACE INTO payloads (digest, payload) VALUES (?, ?)", (digest, payload))
+
+    def decode(self, img_or_path, key=None) -> bytes:
+        """
+        Decode the payload of an image (as decode_bytes, or lazy.decode_path for files), using the cache.
+
+        Parameters:
+                img_or_path(Image.Image, str or file): The image, or its file.
+
+                key(str, bytes or int): The key used to encode the image, if any. It is part of the cache key.
+
+        Returns:
+            bytes: The payload.
+        """
+
+        digest = content_hash(img_or_path, key)
+        payload = self.get(digest)
+        if payload is None:
+            if isinstance(img_or_path, Image.Image):
+                payload = decode_bytes(img_or_path, key=key)
+            else:
+                payload = decode_path(img_or_path, key=key)
+            self.put(digest, payload)
+        return payload
+
+    def decode_text(self, img_or_path, key=None) -> str:
+        """
+        Decode the payload as UTF-8 text, as Decode_Image does.
+        """
+
+        try:
+            return self.decode(img_or_path, key=key).decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise ValueError(f"Error decoding message. Invalid UTF-8 sequence: {e}")
+
+    def stats(self) -> dict:
+        """
+        Return the counters, the number of entries and the bytes kept in memory.
+        """
+
+        with self._lock:
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self._bytes}
+
+    def clear(self) -> None:
+        """
+        Drop every entry, in memory and on disk. The counters are kept.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("DELETE FROM payloads")
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
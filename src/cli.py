@@ -0,0 +1,361 @@
+## Headless command line interface: encodes, decodes or scans many images at once, fanning the work out to a process pool.
+## Run it with 'python -m src' from the root folder, or with 'steg' once the package is installed.
+## NumPy and PIL are only imported by the jobs, so parsing the arguments (and --help) starts at once.
+
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+import time
+
+from .output import PROFILES, EXTENSIONS
+from . import tracing
+
+IMAGE_EXTENSIONS = (".png", ".bmp", ".tif", ".tiff", ".webp", ".jpg", ".jpeg")
+
+
+def expand_inputs(inputs, roots=False):
+    """
+    Expand a list of files, directories and glob patterns in the sorted list of image paths.
+
+    Directories are walked recursively and only files with a known image extension are kept.
+    With roots=True, the list holds (path, root) pairs instead: root is the directory given, the directory
+    before the first wildcard of a pattern, or the directory of a plain file (see output_path_for).
+    """
+
+    found = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            for directory, _, files in os.walk(item):
+                for f in files:
+                    if f.lower().endswith(IMAGE_EXTENSIONS):
+                        found.setdefault(os.path.join(directory, f), item)
+        elif glob.has_magic(item):
+            root = item
+            while glob.has_magic(root):
+                root = os.path.dirname(root)
+            root = root or os.curdir #"*.png" is relative to the current directory.
+            for p in glob.glob(item, recursive=True):
+                if os.path.isfile(p):
+                    found.setdefault(p, root)
+        else:
+            found.setdefault(item, os.path.dirname(item) or os.curdir)
+    return sorted(found.items()) if roots else sorted(found)
+
+
+def read_manifest(path):
+    """
+    Read a manifest of image -> payload pairs.
+
+    The manifest is a JSON lines file, every line is an object with an "image" path and either a
+    "message" (text, UTF-8 encoded) or a "payload_file" (path of a file embedded as it is).
+    Relative paths are resolved from the directory of the manifest.
+
+    Returns:
+        list: The (image path, payload bytes) pairs.
+    """
+
+    base = os.path.dirname(os.path.abspath(path))
+    pairs = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if "image" not in entry:
+                raise ValueError(f"{path}:{line_number}: missing 'image'.")
+            image = os.path.join(base, entry["image"])
+            if "message" in entry:
+                payload = entry["message"].encode("utf-8")
+            elif "payload_file" in entry:
+                with open(os.path.join(base, entry["payload_file"]), "rb") as p:
+                    payload = p.read()
+            else:
+                raise ValueError(f"{path}:{line_number}: 'message' or 'payload_file' is required.")
+            pairs.append((image, payload))
+    return pairs
+
+
+def output_path_for(input_path, output_dir, suffix, root=None):
+    """
+    Build the output path as the GUI does: <name><suffix> in output_dir (or next to the input).
+
+    With a root (see expand_inputs), the directories of the input below root are mirrored in output_dir,
+    so inputs of the same name in different subdirectories get different outputs.
+    """
+
+    directory = os.path.dirname(input_path)
+    if output_dir:
+        #A bare file name has no directory part: relpath needs os.curdir instead of ''.
+        relative = os.path.relpath(directory or os.curdir, root or os.curdir) if root is not None else os.curdir
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            relative = os.curdir #Never write outside output_dir.
+        directory = os.path.normpath(os.path.join(output_dir, relative))
+    name, _ = os.path.splitext(os.path.basename(input_path))
+    return os.path.join(directory, f"{name}{suffix}")
+
+
+def check_outputs(output_paths):
+    """
+    Create the directories of the outputs, and refuse to start if two jobs would write the same file
+    (one of the results would be silently lost).
+    """
+
+    seen = set()
+    for path in output_paths:
+        key = os.path.normcase(os.path.abspath(path))
+        if key in seen:
+            raise SystemExit(f"Several inputs would be written to {path}, rename them or use another --output-dir layout.")
+        seen.add(key)
+    for directory in {os.path.dirname(path) for path in output_paths}:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+
+def encode_job(input_path, payload, output_path, header=True, bits_per_channel=1, key=None, compression=None, native=False, profile="fast", fec=None):
+    """
+    Encode one image and save it with the given profile (see output.save_encoded). It runs in the worker processes,
+    so it never raises: errors are reported in the result.
+
+    Returns:
+        dict: The JSON line of the result, with timing, PSNR, size of the output and time spent writing it.
+    """
+
+    result = {"op": "encode", "input": input_path, "output": output_path, "bytes": len(payload)}
+    start = time.perf_counter()
+    try:
+        from PIL import Image
+        from .steg import encode_bytes
+        from .metrics import psnr_from_stats
+        from .output import save_encoded
+
+        stats = {}
+        with Image.open(input_path) as im:
+            encoded = encode_bytes(im, payload, header=header, bits_per_channel=bits_per_channel, stats=stats, key=key, compression=compression, native=native, fec=fec)
+            saved = save_encoded(encoded, output_path, profile=profile)
+        result["file_bytes"] = saved["bytes"]
+        result["write_seconds"] = saved["seconds"]
+        psnr = psnr_from_stats(stats) #The encoder knows the distortion, no need to compare the images.
+        result["stored_bytes"] = stats["stored_bytes"]
+        result["psnr"] = float(psnr) if math.isfinite(psnr) else None #JSON has no infinity
+        result["ok"] = True
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def decode_job(input_path, output_path=None, key=None):
+    """
+    Decode one image. The payload is written to output_path if given, otherwise it is returned in the
+    result as "message" (if it is valid UTF-8) or as "payload_hex".
+
+    Returns:
+        dict: The JSON line of the result, with timing.
+    """
+
+    result = {"op": "decode", "input": input_path}
+    start = time.perf_counter()
+    try:
+        from .lazy import decode_path
+
+        info = {}
+        payload = decode_path(input_path, key=key, info=info) #Decompresses only the rows holding the payload.
+        result["bytes"] = len(payload)
+        if "corrected_errors" in info:
+            result["corrected_errors"] = info["corrected_errors"]
+        if output_path:
+            with open(output_path, "wb") as f:
+                f.write(payload)
+            result["output"] = output_path
+        else:
+            try:
+                result["message"] = payload.decode("utf-8")
+            except UnicodeDecodeError:
+                result["payload_hex"] = payload.hex()
+        result["ok"] = True
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def scan_job(input_path, sample=None, threshold=None):
+    """
+    Scan one image (see scan.scan_image). It never raises: errors are reported in the result.
+    sample and threshold default to scan.SAMPLE_CHANNELS and scan.P_THRESHOLD.
+
+    Returns:
+        dict: The JSON line of the result, with the verdict and timing.
+    """
+
+    result = {"op": "scan", "input": input_path}
+    start = time.perf_counter()
+    try:
+        from .scan import scan_image, SAMPLE_CHANNELS, P_THRESHOLD
+
+        sample = SAMPLE_CHANNELS if sample is None else sample
+        threshold = P_THRESHOLD if threshold is None else threshold
+        result.update(scan_image(input_path, sample=sample, threshold=threshold))
+        result["ok"] = True
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def traced_job(function, *args):
+    """
+    Run function(*args) recording the spans of its phases (see tracing.collect), and add the breakdown to the
+    result as "phases": {phase: {"calls", "seconds", "bytes", "pixels"...}}.
+    """
+
+    with tracing.collect() as breakdown:
+        result = function(*args)
+    result["phases"] = breakdown.phases()
+    return result
+
+
+def run_jobs(function, jobs, workers, chunksize=1, trace=False):
+    """
+    Run function(*args) for every args in jobs and yield the results as soon as they are ready.
+
+    With workers=1 the jobs run in this process, otherwise they are fanned out to a ProcessPoolExecutor.
+    With chunksize > 1 the jobs are sent to the workers in batches and the results come back in order:
+    for many short jobs (scans) this saves most of the inter-process overhead.
+    With trace=True every result gets the breakdown of its phases (see traced_job).
+    """
+
+    if trace:
+        jobs = [(function, *args) for args in jobs]
+        function = traced_job
+
+    if workers == 1:
+        for args in jobs:
+            yield function(*args)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if chunksize > 1:
+            yield from executor.map(function, *zip(*jobs), chunksize=chunksize)
+            return
+        futures = [executor.submit(function, *args) for args in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="steg", description="Encode, decode and scan LSB messages in batches of images.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    encode = subparsers.add_parser("encode", help="Embed a payload in every image.")
+    encode.add_argument("inputs", nargs="*", help="Image files, directories or glob patterns (required unless --manifest is given).")
+    source = encode.add_mutually_exclusive_group(required=True)
+    source.add_argument("-m", "--message", help="Text embedded in every input image.")
+    source.add_argument("--payload-file", help="File embedded (as it is) in every input image.")
+    source.add_argument("--manifest", help="JSON lines file of {\"image\", \"message\" or \"payload_file\"} pairs.")
+    encode.add_argument("-o", "--output-dir", help="Where to write the encoded images (default: next to the inputs).")
+    encode.add_argument("-k", "--bits-per-channel", type=int, default=1, help="LSBs used in every channel (1-4, 1-8 for native 16 bit images).")
+    encode.add_argument("--legacy", action="store_true", help="Use the NUL terminated format instead of the header.")
+    encode.add_argument("-c", "--compression", choices=["auto", "zlib", "lzma", "zstd"], help="Compress the payload before embedding it.")
+    encode.add_argument("--fec", choices=["hamming", "repeat3", "repeat5", "repeat7"], help="Add error correction, so a few flipped LSBs are fixed when decoding.")
+    encode.add_argument("-f", "--format", choices=[f.lower() for f in EXTENSIONS], default="png", help="Lossless format of the outputs.")
+    encode.add_argument("--profile", choices=PROFILES, default="fast", help="Speed/size trade-off of the output encoder.")
+    encode.add_argument("--native", action="store_true", help="Keep RGBA, L, LA and 16 bit images in their mode, using the alpha channel too.")
+
+    decode = subparsers.add_parser("decode", help="Extract the payload of every image.")
+    decode.add_argument("inputs", nargs="+", help="Image files, directories or glob patterns.")
+    decode.add_argument("-o", "--output-dir", help="Write every payload to <name>_decoded.txt in this directory.")
+
+    scan = subparsers.add_parser("scan", help="Tell which images hold a payload, reading only their first rows.")
+    scan.add_argument("inputs", nargs="+", help="Image files, directories or glob patterns.")
+    scan.add_argument("--sample", type=int, help="Channels used by the chi-square test (default: 65536).")
+    scan.add_argument("--threshold", type=float, help="p-value above which the LSBs look embedded (default: 0.95).")
+    scan.add_argument("--report", help="Write the JSON lines to this file instead of the standard output.")
+
+    for sub in (encode, decode):
+        sub.add_argument("--key", help="Scatter the payload in a pseudo-random order derived from this key.")
+    for sub in (encode, decode, scan):
+        sub.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Number of worker processes.")
+        sub.add_argument("--trace", action="store_true", help="Add the time spent in every phase to the results.")
+        sub.add_argument("--metrics", help="Write the phase totals of the run to this file, in the Prometheus text format.")
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Entry point of the 'steg' console script. Results are streamed to stdout (or to the --report file) as JSON lines.
+
+    Returns:
+        int: 0 if every image was processed, 1 otherwise.
+    """
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "encode" and not args.inputs and not args.manifest:
+        parser.error("encode needs input images (or --manifest).")
+    if args.jobs < 1:
+        raise SystemExit("--jobs must be at least 1.")
+    if getattr(args, "output_dir", None):
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    if args.command == "encode":
+        if args.manifest:
+            base = os.path.dirname(os.path.abspath(args.manifest))
+            pairs = [(path, payload, base) for path, payload in read_manifest(args.manifest)]
+        else:
+            if args.message is not None:
+                payload = args.message.encode("utf-8")
+            else:
+                with open(args.payload_file, "rb") as f:
+                    payload = f.read()
+            pairs = [(path, payload, root) for path, root in expand_inputs(args.inputs, roots=True)]
+        #The output is always lossless, a JPEG output would destroy the LSBs.
+        suffix = "_converted" + EXTENSIONS[args.format.upper()]
+        jobs = [(path, payload, output_path_for(path, args.output_dir, suffix, root), not args.legacy, args.bits_per_channel, args.key, args.compression, args.native, args.profile, args.fec)
+                for path, payload, root in pairs]
+        check_outputs([job[2] for job in jobs])
+        function = encode_job
+    elif args.command == "decode":
+        jobs = [(path, output_path_for(path, args.output_dir, "_decoded.txt", root) if args.output_dir else None, args.key)
+                for path, root in expand_inputs(args.inputs, roots=True)]
+        check_outputs([job[1] for job in jobs if job[1]])
+        function = decode_job
+    else:
+        jobs = [(path, args.sample, args.threshold) for path in expand_inputs(args.inputs)]
+        function = scan_job
+
+    workers = min(args.jobs, max(len(jobs), 1))
+    #Scans take milliseconds: they are sent to the workers in batches.
+    chunksize = max(1, min(64, len(jobs) // (workers * 4))) if args.command == "scan" else 1
+    out = open(args.report, "w", encoding="utf-8") if getattr(args, "report", None) else sys.stdout
+    totals = tracing.Breakdown()
+    failures = 0
+    try:
+        for result in run_jobs(function, jobs, workers, chunksize, trace=args.trace or bool(args.metrics)):
+            failures += not result["ok"]
+            totals.merge(result.get("phases", {}))
+            if not args.trace:
+                result.pop("phases", None) #Only collected for --metrics.
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.metrics:
+        tracing.write_prometheus(totals.phases(), args.metrics)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
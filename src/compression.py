@@ -0,0 +1,94 @@
+## Optional compression stage of the payload, between the bytes of the user and the embedding.
+## The codec is stored in the header flags, so the decoder knows how to expand the payload.
+
+import lzma
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#Codec ids, stored in the header flags.
+NONE = 0
+ZLIB = 1
+LZMA = 2
+ZSTD = 3
+
+CODECS = {"zlib": ZLIB, "lzma": LZMA, "zstd": ZSTD}
+NAMES = {v: k for k, v in CODECS.items()}
+
+AUTO_MIN_SAVING = 0.10 #"auto" keeps the compressed payload only if it is at least 10% smaller.
+AUTO_MIN_SIZE = 64 #Shorter payloads are never worth compressing.
+
+
+def _zstd():
+    if zstandard is None:
+        raise ValueError("zstd compression needs the 'zstandard' package. Install it with 'pip install zstandard'.")
+    return zstandard
+
+
+def compress(data, codec: int, fast: bool = False) -> bytes:
+    """
+    Compress data (bytes-like) with the given codec id. fast selects the quickest level of the codec.
+    """
+
+    if codec == ZLIB:
+        return zlib.compress(data, 1 if fast else 9)
+    if codec == LZMA:
+        return lzma.compress(data, preset=0 if fast else 6)
+    if codec == ZSTD:
+        return _zstd().ZstdCompressor(level=1 if fast else 19).compress(data)
+    raise ValueError(f"Unknown compression codec {codec}.")
+
+
+def decompress(data: bytes, codec: int) -> bytes:
+    """
+    Expand data compressed with the given codec id.
+    """
+
+    try:
+        if codec == ZLIB:
+            return zlib.decompress(data)
+        if codec == LZMA:
+            return lzma.decompress(data)
+        if codec == ZSTD:
+            return _zstd().ZstdDecompressor().decompress(data)
+    except (zlib.error, lzma.LZMAError) as e:
+        raise ValueError(f"Corrupted compressed payload: {e}")
+    except Exception as e:
+        if zstandard is not None and isinstance(e, zstandard.ZstdError):
+            raise ValueError(f"Corrupted compressed payload: {e}")
+        raise
+    raise ValueError(f"Unknown compression codec {codec}.")
+
+
+def choose(data, compression) -> tuple:
+    """
+    Apply the compression stage selected by the user.
+
+    Parameters:
+            data(bytes-like): The payload.
+
+            compression(str): None (no compression), "zlib", "lzma", "zstd" or "auto". "auto" compresses with
+                the fastest available codec (zstd if installed, zlib otherwise) at its fastest level, and keeps
+                the result only if it saves at least AUTO_MIN_SAVING of the size.
+
+    Returns:
+        (codec, payload): The codec id used (NONE if the payload is left as it is) and the payload to embed.
+    """
+
+    if compression is None:
+        return NONE, data
+    if compression == "auto":
+        size = memoryview(data).nbytes
+        if size < AUTO_MIN_SIZE:
+            return NONE, data
+        codec = ZSTD if zstandard is not None else ZLIB
+        compressed = compress(data, codec, fast=True)
+        if len(compressed) <= size * (1 - AUTO_MIN_SAVING):
+            return codec, compressed
+        return NONE, data
+    if compression not in CODECS:
+        raise ValueError(f"compression must be None, 'auto' or one of {sorted(CODECS)}.")
+    return CODECS[compression], compress(data, CODECS[compression])
@@ -0,0 +1,53 @@
+## Lazy entry point of the public API. NumPy and PIL take most of the start-up time of the package (about 0.15 s),
+## so nothing heavy is imported here: every name is looked up in EXPORTS and its module is imported on first use
+## (PEP 562 module __getattr__). 'import src' and the command line parser stay cheap, and scripts that never touch
+## an image never pay for NumPy. The GUI (customtkinter) is never imported from the package.
+
+import importlib
+
+#Public name -> submodule defining it.
+EXPORTS = {
+    "Encode_Image": ".steg",
+    "Decode_Image": ".steg",
+    "PSNR": ".steg",
+    "encode_bytes": ".steg",
+    "decode_bytes": ".steg",
+    "capacity": ".steg",
+    "can_fit": ".steg",
+    "Cancelled": ".steg",
+    "save_encoded": ".output",
+    "scan_image": ".scan",
+    "DecodeCache": ".cache",
+    "encode_sharded": ".shard",
+    "decode_sharded": ".shard",
+}
+
+#The heavy third party modules, loaded on first use as well.
+MODULES = {"np": "numpy", "Image": "PIL.Image"}
+
+__all__ = list(EXPORTS)
+
+
+def load(name: str):
+    """
+    Import the module holding a public name (or a name of MODULES) and return the object.
+
+    Raises:
+        AttributeError: If name is not exported.
+    """
+
+    if name in EXPORTS:
+        return getattr(importlib.import_module(EXPORTS[name], __package__), name)
+    if name in MODULES:
+        return importlib.import_module(MODULES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __getattr__(name: str):
+    value = load(name)
+    globals()[name] = value #The next lookups do not go through __getattr__.
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(EXPORTS) | set(MODULES))
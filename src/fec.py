@@ -0,0 +1,112 @@
+## Optional forward error correction of the payload, between the compression and the embedding.
+## A few flipped LSBs (transport or storage glitches) are corrected when decoding instead of destroying the
+## payload. The codes work on whole arrays with NumPy table lookups. The scheme is stored in the header flags.
+## The header itself is not protected: a flipped header bit still makes the image unreadable.
+
+import numpy as np
+
+#Scheme ids, stored in the header flags.
+NONE = 0
+HAMMING = 1 #Hamming(7,4): 7 bits for every 4, corrects one flipped bit in every 7.
+REPEAT3 = 2 #Every byte stored 3 times (majority vote): corrects one copy in 3.
+REPEAT5 = 3
+REPEAT7 = 4
+
+SCHEMES = {"hamming": HAMMING, "repeat3": REPEAT3, "repeat5": REPEAT5, "repeat7": REPEAT7}
+NAMES = {v: k for k, v in SCHEMES.items()}
+REPEATS = {REPEAT3: 3, REPEAT5: 5, REPEAT7: 7}
+
+
+def _hamming_tables():
+    #Codeword bits, most significant first: p1 p2 d1 p3 d2 d3 d4 (the parity bits sit at positions 1, 2 and 4).
+    encode = np.zeros(16, dtype=np.uint8)
+    for nibble in range(16):
+        d1, d2, d3, d4 = (nibble >> 3) & 1, (nibble >> 2) & 1, (nibble >> 1) & 1, nibble & 1
+        p1, p2, p3 = d1 ^ d2 ^ d4, d1 ^ d3 ^ d4, d2 ^ d3 ^ d4
+        encode[nibble] = (p1 << 6) | (p2 << 5) | (d1 << 4) | (p3 << 3) | (d2 << 2) | (d3 << 1) | d4
+    #The code is perfect: every 7 bit word is a codeword or a codeword with one flipped bit.
+    decode = np.zeros(128, dtype=np.uint8)
+    flipped = np.zeros(128, dtype=np.uint8)
+    for nibble in range(16):
+        decode[encode[nibble]] = nibble
+        for bit in range(7):
+            decode[encode[nibble] ^ (1 << bit)] = nibble
+            flipped[encode[nibble] ^ (1 << bit)] = 1
+    return encode, decode, flipped
+
+HAMMING_ENCODE, HAMMING_DECODE, HAMMING_FLIPPED = _hamming_tables()
+
+
+def scheme(fec) -> int:
+    """
+    Return the scheme id of fec (a name of SCHEMES, or None).
+    """
+
+    if fec is None:
+        return NONE
+    if fec not in SCHEMES:
+        raise ValueError(f"Unknown error correction '{fec}', use one of {', '.join(SCHEMES)}.")
+    return SCHEMES[fec]
+
+
+def encoded_size(length: int, fec: int) -> int:
+    """
+    Bytes stored for a payload of length bytes.
+    """
+
+    if fec == HAMMING:
+        return -(-length * 14 // 8) #Two 7 bit codewords per byte.
+    return length * REPEATS.get(fec, 1)
+
+
+def decoded_size(stored: int, fec: int) -> int:
+    """
+    Largest payload that fits in stored bytes (the inverse of encoded_size).
+    """
+
+    if fec == HAMMING:
+        return stored * 8 // 14
+    return stored // REPEATS.get(fec, 1)
+
+
+def encode(data, fec: int) -> np.ndarray:
+    """
+    Add the redundancy of the scheme to data (a uint8 array). Returns the uint8 array to store.
+    """
+
+    data = np.asarray(data, dtype=np.uint8)
+    if fec == HAMMING:
+        nibbles = np.stack([data >> 4, data & 0x0F], axis=1).reshape(-1)
+        #The codewords are 7 bit: unpackbits gives 8 bits and the first one (always 0) is dropped.
+        bits = np.unpackbits(HAMMING_ENCODE[nibbles][:, None], axis=1)[:, 1:]
+        return np.packbits(bits.reshape(-1))
+    if fec in REPEATS:
+        #The copies follow each other instead of repeating every bit, so a burst of flipped channels hits one copy.
+        return np.tile(data, REPEATS[fec])
+    return data
+
+
+def decode(stored, fec: int) -> tuple:
+    """
+    Correct and strip the redundancy of stored (a uint8 array).
+
+    Returns:
+        (np.ndarray, int): The payload and the number of corrected bits.
+    """
+
+    stored = np.asarray(stored, dtype=np.uint8)
+    length = decoded_size(len(stored), fec)
+    if fec == HAMMING:
+        bits = np.unpackbits(stored)[:length * 14].reshape(-1, 7)
+        words = np.packbits(bits, axis=1)[:, 0] >> 1
+        nibbles = HAMMING_DECODE[words]
+        corrected = int(np.count_nonzero(HAMMING_FLIPPED[words]))
+        return (nibbles[0::2] << 4) | nibbles[1::2], corrected
+    if fec in REPEATS:
+        r = REPEATS[fec]
+        votes = np.unpackbits(stored[:length * r].reshape(r, length), axis=1).sum(axis=0, dtype=np.uint8)
+        bits = votes > r // 2
+        #Every copy that lost the vote had a flipped bit.
+        corrected = int(np.sum(np.where(bits, r - votes, votes), dtype=np.int64))
+        return np.packbits(bits), corrected
+    return stored, 0
@@ -0,0 +1,172 @@
+## Multi-frame carriers: one payload spread over all the frames of an animated PNG (APNG) or a multi-page TIFF.
+## Every frame holds one chunk with its index and the number of chunks in the header, and the frames are
+## encoded and decoded in parallel.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from .steg import _embed_payload, _extract_payload, _capacity_bytes, _varint, MAX_BITS_PER_CHANNEL
+from . import compression as _compression
+
+#Lossless formats that can store a sequence of RGB frames. GIF is palette based (its LSBs are palette indices)
+#and JPEG is lossy, so both would destroy the payload.
+SEQUENCE_FORMATS = {".png": "PNG", ".apng": "PNG", ".tif": "TIFF", ".tiff": "TIFF"}
+
+
+def _frames(img) -> list:
+    """
+    Return every frame of img (an image, a path, or a list of images) as an RGB pixel array.
+    """
+
+    if isinstance(img, (list, tuple)):
+        return [np.array(f.convert("RGB")) for f in img]
+    if not isinstance(img, Image.Image):
+        with Image.open(img) as im:
+            return _frames(im)
+    #convert makes a copy of every frame, which is needed as seeking reuses the same image.
+    return [np.array(frame.convert("RGB")) for frame in ImageSequence.Iterator(img)]
+
+
+def _map(function, items, workers):
+    #NumPy releases the GIL in the embedding, so the frames are processed in parallel by threads
+    #without copying them to other processes.
+    if workers == 1 or len(items) < 2:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, items))
+
+
+def split_sizes(total: int, capacities: list) -> list:
+    """
+    Split total bytes in chunks, one per frame, as evenly as the capacity of the frames allows.
+
+    Returns:
+        list: The size of every chunk.
+    """
+
+    sizes = [0] * len(capacities)
+    remaining = total
+    open_frames = list(range(len(capacities)))
+    #Give every frame an equal share; frames that are full drop out and their share goes to the others.
+    while remaining and open_frames:
+        share = -(-remaining // len(open_frames))
+        still_open = []
+        for i in open_frames:
+            add = min(share, capacities[i] - sizes[i], remaining)
+            sizes[i] += add
+            remaining -= add
+            if sizes[i] < capacities[i]:
+                still_open.append(i)
+        open_frames = still_open
+    if remaining:
+        raise ValueError("The frames are too small to contain the message. Choose a carrier with more or larger frames.")
+    return sizes
+
+
+def encode_frames(img, data, bits_per_channel: int = 1, key=None, compression: str = None, workers: int = None) -> list:
+    """
+    Spread a payload over all the frames of an animated or multi-page image.
+
+    Parameters:
+            img(Image.Image, str or list): The carrier (an APNG, a multi-page TIFF...), its path, or a list of frames.
+
+            data(bytes-like): The payload.
+
+            bits_per_channel(int), key, compression: As in encode_bytes. The payload is compressed as a whole.
+
+            workers(int): Threads encoding the frames in parallel (default: one per core).
+
+    Returns:
+        list: The encoded frames as RGB images. Save them with save_frames.
+    """
+
+    if not 1 <= bits_per_channel <= MAX_BITS_PER_CHANNEL:
+        raise ValueError(f"bits_per_channel must be between 1 and {MAX_BITS_PER_CHANNEL}.")
+
+    frames = _frames(img)
+    count = len(frames)
+    codec, data = _compression.choose(data, compression)
+    payload = memoryview(data).cast("B") #Slices of a memoryview are not copies.
+
+    capacities = [_capacity_bytes(f.size, bits_per_channel, extra_header_bytes=len(_varint(i)) + len(_varint(count)))
+                  for i, f in enumerate(frames)]
+    sizes = split_sizes(len(payload), capacities)
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(int)
+
+    def encode(i):
+        pixels = frames[i]
+        _embed_payload(pixels, payload[offsets[i]:offsets[i + 1]], bits_per_channel=bits_per_channel,
+                       key=key, chunk=(i, count, codec))
+        return Image.fromarray(pixels, "RGB")
+
+    return _map(encode, list(range(count)), workers)
+
+
+def decode_frames(img, key=None, workers: int = None) -> bytes:
+    """
+    Reassemble the payload spread over the frames of an image by encode_frames.
+
+    Parameters:
+            img(Image.Image, str or list): The carrier, its path, or a list of frames.
+
+            key: The key used to encode the frames, if any.
+
+            workers(int): Threads decoding the frames in parallel (default: one per core).
+
+    Returns:
+        bytes: The payload.
+    """
+
+    frames = _frames(img)
+
+    def decode(pixels):
+        info = {}
+        chunk = _extract_payload(pixels, key=key, info=info)
+        if "chunk_index" not in info:
+            raise ValueError("A frame does not hold a chunk: the image was not encoded with encode_frames.")
+        return info, chunk
+
+    chunks = {}
+    codecs = set()
+    counts = set()
+    for info, chunk in _map(decode, frames, workers):
+        chunks[info["chunk_index"]] = chunk
+        counts.add(info["chunk_count"])
+        codecs.add(info["codec"])
+
+    if len(counts) != 1 or len(codecs) != 1:
+        raise ValueError("The frames hold chunks of different payloads.")
+    count = counts.pop()
+    missing = sorted(set(range(count)) - set(chunks))
+    if missing:
+        raise ValueError(f"Missing chunks {missing} of {count}.")
+
+    payload = b"".join(chunks[i] for i in range(count))
+    codec = codecs.pop()
+    if codec:
+        payload = _compression.decompress(payload, codec)
+    return payload
+
+
+def save_frames(frames: list, path: str, duration=None, loop: int = 0) -> None:
+    """
+    Save encoded frames as an animated PNG or a multi-page TIFF, chosen by the extension of path.
+
+    Other formats are refused: GIF would quantize the frames to a palette and JPEG is lossy.
+    """
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in SEQUENCE_FORMATS:
+        raise ValueError(f"Unsupported sequence format '{ext}'. Use .png (APNG) or .tif/.tiff.")
+    params = {"save_all": True, "append_images": frames[1:], "format": SEQUENCE_FORMATS[ext]}
+    if params["format"] == "PNG":
+        #Every frame is stored whole and replaces the previous one, so the decoder reads back the exact pixels.
+        params.update(loop=loop, disposal=0, blend=0, default_image=False)
+        if duration is not None:
+            params["duration"] = duration
+    else:
+        params["compression"] = "tiff_deflate"
+    frames[0].save(path, **params)
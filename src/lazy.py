@@ -0,0 +1,137 @@
+## Lazy decoding of compressed carriers (PNG).
+## The payload sits in the first rows of the image in raster order, so PIL is asked to decompress only
+## the rows that hold it instead of the whole image.
+
+import numpy as np
+from PIL import Image
+
+from .steg import HEADER_MAX_BYTES, NATIVE_MODES, decode_bytes, _flags_bits_per_channel, _to_rgb, _parse_header, _read_bytes, _read_until_nul, _extract_payload, _header_mode_code
+from . import tracing
+
+
+def _can_read_rows(im: Image.Image) -> bool:
+    """
+    Check if the rows of the image can be decompressed incrementally: a non interlaced PNG stored in one zip stream.
+    """
+
+    return (im.format == "PNG"
+            and not im.info.get("interlace")
+            and len(im.tile) == 1
+            and im.tile[0][0] == "zip"
+            and hasattr(im, "_size"))
+
+
+def read_rows(fp, rows: int, native: bool = False) -> np.ndarray:
+    """
+    Decompress only the first rows of an image and return them as a rows x W x 3 uint8 array
+    (in the mode of the image if native=True and the mode is one of steg.NATIVE_MODES).
+
+    For PNG files the decoder is stopped as soon as the rows are filled. Other formats (or interlaced PNGs)
+    are decoded completely and cropped.
+
+    Parameters:
+            fp(str or file): The path of the image, or a binary file object (it is read from its current position).
+
+            rows(int): How many rows to read. It is clipped to the height of the image.
+
+            native(bool): Keep RGBA, L, LA and I;16 rows in their mode instead of converting them to RGB.
+
+    Returns:
+        np.ndarray: The pixels of the rows, in RGB (or in the mode of the image, see native).
+    """
+
+    with Image.open(fp) as im:
+        width, height = im.size
+        rows = min(rows, height)
+        with tracing.span("load", pixels=width * rows):
+            if _can_read_rows(im) and rows < height:
+                #Shrinking the size and the extents of the tile makes PIL stop decompressing after the last row.
+                decoder, _, offset, args = im.tile[0]
+                im._size = (width, rows)
+                im.tile = [(decoder, (0, 0, width, rows), offset, args)]
+                im.load()
+            else:
+                im = im.crop((0, 0, width, rows))
+        if native and im.mode in NATIVE_MODES:
+            with tracing.span("array", pixels=width * rows):
+                return np.array(im)
+        with tracing.span("convert", pixels=width * rows):
+            im = _to_rgb(im)
+        with tracing.span("array", pixels=width * rows):
+            return np.array(im)
+
+
+def decode_path(fp, key=None, info: dict = None) -> bytes:
+    """
+    Decode the payload of an image file, decompressing only the rows that hold it.
+
+    The header (or, for legacy images, the text up to the terminating byte) is read first from a few rows;
+    then exactly the rows of the declared length are read. Legacy images are read in strips of doubling height
+    until the terminator is found, so the total work is at most twice the rows of the message.
+
+    Parameters:
+            fp(str or file): The path of the image, or a seekable binary file object.
+
+            key: The key used to encode the image, if any. Keyed payloads are scattered over the whole image,
+                so they are decoded from the full image (as are the formats PIL cannot decode row by row).
+
+            info(dict): If given, filled as by steg._extract_payload: "chunk_index", "chunk_count" and "codec" for
+                chunks (which are returned as they are), "corrected_errors" with error correction.
+
+    Returns:
+        bytes: The payload, as decode_bytes would return it.
+    """
+
+    start = fp.tell() if hasattr(fp, "read") else None
+
+    def strip(rows, native=False):
+        if start is not None:
+            fp.seek(start)
+        return read_rows(fp, rows, native=native)
+
+    if start is not None:
+        fp.seek(start)
+    with Image.open(fp) as im:
+        width, height = im.size
+        mode = im.mode
+        if key is not None or not _can_read_rows(im):
+            #Keyed payloads are scattered over the whole image: nothing to gain, decode the whole image.
+            return decode_bytes(im, key=key, info=info)
+
+    #Native carriers (RGBA, L, LA, I;16 encoded with native=True) hold the header in their own mode, the others
+    #(e.g. alpha PNGs encoded through the RGB conversion) in the RGB rows, as decode_bytes does.
+    native = mode in NATIVE_MODES and mode != "RGB"
+    mode_code = 0
+    channels_per_row = width * 3
+    if native:
+        bands = Image.getmodebands(mode)
+        pixels = strip(-(-HEADER_MAX_BYTES * 8 // (width * bands)), native=True)
+        if _header_mode_code(pixels) == NATIVE_MODES[mode]:
+            mode_code = NATIVE_MODES[mode]
+            channels_per_row = width * bands
+        else:
+            native = False
+
+    def rows_for(channels):
+        return min(height, -(-channels // channels_per_row))
+
+    if not native:
+        pixels = strip(rows_for(HEADER_MAX_BYTES * 8))
+    parsed = _parse_header(_read_bytes(pixels, 0, min(HEADER_MAX_BYTES, pixels.size // 8)))
+
+    if parsed is not None:
+        flags, length, header_size, _, _ = parsed
+        bits_per_channel = _flags_bits_per_channel(flags)
+        needed = header_size * 8 + -(-length * 8 // bits_per_channel)
+        if needed > height * channels_per_row:
+            raise ValueError("Corrupted header: the declared message is larger than the image.")
+        if needed > pixels.size:
+            pixels = strip(rows_for(needed), native=native)
+        return _extract_payload(pixels, info=info, mode_code=mode_code)
+
+    #Legacy format: the terminator has been found when the strip holds more bytes than the message.
+    while True:
+        message = _read_until_nul(pixels)
+        if len(message) < pixels.size // 8 or len(pixels) == height:
+            return message
+        pixels = strip(min(height, len(pixels) * 2))
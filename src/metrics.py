@@ -0,0 +1,172 @@
+## Quality metrics of the embedding that never build full-frame float64 copies.
+## The images are compared in strips of rows with integer accumulators, and the PSNR can also be
+## computed from the stats reported by the encoder, without looking at the pixels at all.
+
+import math
+
+import numpy as np
+from PIL import Image
+
+CHUNK_ROWS = 256 #Rows compared at every step.
+
+
+def _as_pixels(img) -> np.ndarray:
+    """
+    Return the pixels of a PIL image (or an array) as an array with a channel axis (HxWxC).
+    """
+
+    pixels = np.asarray(img) if not isinstance(img, Image.Image) else np.array(img)
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, None]
+    return pixels
+
+
+def _pair(original, new):
+    o_pixels = _as_pixels(original)
+    n_pixels = _as_pixels(new)
+    if o_pixels.shape != n_pixels.shape:
+        raise ValueError(f"The images must have the same size and channels: {o_pixels.shape} != {n_pixels.shape}.")
+    return o_pixels, n_pixels
+
+
+def _max_value(pixels: np.ndarray) -> float:
+    #255 for 8 bit images, 65535 for 16 bit ones.
+    if np.issubdtype(pixels.dtype, np.integer):
+        return float(np.iinfo(pixels.dtype).max)
+    return 255.0
+
+
+def _psnr(sse: int, count: int, max_value: float) -> float:
+    if sse == 0:
+        return float('inf')  # No error => infinite PSNR
+    mse = sse / count
+    return 20 * math.log10(max_value / math.sqrt(mse))
+
+
+def _strips(o_pixels, n_pixels, chunk_rows):
+    #Every strip is turned in int64 differences, so the temporaries are bounded by chunk_rows.
+    for r in range(0, o_pixels.shape[0], chunk_rows):
+        yield n_pixels[r:r + chunk_rows].astype(np.int64) - o_pixels[r:r + chunk_rows]
+
+
+def sse(original, new, chunk_rows: int = CHUNK_ROWS) -> int:
+    """
+    Sum of the squared differences between two images, accumulated in integers strip by strip.
+    """
+
+    o_pixels, n_pixels = _pair(original, new)
+    total = 0
+    for diff in _strips(o_pixels, n_pixels, chunk_rows):
+        flat = diff.reshape(-1)
+        total += int(np.dot(flat, flat))
+    return total
+
+
+def mse(original, new, chunk_rows: int = CHUNK_ROWS) -> float:
+    """
+    Mean Squared Error between two images (PIL images or arrays of the same shape).
+    """
+
+    o_pixels, _ = _pair(original, new)
+    return sse(original, new, chunk_rows) / o_pixels.size
+
+
+def psnr(original, new, max_value: float = None, chunk_rows: int = CHUNK_ROWS) -> float:
+    """
+    Peak Signal to Noise Ratio (in dB) between two images.
+
+    Parameters:
+            original, new: PIL images or arrays of the same shape.
+
+            max_value(float): The peak value, by default the maximum of the dtype (255 for 8 bit images).
+
+    Returns:
+        float: The PSNR, inf if the images are equal.
+    """
+
+    o_pixels, n_pixels = _pair(original, new)
+    if max_value is None:
+        max_value = _max_value(o_pixels)
+    return _psnr(sse(o_pixels, n_pixels, chunk_rows), o_pixels.size, max_value)
+
+
+def psnr_from_stats(stats: dict) -> float:
+    """
+    PSNR of an embedding from the stats filled by encode_bytes(..., stats=stats).
+
+    Only the channels holding the payload change, so the encoder already knows the squared error:
+    this costs nothing, whatever the size of the image.
+    """
+
+    return _psnr(stats["sse"], stats["channels"], stats.get("max_value", 255))
+
+
+def channel_stats(original, new, chunk_rows: int = CHUNK_ROWS) -> list:
+    """
+    Per channel statistics of the difference between two images.
+
+    Returns:
+        list: One dict per channel with "mse", "psnr", "max_abs_diff" and "changed" (number of modified values).
+    """
+
+    o_pixels, n_pixels = _pair(original, new)
+    channels = o_pixels.shape[2]
+    sums = np.zeros(channels, dtype=np.int64)
+    changed = np.zeros(channels, dtype=np.int64)
+    max_abs = np.zeros(channels, dtype=np.int64)
+    for diff in _strips(o_pixels, n_pixels, chunk_rows):
+        diff = diff.reshape(-1, channels)
+        sums += np.einsum('ij,ij->j', diff, diff)
+        changed += np.count_nonzero(diff, axis=0)
+        if len(diff):
+            max_abs = np.maximum(max_abs, np.abs(diff).max(axis=0))
+
+    count = o_pixels.shape[0] * o_pixels.shape[1]
+    max_value = _max_value(o_pixels)
+    return [{
+        "mse": int(sums[c]) / count,
+        "psnr": _psnr(int(sums[c]), count, max_value),
+        "max_abs_diff": int(max_abs[c]),
+        "changed": int(changed[c]),
+    } for c in range(channels)]
+
+
+def ssim(original, new, block: int = 8, max_value: float = None, chunk_rows: int = CHUNK_ROWS) -> float:
+    """
+    Mean Structural Similarity index over non overlapping block x block windows, averaged over the channels.
+
+    The strips are converted to float32 one at a time, so the scratch memory is bounded by chunk_rows.
+    Pixels that do not fill a whole block on the right and bottom borders are ignored.
+
+    Returns:
+        float: The SSIM, 1.0 for identical images.
+    """
+
+    o_pixels, n_pixels = _pair(original, new)
+    if max_value is None:
+        max_value = _max_value(o_pixels)
+    c1 = (0.01 * max_value) ** 2
+    c2 = (0.03 * max_value) ** 2
+
+    height, width, channels = o_pixels.shape
+    bw = width // block
+    bh = height // block
+    if bw == 0 or bh == 0:
+        raise ValueError(f"The images are smaller than one {block}x{block} block.")
+    rows = max(chunk_rows // block, 1) * block
+
+    total = 0.0
+    for r in range(0, bh * block, rows):
+        r_end = min(r + rows, bh * block)
+        shape = ((r_end - r) // block, block, bw, block, channels)
+        x = o_pixels[r:r_end, :bw * block].astype(np.float32).reshape(shape)
+        y = n_pixels[r:r_end, :bw * block].astype(np.float32).reshape(shape)
+        mu_x = x.mean(axis=(1, 3))
+        mu_y = y.mean(axis=(1, 3))
+        var_x = (x * x).mean(axis=(1, 3)) - mu_x ** 2
+        var_y = (y * y).mean(axis=(1, 3)) - mu_y ** 2
+        cov = (x * y).mean(axis=(1, 3)) - mu_x * mu_y
+        index = ((2 * mu_x * mu_y + c1) * (2 * cov + c2)) / ((mu_x ** 2 + mu_y ** 2 + c1) * (var_x + var_y + c2))
+        total += float(index.sum(dtype=np.float64))
+
+    return total / (bh * bw * channels)
@@ -0,0 +1,101 @@
+## Saving of the encoded images. The payload lives in the LSBs, so only lossless formats are allowed, and the
+## encoder settings are picked from a profile: the default PNG settings of PIL (compress_level=6) are the
+## slowest step of a batch, while level 1 writes about 4 times faster for a slightly larger file.
+
+import os
+import time
+
+from . import tracing
+
+PROFILES = ("fast", "small", "archival")
+
+#Save options of every lossless format, for every profile.
+FORMAT_OPTIONS = {
+    "PNG": {
+        "fast": {"compress_level": 1, "optimize": False},
+        "small": {"compress_level": 9, "optimize": False},
+        "archival": {"compress_level": 9, "optimize": True},
+    },
+    #exact=True keeps the RGB values under transparent pixels, which hold payload too.
+    "WEBP": {
+        "fast": {"lossless": True, "exact": True, "quality": 0, "method": 0},
+        "small": {"lossless": True, "exact": True, "quality": 100, "method": 6},
+        "archival": {"lossless": True, "exact": True, "quality": 100, "method": 6},
+    },
+    "TIFF": {
+        "fast": {"compression": "packbits"},
+        "small": {"compression": "tiff_deflate"},
+        "archival": {"compression": "tiff_deflate"},
+    },
+    "BMP": {
+        "fast": {},
+        "small": {},
+        "archival": {},
+    },
+}
+
+#Modes every format stores as they are. PIL would silently convert the others, losing the LSBs.
+FORMAT_MODES = {
+    "PNG": {"RGB", "RGBA", "L", "LA", "I;16"},
+    "WEBP": {"RGB", "RGBA"},
+    "TIFF": {"RGB", "RGBA", "L", "LA", "I;16"},
+    "BMP": {"RGB", "L"}, #PIL reads 32 bit BMPs back as RGB, dropping the alpha channel.
+}
+
+EXTENSIONS = {"PNG": ".png", "WEBP": ".webp", "TIFF": ".tif", "BMP": ".bmp"}
+
+
+def output_format(path, format: str = None) -> str:
+    """
+    Return the lossless format an image would be saved in, from format or from the extension of path.
+
+    Raises:
+        ValueError: If the format is lossy (JPEG, GIF, ...) or unknown: it would destroy the payload.
+    """
+
+    if format is None:
+        from PIL import Image #Imported here so the command line parser can read the constants without PIL.
+
+        ext = os.path.splitext(str(path))[1].lower()
+        format = Image.registered_extensions().get(ext)
+        if format is None:
+            raise ValueError(f"Unknown image extension '{ext}', use one of {', '.join(EXTENSIONS.values())}.")
+    format = format.upper()
+    if format == "TIF":
+        format = "TIFF"
+    if format not in FORMAT_OPTIONS:
+        raise ValueError(f"{format} is lossy or not supported and would destroy the payload, use PNG, WEBP, TIFF or BMP.")
+    return format
+
+
+def save_encoded(img: "Image.Image", path, profile: str = "fast", format: str = None) -> dict:
+    """
+    Save an encoded image in a lossless format, with the encoder settings of a profile.
+
+    Parameters:
+            img(Image.Image): The encoded image (see encode_bytes).
+
+            path(str): Where to save it. The format follows from the extension unless format is given.
+
+            profile(str): "fast" (PNG compress_level=1, the fastest lossless write), "small" (the smallest
+                file at a reasonable speed) or "archival" (the smallest file, whatever the time).
+
+            format(str): "PNG", "WEBP" (lossless), "TIFF" (deflate) or "BMP". Lossy formats are refused.
+
+    Returns:
+        dict: "path", "format", "profile", "bytes" (size of the file) and "seconds" (time spent writing it).
+    """
+
+    if profile not in PROFILES:
+        raise ValueError(f"profile must be one of {', '.join(PROFILES)}.")
+    format = output_format(path, format)
+    if img.mode not in FORMAT_MODES[format]:
+        raise ValueError(f"{format} cannot store {img.mode} images without converting them, which would destroy the payload.")
+
+    with tracing.span("save", pixels=img.width * img.height) as s:
+        start = time.perf_counter()
+        img.save(path, format, **FORMAT_OPTIONS[format][profile])
+        seconds = time.perf_counter() - start
+        size = os.path.getsize(path)
+        s.add(bytes=size)
+    return {"path": str(path), "format": format, "profile": profile, "bytes": size, "seconds": seconds}
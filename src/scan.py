@@ -0,0 +1,219 @@
+## Triage of large image corpora: is this image encoded?
+## Only the first rows of every image are decompressed (see lazy.read_rows). The first LSBs are checked for
+## the header (MAGIC and a consistent header) or for a plausible legacy UTF-8 text with its terminator, and a
+## chi-square test on the pairs of values (2i, 2i+1) of the sampled channels flags LSB embedding without a
+## readable header (e.g. keyed payloads). Smooth histograms have even pairs anyway, so the same statistic on the
+## shifted pairs (2i+1, 2i+2), which embedding does not even out, is the control.
+
+import codecs
+import math
+
+import numpy as np
+from PIL import Image
+
+from .steg import HEADER_MAX_BYTES, NATIVE_MODES, FLAG_MODE, FLAG_MODE_SHIFT, FLAG_COMPRESSION, FLAG_COMPRESSION_SHIFT, FLAG_FEC, FLAG_FEC_SHIFT
+from .steg import _flags_bits_per_channel, _parse_header, _read_bytes, _to_rgb
+from .lazy import read_rows
+from . import compression as _compression
+from . import fec as _fec
+from . import tracing
+
+SAMPLE_CHANNELS = 1 << 16 #Channels of the first rows used for the chi-square test.
+P_THRESHOLD = 0.95 #p-values above it mean that the LSBs of the pairs are evened out, as LSB embedding does.
+LEGACY_CHECK_BYTES = 64 #Leading bytes checked for a legacy (NUL terminated) text.
+MIN_TEXT_BYTES = 4 #Shorter texts are too likely to appear by chance.
+MIN_PRINTABLE = 0.95 #Fraction of printable characters of a plausible text.
+MIN_EXPECTED = 5 #Pairs of values expected fewer times are left out of the chi-square test.
+CONTROL_RATIO = 0.7 #Embedded LSBs make the pairs clearly more even than the shifted pairs of the control.
+
+
+def _gammaincc(a: float, x: float) -> float:
+    """
+    Regularized upper incomplete gamma function Q(a, x), with a series for x < a + 1 and a continued fraction
+    (modified Lentz) otherwise. The p-value of a chi-square statistic c with df degrees of freedom is Q(df/2, c/2).
+    """
+
+    if x <= 0:
+        return 1.0
+    log_prefix = -x + a * math.log(x) - math.lgamma(a)
+    if x < a + 1:
+        term = total = 1.0 / a
+        n = a
+        for _ in range(10000):
+            n += 1
+            term *= x / n
+            total += term
+            if abs(term) < abs(total) * 1e-15:
+                break
+        return max(0.0, 1.0 - total * math.exp(log_prefix))
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 10000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return min(1.0, math.exp(log_prefix) * h)
+
+
+def _pairs_statistic(hist: np.ndarray, shift: int = 0) -> tuple:
+    """
+    Chi-square statistic of the pairs (2i, 2i+1) of a histogram, or (2i+1, 2i+2) with shift=1. Returns (chi2, df).
+    """
+
+    pairs = (hist[1:-1] if shift else hist).reshape(-1, 2)
+    expected = pairs.mean(axis=1)
+    used = expected >= MIN_EXPECTED
+    df = int(np.count_nonzero(used)) - 1
+    if df < 1:
+        return 0.0, 0
+    return float(np.sum((pairs[used, 0] - expected[used]) ** 2 / expected[used])), df
+
+
+def chi_square(channels: np.ndarray) -> tuple:
+    """
+    Chi-square test of LSB embedding (Westfeld and Pfitzmann) on an array of channel values.
+
+    Embedding random bits in the LSBs makes the values 2i and 2i+1 equally frequent. The statistic compares
+    the histogram with the average of every pair; a p-value close to 1 means the pairs are evened out.
+
+    Returns:
+        (chi2, df, p_value, control): p_value is None if no pair of values is frequent enough for the test.
+        control is the statistic of the shifted pairs (2i+1, 2i+2), normalised to the same degrees of freedom.
+    """
+
+    channels = np.asarray(channels).reshape(-1)
+    bins = int(np.iinfo(channels.dtype).max) + 1
+    hist = np.bincount(channels, minlength=bins).astype(np.float64)
+    chi2, df = _pairs_statistic(hist)
+    if df < 1:
+        return 0.0, 0, None, None
+    control, control_df = _pairs_statistic(hist, 1)
+    control = control * df / control_df if control_df else None
+    return chi2, df, _gammaincc(df / 2, chi2 / 2), control
+
+
+def _legacy_text(pixels: np.ndarray):
+    """
+    Check if the first LSBs hold a plausible legacy text: valid UTF-8, mostly printable, and either terminated
+    by a NUL byte or filling the whole window. Returns {"bytes", "terminated"} or None.
+    """
+
+    window = _read_bytes(pixels, 0, min(LEGACY_CHECK_BYTES, pixels.size // 8))
+    text = window.split(b"\x00", 1)[0]
+    terminated = len(text) < len(window)
+    if len(text) < MIN_TEXT_BYTES:
+        return None
+    try:
+        #An unterminated text may be cut in the middle of a character: the decoder keeps the incomplete tail.
+        chars = codecs.getincrementaldecoder("utf-8")().decode(text, final=terminated)
+    except UnicodeDecodeError:
+        return None
+    printable = sum(c.isprintable() or c in "\n\r\t" for c in chars)
+    if not chars or printable < MIN_PRINTABLE * len(chars):
+        return None
+    return {"bytes": len(text), "terminated": terminated}
+
+
+def _header_info(pixels: np.ndarray, channels: int, mode_code: int):
+    """
+    Parse the header at the start of the pixels. Returns None without MAGIC, {"error"} for an inconsistent header,
+    otherwise its fields. channels is the number of channels of the whole image.
+    """
+
+    try:
+        parsed = _parse_header(_read_bytes(pixels, 0, min(HEADER_MAX_BYTES, pixels.size // 8)))
+    except ValueError as e:
+        return {"error": str(e)}
+    if parsed is None:
+        return None
+    flags, length, header_size, chunk, crc = parsed
+    bits_per_channel = _flags_bits_per_channel(flags)
+    if (flags & FLAG_MODE) >> FLAG_MODE_SHIFT != mode_code:
+        return {"error": "The mode in the header does not match the image."}
+    if header_size * 8 + -(-length * 8 // bits_per_channel) > channels:
+        return {"error": "The declared payload is larger than the image."}
+    info = {"length": length, "bits_per_channel": bits_per_channel,
+            "compression": _compression.NAMES.get((flags & FLAG_COMPRESSION) >> FLAG_COMPRESSION_SHIFT),
+            "checksum": crc is not None, "fec": _fec.NAMES.get((flags & FLAG_FEC) >> FLAG_FEC_SHIFT)}
+    if chunk is not None:
+        info["chunk_index"], info["chunk_count"] = chunk
+    return info
+
+
+def scan_image(img_or_path, sample: int = SAMPLE_CHANNELS, threshold: float = P_THRESHOLD) -> dict:
+    """
+    Classify an image as encoded or not, reading only its first rows.
+
+    Parameters:
+            img_or_path(Image.Image, str or file): The image. Files are decompressed only up to the rows needed.
+
+            sample(int): How many channels (from the first rows) the chi-square test uses.
+
+            threshold(float): p-value above which the LSBs are considered embedded.
+
+    Returns:
+        dict: "verdict" is "header" (a consistent header), "corrupted_header" (MAGIC with an inconsistent header),
+        "legacy" (a plausible NUL terminated text), "suspicious" (no readable payload, but the chi-square p-value
+        is above the threshold and the pairs are clearly more even than the control, e.g. keyed payloads) or
+        "clean". It also holds "header" or "legacy" (the details of the payload found), "chi2", "df", "p_value",
+        "control" and "sampled_channels".
+    """
+
+    if isinstance(img_or_path, Image.Image):
+        (width, height), mode = img_or_path.size, img_or_path.mode
+    else:
+        with Image.open(img_or_path) as im:
+            (width, height), mode = im.size, im.mode
+    native = mode in NATIVE_MODES
+    bands = Image.getmodebands(mode) if native else 3
+    rows = max(1, -(-max(sample, HEADER_MAX_BYTES * 8) // (width * bands)))
+
+    if isinstance(img_or_path, Image.Image):
+        strip = img_or_path.crop((0, 0, width, min(rows, height)))
+        pixels = np.array(strip) if native else np.array(_to_rgb(strip))
+    else:
+        if hasattr(img_or_path, "seek"):
+            img_or_path.seek(0)
+        pixels = read_rows(img_or_path, rows, native=True)
+
+    #Native carriers hold the header in their own mode, the others in the RGB conversion.
+    candidates = [(pixels, NATIVE_MODES[mode])] if native else []
+    if mode != "RGB":
+        rgb = np.array(_to_rgb(Image.fromarray(pixels))) if native else pixels
+        candidates.append((rgb, 0))
+
+    result = {"mode": mode, "size": [width, height]}
+    for candidate, mode_code in candidates:
+        channels = width * height * (candidate.shape[2] if candidate.ndim == 3 else 1)
+        header = _header_info(candidate, channels, mode_code)
+        if header is not None:
+            result["verdict"] = "corrupted_header" if "error" in header else "header"
+            result["header"] = header
+            break
+    else:
+        legacy = _legacy_text(candidates[-1][0])
+        if legacy is not None:
+            result["verdict"] = "legacy"
+            result["legacy"] = legacy
+
+    #A constant alpha channel would dominate the histogram: the test only looks at the color channels.
+    color = pixels[..., :-1] if mode in ("RGBA", "LA") else pixels
+    sampled = color.reshape(-1)[:sample]
+    with tracing.span("chi_square", channels=int(sampled.size)):
+        chi2, df, p_value, control = chi_square(sampled)
+    result.update(chi2=chi2, df=df, p_value=p_value, control=control, sampled_channels=int(sampled.size))
+    if "verdict" not in result:
+        evened = p_value is not None and p_value > threshold and control is not None and chi2 < CONTROL_RATIO * control
+        result["verdict"] = "suspicious" if evened else "clean"
+    return result
@@ -0,0 +1,158 @@
+## Keyed pseudo-random order of the channels.
+## With a key, the payload bits are not written in raster order but scattered over the whole image,
+## following a permutation of the channel positions derived from the key.
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+BATCH = 1 << 16 #Random positions drawn at every step, it must never change (the order depends on it).
+CACHE_BYTES = 256 << 20 #Memory budget of the cached (shape, key) orders.
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _key_bytes(key) -> bytes:
+    if isinstance(key, str):
+        return key.encode("utf-8")
+    if isinstance(key, int):
+        return key.to_bytes((key.bit_length() + 8) // 8, "little", signed=True)
+    return bytes(key)
+
+
+class KeyedOrder:
+    """
+    The pseudo-random order of the channels of an image with total channels, for one key.
+
+    The order is built lazily: take(n) only draws the first n positions, and every prefix is the same
+    whatever n is asked, so the encoder and the decoder agree even if they ask for different lengths.
+
+    The first half of the positions is drawn by rejection (random positions, skipping those already taken):
+    this costs O(n) for small payloads instead of a permutation of the whole image. The taken positions are kept
+    in a sorted array while they are few, so the memory follows n and not the image, then in a bit mask (one bit
+    per channel, never larger than the order itself). Once half of the image is used, the remaining positions
+    are shuffled with a full permutation.
+    """
+
+    def __init__(self, total: int, key):
+        seed = int.from_bytes(hashlib.sha256(_key_bytes(key)).digest()[:16], "little")
+        self.rng = np.random.default_rng(seed)
+        self.total = total
+        self.order = np.empty(0, dtype=np.int64)
+        self._parts = [] #Batches drawn since the last concatenation into order.
+        self._drawn = 0
+        self._sorted = np.empty(0, dtype=np.int64) #The positions taken, sorted, while they are few (then None).
+        self._bits = None #Bit mask of the positions taken, once the sorted array would be larger than it.
+
+    def _taken(self, positions):
+        if self._bits is not None:
+            return ((self._bits[positions >> 3] >> (positions & 7)) & 1).astype(bool)
+        if not len(self._sorted):
+            return np.zeros(len(positions), dtype=bool)
+        index = np.minimum(np.searchsorted(self._sorted, positions), len(self._sorted) - 1)
+        return self._sorted[index] == positions
+
+    def _set_bits(self, positions):
+        #positions are sorted and unique: the bits of every byte are combined, then each byte is written once.
+        if not len(positions):
+            return
+        byte = positions >> 3
+        starts = np.flatnonzero(np.concatenate(([True], byte[1:] != byte[:-1])))
+        bits = np.left_shift(1, positions & 7).astype(np.uint8)
+        self._bits[byte[starts]] |= np.bitwise_or.reduceat(bits, starts)
+
+    def _take_positions(self, positions):
+        positions = np.sort(positions)
+        if self._bits is not None:
+            self._set_bits(positions)
+            return
+        self._sorted = np.insert(self._sorted, np.searchsorted(self._sorted, positions), positions) #Linear merge.
+        if self._sorted.nbytes * 8 > self.total:
+            self._bits = np.zeros(-(-self.total // 8), dtype=np.uint8)
+            self._set_bits(self._sorted)
+            self._sorted = None
+
+    def _draw_sparse(self):
+        draws = self.rng.integers(0, self.total, BATCH)
+        #First occurrence of every position in the draws: sorting position * BATCH + index puts the repeats of a
+        #position together, lowest index first (a plain sort, much faster than the stable argsort of np.unique).
+        keys = np.sort(draws * BATCH + np.arange(BATCH))
+        unique, first = np.divmod(keys, BATCH)
+        head = np.empty(BATCH, dtype=bool)
+        head[0] = True
+        np.not_equal(unique[1:], unique[:-1], out=head[1:])
+        first = first[head]
+        first = first[~self._taken(unique[head])]
+        #Back to the order they were drawn in, up to half of the image.
+        draws = draws[np.sort(first)[:self.total // 2 - self._drawn]]
+        self._take_positions(draws)
+        self._parts.append(draws)
+        self._drawn += len(draws)
+
+    def _draw_dense(self):
+        self._flush()
+        if self._bits is not None:
+            free = np.unpackbits(self._bits, count=self.total, bitorder="little") == 0
+        else:
+            free = np.ones(self.total, dtype=bool)
+            free[self._sorted] = False
+        self.order = np.concatenate([self.order, self.rng.permutation(np.flatnonzero(free))])
+        self._drawn = len(self.order)
+        self._sorted = self._bits = None #Every position is taken.
+
+    def _flush(self):
+        #The batches are concatenated once per take, not once per batch.
+        if self._parts:
+            self.order = np.concatenate([self.order] + self._parts)
+            self._parts = []
+
+    @property
+    def nbytes(self) -> int:
+        taken = self._bits if self._bits is not None else self._sorted
+        return self.order.nbytes + (0 if taken is None else taken.nbytes)
+
+    def take(self, n: int) -> np.ndarray:
+        """
+        Return the first n positions of the order.
+        """
+
+        if n > self.total:
+            raise ValueError("The image is too small to contain the message in the UTF Encoding. Choose another image or make this one larger.")
+        while self._drawn < n:
+            if self._drawn < self.total // 2:
+                self._draw_sparse()
+            else:
+                self._draw_dense()
+        self._flush()
+        return self.order[:n]
+
+
+def positions(shape: tuple, key, n: int) -> np.ndarray:
+    """
+    Return the first n channel positions (indices in the flattened pixel array) of the keyed order.
+
+    The orders are cached by (shape, key), so batches of images of the same size reuse them. The least recently
+    used orders are dropped when the cache holds more than CACHE_BYTES; an order larger than that is not kept.
+    """
+
+    cache_key = (tuple(shape), _key_bytes(key))
+    with _lock:
+        order = _cache.pop(cache_key, None)
+        if order is None:
+            order = KeyedOrder(int(np.prod(shape)), key)
+        result = order.take(n)
+        if order.nbytes <= CACHE_BYTES:
+            _cache[cache_key] = order
+            cached = sum(o.nbytes for o in _cache.values())
+            while cached > CACHE_BYTES:
+                _, evicted = _cache.popitem(last=False)
+                cached -= evicted.nbytes
+        return result
+
+
+def clear_cache() -> None:
+    with _lock:
+        _cache.clear()
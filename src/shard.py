@@ -0,0 +1,167 @@
+## Sharding: one payload spread over many carrier images, for payloads larger than any single image.
+## Every image holds one shard with its sequence number, the number of shards and the CRC-32 of the shard in
+## the header, so the images can be decoded in any order and a corrupted or foreign shard is detected.
+## The shards are encoded and decoded in parallel by a process pool.
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+
+from .steg import _embed_payload, _extract_payload, _capacity_bytes, _image_info, _to_rgb, _varint, MAX_BITS_PER_CHANNEL
+from .frames import split_sizes
+from .lazy import decode_path
+from .output import save_encoded
+from . import compression as _compression
+
+
+def _pixels(img) -> np.ndarray:
+    if isinstance(img, Image.Image):
+        return np.array(_to_rgb(img))
+    with Image.open(img) as im:
+        return np.array(_to_rgb(im))
+
+
+def _encode_shard(img, chunk, index, count, codec, bits_per_channel, key, output_path, profile):
+    """
+    Worker function of encode_sharded: embed one shard and return the image, or save it and return the report.
+    """
+
+    pixels = _pixels(img)
+    _embed_payload(pixels, chunk, bits_per_channel=bits_per_channel, key=key, chunk=(index, count, codec), checksum=True)
+    encoded = Image.fromarray(pixels, "RGB")
+    if output_path is None:
+        return index, encoded
+    return index, save_encoded(encoded, output_path, profile=profile)
+
+
+def _decode_shard(img, key):
+    """
+    Worker function of decode_sharded. Files are decoded lazily (only the rows holding the shard).
+
+    Returns:
+        (index, count, codec, chunk)
+    """
+
+    info = {}
+    if isinstance(img, Image.Image):
+        chunk = _extract_payload(np.array(_to_rgb(img)), key=key, info=info)
+    else:
+        chunk = decode_path(img, key=key, info=info)
+    if "chunk_index" not in info:
+        raise ValueError(f"{img if isinstance(img, (str, os.PathLike)) else 'An image'} does not hold a shard: it was not encoded with encode_sharded.")
+    return info["chunk_index"], info["chunk_count"], info["codec"], chunk
+
+
+def _run(function, jobs, workers):
+    """
+    Yield function(*args) for every args in jobs as soon as they are ready. The first error cancels the jobs
+    that have not started yet and is raised at once.
+    """
+
+    if workers == 1 or len(jobs) < 2:
+        for args in jobs:
+            yield function(*args)
+        return
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(function, *args) for args in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def encode_sharded(images, payload, output_paths=None, bits_per_channel: int = 1, key=None, compression: str = None,
+                   workers: int = None, profile: str = "fast") -> list:
+    """
+    Split a payload in shards and embed one shard in every carrier image, in parallel.
+
+    Parameters:
+            images(list): The carriers, as PIL images or paths. Only the headers of the files are read to split the payload.
+
+            payload(bytes-like or str): The payload (str is encoded in UTF-8).
+
+            output_paths(list): If given, every encoded image is saved there (see output.save_encoded) by the
+                worker that encoded it, and the save reports are returned instead of the images.
+
+            bits_per_channel(int), key, compression: As in encode_bytes. The payload is compressed as a whole.
+
+            workers(int): Worker processes (default: one per core, 1 encodes in this process).
+
+            profile(str): The save profile of the outputs, see output.save_encoded.
+
+    Returns:
+        list: The encoded images (or the save reports), in the order of images.
+    """
+
+    if not 1 <= bits_per_channel <= MAX_BITS_PER_CHANNEL:
+        raise ValueError(f"bits_per_channel must be between 1 and {MAX_BITS_PER_CHANNEL}.")
+    if output_paths is not None and len(output_paths) != len(images):
+        raise ValueError("output_paths must have one path per image.")
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+
+    count = len(images)
+    codec, data = _compression.choose(payload, compression)
+    data = memoryview(data).cast("B")
+    capacities = []
+    for i, img in enumerate(images):
+        (width, height), _ = _image_info(img)
+        capacities.append(_capacity_bytes(width * height * 3, bits_per_channel, checksum=True,
+                                          extra_header_bytes=len(_varint(i)) + len(_varint(count))))
+    try:
+        sizes = split_sizes(len(data), capacities)
+    except ValueError:
+        raise ValueError(f"The images can hold {sum(capacities)} bytes, the payload takes {len(data)}. Add more or larger carriers.")
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(int)
+
+    jobs = [(img, bytes(data[offsets[i]:offsets[i + 1]]), i, count, codec, bits_per_channel, key,
+             None if output_paths is None else output_paths[i], profile) for i, img in enumerate(images)]
+    results = [None] * count
+    for index, result in _run(_encode_shard, jobs, workers or os.cpu_count() or 1):
+        results[index] = result
+    return results
+
+
+def decode_sharded(images, key=None, workers: int = None) -> bytes:
+    """
+    Reassemble a payload from the images encoded by encode_sharded, given in any order.
+
+    It fails as soon as a shard is corrupted (checksum), belongs to another payload, is duplicated, or when
+    there are fewer images than shards.
+
+    Parameters:
+            images(list): The encoded images, as PIL images or paths, in any order.
+
+            key: The key used to encode them, if any.
+
+            workers(int): Worker processes (default: one per core, 1 decodes in this process).
+
+    Returns:
+        bytes: The payload.
+    """
+
+    if not images:
+        raise ValueError("No images to decode.")
+    chunks = {}
+    count = codec = None
+    for index, shard_count, shard_codec, chunk in _run(_decode_shard, [(img, key) for img in images], workers or os.cpu_count() or 1):
+        if count is None:
+            count, codec = shard_count, shard_codec
+            if len(images) < count:
+                raise ValueError(f"Missing shards: the payload has {count} shards, only {len(images)} images were given.")
+        elif (shard_count, shard_codec) != (count, codec):
+            raise ValueError("The images hold shards of different payloads.")
+        if index in chunks:
+            raise ValueError(f"Shard {index} of {count} is given twice.")
+        chunks[index] = chunk
+
+    missing = sorted(set(range(count)) - set(chunks))
+    if missing:
+        raise ValueError(f"Missing shards {missing} of {count}.")
+    payload = b"".join(chunks[i] for i in range(count))
+    if codec:
+        payload = _compression.decompress(payload, codec)
+    return payload
@@ -1,84 +1,727 @@
 try:
     import numpy as np
     from PIL import Image
-    import os
-    import sys
+    import zlib
 except ImportError as e:
     raise ImportError(f"Missing dependencies: {e}. Install them with 'pip install -r requirements.txt'")
 
-def Encode_Image(img: Image.Image, txt : str) -> Image.Image:
+from .metrics import psnr
+from . import scatter
+from . import compression as _compression
+from . import fec as _fec
+from . import tracing
+
+DECODE_CHUNK_BYTES = 4096 #Bytes decoded at every step while looking for the terminator.
+PROGRESS_CHUNK_CHANNELS = 1 << 20 #Channels embedded or read between two calls of the progress callback.
+
+#Versioned header: MAGIC, VERSION, flags (varint) and payload length (varint).
+#0x89 can never be the first byte of an UTF-8 string, so a legacy (NUL terminated) text message
+# can't be mistaken for a header.
+MAGIC = b'\x89STG'
+VERSION = 1
+CRC_BYTES = 4
+HEADER_MAX_BYTES = len(MAGIC) + 1 + 10 + 10 + 20 + CRC_BYTES #A 64 bit varint takes at most 10 bytes, chunks add two.
+
+#Header flags. The header itself is always written with one bit per channel.
+FLAG_BITS_PER_CHANNEL = 0x03 #bits_per_channel - 1 of the payload (1 to 4 LSBs per channel).
+FLAG_COMPRESSION = 0x0C #Codec of the payload (see compression), shifted by FLAG_COMPRESSION_SHIFT.
+FLAG_COMPRESSION_SHIFT = 2
+#The payload is one chunk of a larger one: chunk index and count (varints) follow the length.
+#The codec then refers to the reassembled payload, not to the chunk.
+FLAG_CHUNK = 0x10
+FLAG_MODE = 0xE0 #Mode of the carrier the payload was embedded in (see NATIVE_MODES), shifted by FLAG_MODE_SHIFT.
+FLAG_MODE_SHIFT = 5
+FLAG_BITS_PER_CHANNEL_HIGH = 0x100 #Third bit of bits_per_channel - 1, only 16 bit carriers use more than 4 bits.
+FLAG_CRC = 0x200 #The CRC-32 of the stored payload (4 bytes, big endian) ends the header.
+FLAG_FEC = 0x1C00 #Error correction scheme of the payload (see fec), shifted by FLAG_FEC_SHIFT.
+FLAG_FEC_SHIFT = 10
+KNOWN_FLAGS = FLAG_BITS_PER_CHANNEL | FLAG_COMPRESSION | FLAG_CHUNK | FLAG_MODE | FLAG_BITS_PER_CHANNEL_HIGH | FLAG_CRC | FLAG_FEC
+MAX_BITS_PER_CHANNEL = 4
+MAX_BITS_PER_CHANNEL_16 = 8 #16 bit carriers have twice the depth.
+
+#Modes embedded without converting to RGB when native=True, with the code stored in the header.
+#RGB is 0, like the images converted to RGB.
+NATIVE_MODES = {"RGB": 0, "RGBA": 1, "L": 2, "LA": 3, "I;16": 4}
+
+class Cancelled(Exception):
+    """
+    Raised by a progress callback to stop an encoding or decoding. The image passed in is left untouched.
     """
-    Embed a message on LSB of the image. 
 
-    Parameters: 
-            Image(Image.Image): The input image.
+def _payload_chunks(length: int, bits_per_channel: int = 1):
+    """
+    Split a payload of length bytes in (start, stop) byte ranges of PROGRESS_CHUNK_CHANNELS channels each,
+    so every range starts on a channel boundary.
+    """
 
-            txt(str): The text we want to include in UTF-8 encoding. The length of the text must not be larger than the HxWx3.
+    step = PROGRESS_CHUNK_CHANNELS * bits_per_channel // 8
+    return [(i, min(i + step, length)) for i in range(0, length, step)] or [(0, 0)]
 
-    
+def _embed_bits(pixels: np.ndarray, bits: np.ndarray, start: int = 0, bits_per_channel: int = 1, stats: dict = None, order: np.ndarray = None) -> None:
+    """
+    Write a sequence of bits in the LSBs of the pixel array, in place.
 
-    Returns: 
-        Image(Image.Image): The new image with the encoded message.
+    The channels are visited in raster order (row by row, then R, G, B), which is the
+    same order of the original per-pixel loop, so the output is bit-identical.
 
-        The lenght of the text cannot be larger than three times the pixels in the image.
+    Parameters:
+            pixels(np.ndarray): The uint8 (or uint16) array of the image. It is modified in place.
+
+            bits(np.ndarray): A uint8 array of 0s and 1s.
+
+            start(int): The index of the first channel (in raster order) to write.
+
+            bits_per_channel(int): How many LSBs of every channel hold the payload (1 to 4, 8 for 16 bit). The bits
+                of a channel are taken most significant first. The last channel is padded with zeros.
+
+            stats(dict): If given, "changed_channels" and "sse" (sum of the squared differences) are increased
+                by the channels this call modifies.
+
+            order(np.ndarray): If given, the channels are visited in this order (positions in the flattened array,
+                see scatter.positions) instead of raster order, and start is an index in it.
+    """
+
+    #reshape returns a view when the array is contiguous (always true for np.array(img)),
+    # so writing on flat writes on pixels.
+    flat = pixels.reshape(-1)
+    k = bits_per_channel
+
+    if k == 1:
+        values = bits
+    else:
+        #Group the bits k by k and turn every group in the integer written in the channel.
+        padded = np.zeros(-(-len(bits) // k) * k, dtype=np.uint8)
+        padded[:len(bits)] = bits
+        #packbits puts the k bits in the most significant positions of a byte, the shift brings them down.
+        values = np.packbits(padded.reshape(-1, k), axis=1)[:, 0] >> (8 - k)
+    stop = start + len(values)
+    where = slice(start, stop) if order is None else order[start:stop]
+
+    #With k=1, 254 is 11111110, so the bitwise AND clears the LSB, the OR then sets it to the payload bit.
+    #Only the prefix holding the message is touched, the rest of the image is left as it is.
+    #The mask has the width of the channels: 8 bits, or 16 bits for I;16 carriers.
+    mask = flat.dtype.type(np.iinfo(flat.dtype).max ^ ((1 << k) - 1))
+    old = flat[where]
+    new = (old & mask) | values.astype(flat.dtype)
+    if stats is not None:
+        #Only the written channels can differ, so the distortion is known without looking at the rest of the image.
+        diff = new.astype(np.int64) - old
+        stats["changed_channels"] += int(np.count_nonzero(diff))
+        stats["sse"] += int(np.dot(diff, diff))
+    flat[where] = new
+
+def _read_bits(pixels: np.ndarray, start: int, count: int, bits_per_channel: int = 1, order: np.ndarray = None) -> np.ndarray:
+    """
+    Read count bits from the LSBs of the pixel array, starting from the start-th channel (of order, if given).
+    """
+
+    flat = pixels.reshape(-1)
+    k = bits_per_channel
+    stop = start + -(-count // k)
+    channels = flat[start:stop] if order is None else flat[order[start:stop]]
+    if k == 1:
+        return (channels & 1).astype(np.uint8)
+    if channels.dtype == np.uint8:
+        #unpackbits gives the 8 bits of every channel, the last k are the payload ones.
+        return np.unpackbits(channels[:, None], axis=1)[:, 8 - k:].reshape(-1)[:count]
+    shifts = np.arange(k - 1, -1, -1, dtype=channels.dtype)
+    return ((channels[:, None] >> shifts) & 1).astype(np.uint8).reshape(-1)[:count]
+
+def _read_until_nul(pixels: np.ndarray, chunk_bytes: int = DECODE_CHUNK_BYTES, progress=None) -> bytes:
+    """
+    Read bytes from the LSBs of the pixel array until the terminating byte (b'\\x00') is found.
+
+    The LSBs are packed in chunks of chunk_bytes bytes, so the cost depends on the length of
+    the message and not on the size of the image.
+
+    Parameters:
+            pixels(np.ndarray): The pixel array of the image.
+
+            chunk_bytes(int): How many bytes are packed and searched at every step.
+
+            progress(callable): If given, called as progress("extract", bytes_read, bytes_of_the_image) after every step
+                and once more with bytes_read=bytes_of_the_image at the end.
+
+    Returns:
+        bytes: The message without the terminating byte. If no terminator is found, every complete byte of the image.
+    """
+
+    flat = pixels.reshape(-1)
+    total_bytes = len(flat) // 8 #An incomplete byte at the end of the image is dropped.
+
+    decoded = [] #list of the decoded chunks
+    for start in range(0, total_bytes, chunk_bytes):
+        stop = min(start + chunk_bytes, total_bytes)
+        #packbits builds the bytes from the LSBs, most significant bit first.
+        chunk = np.packbits(flat[start * 8:stop * 8] & 1)
+        terminator = np.flatnonzero(chunk == 0)
+        if len(terminator):
+            decoded.append(chunk[:terminator[0]].tobytes())
+            break
+        decoded.append(chunk.tobytes())
+        if progress is not None:
+            progress("extract", stop, total_bytes)
+    if progress is not None:
+        progress("extract", total_bytes, total_bytes) #Done, the rest of the image is not read.
+
+    return b"".join(decoded)
+
+def _varint(n: int) -> bytes:
+    """
+    Encode a non negative integer as a varint (LEB128): 7 bits per byte, the MSB tells if another byte follows.
+    """
+
+    if n < 0:
+        raise ValueError("A varint cannot be negative.")
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _read_varint(buf: bytes, pos: int) -> tuple:
+    """
+    Decode a varint from buf starting at pos.
+
+    Returns:
+        (value, pos): The integer and the position of the first byte after it.
+    """
+
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(buf) or shift > 63:
+            raise ValueError("Truncated or corrupted header: invalid varint.")
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+def _make_flags(bits_per_channel: int = 1, codec: int = 0, mode_code: int = 0, fec: int = 0) -> int:
+    """
+    Build the header flags (without FLAG_CHUNK, which _pack_header adds).
+    """
 
+    k = bits_per_channel - 1
+    flags = (k & FLAG_BITS_PER_CHANNEL) | (codec << FLAG_COMPRESSION_SHIFT) | (mode_code << FLAG_MODE_SHIFT) | (fec << FLAG_FEC_SHIFT)
+    if k > FLAG_BITS_PER_CHANNEL:
+        flags |= FLAG_BITS_PER_CHANNEL_HIGH
+    return flags
+
+def _flags_bits_per_channel(flags: int) -> int:
+    """
+    Read bits_per_channel back from the header flags.
+    """
+
+    return (flags & FLAG_BITS_PER_CHANNEL) + (4 if flags & FLAG_BITS_PER_CHANNEL_HIGH else 0) + 1
+
+def _max_bits_per_channel(dtype) -> int:
+    return MAX_BITS_PER_CHANNEL_16 if np.dtype(dtype).itemsize == 2 else MAX_BITS_PER_CHANNEL
+
+def _pack_header(length: int, flags: int = 0, chunk: tuple = None, crc: int = None) -> bytes:
+    """
+    Build the payload header: MAGIC, VERSION, flags and payload length in bytes,
+    followed by the chunk index and count if chunk=(index, count) is given, and by the CRC-32 if crc is given.
+    """
+
+    flags |= (FLAG_CHUNK if chunk else 0) | (FLAG_CRC if crc is not None else 0)
+    header = MAGIC + bytes([VERSION]) + _varint(flags) + _varint(length)
+    if chunk:
+        index, count = chunk
+        header += _varint(index) + _varint(count)
+    if crc is not None:
+        header += crc.to_bytes(CRC_BYTES, "big")
+    return header
+
+def _parse_header(buf: bytes):
+    """
+    Parse a header from the first bytes read from the image.
+
+    Returns:
+        None if buf does not start with MAGIC (legacy NUL terminated image), otherwise
+        (flags, length, header_size, chunk, crc), where chunk is (index, count) or None and crc is the CRC-32
+        of the payload or None.
+    """
+
+    if buf[:len(MAGIC)] != MAGIC:
+        return None
+    if len(buf) <= len(MAGIC):
+        raise ValueError("Truncated header.")
+    version = buf[len(MAGIC)]
+    if version != VERSION:
+        raise ValueError(f"Unsupported header version {version}.")
+    flags, pos = _read_varint(buf, len(MAGIC) + 1)
+    if flags & ~KNOWN_FLAGS:
+        raise ValueError(f"Unsupported header flags {flags:#x}.")
+    length, pos = _read_varint(buf, pos)
+    chunk = None
+    if flags & FLAG_CHUNK:
+        index, pos = _read_varint(buf, pos)
+        count, pos = _read_varint(buf, pos)
+        if index >= count:
+            raise ValueError(f"Corrupted header: chunk {index} of {count}.")
+        chunk = (index, count)
+    crc = None
+    if flags & FLAG_CRC:
+        if pos + CRC_BYTES > len(buf):
+            raise ValueError("Truncated header: missing checksum.")
+        crc = int.from_bytes(buf[pos:pos + CRC_BYTES], "big")
+        pos += CRC_BYTES
+    return flags, length, pos, chunk, crc
+
+def _read_bytes(pixels: np.ndarray, start: int, count: int, bits_per_channel: int = 1, order: np.ndarray = None) -> bytes:
+    """
+    Read count bytes from the LSBs of the pixel array, starting from the start-th channel (of order, if given).
+    """
+
+    return np.packbits(_read_bits(pixels, start, count * 8, bits_per_channel, order)).tobytes()
+
+def _as_byte_array(data) -> np.ndarray:
+    """
+    Wrap a bytes-like object (bytes, bytearray, memoryview, array.array, NumPy array...) in a uint8 array.
+
+    The array is a view on the same memory, no copy of the payload is made.
+    """
+
+    try:
+        view = memoryview(data)
+    except TypeError:
+        raise TypeError(f"The payload must be a bytes-like object, not {type(data).__name__}.")
+    if not view.c_contiguous:
+        raise ValueError("The payload buffer must be contiguous.")
+    if view.format != 'B' or view.ndim != 1:
+        view = view.cast('B') #cast only changes how the memory is seen.
+    return np.frombuffer(view, dtype=np.uint8)
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    """
+    Return the image in RGB mode, converting it if needed.
     """
 
-    #check if img is RGB
     try:
         if img.mode != "RGB":
             img = img.convert("RGB")
     except:
         raise ValueError("The Image is not in RGB format nor it can be converted. Please use another image.")
+    return img
 
-    #Transforms the pixel in a matrix containing 3-vector values.
-    pixels = np.array(img)
-    height, width, _ = pixels.shape
+def _embed_payload(pixels: np.ndarray, data, header: bool = True, bits_per_channel: int = 1, stats: dict = None, key=None, compression: str = None, chunk: tuple = None, mode_code: int = 0, progress=None, checksum: bool = False, fec: str = None) -> None:
+    """
+    Embed a payload in the LSBs of a pixel array, in place.
 
-    #Encode message in bytes
-    txt_bin = txt.encode('utf-8') + b'\x00' #Terminating bit
+    Only the channels holding the payload are read and written, so it works on np.memmap arrays
+    without loading the rest of the image. See encode_bytes for the parameters.
 
-    #The code is already converted (internally, we'll se a list of byte),
-    # but to represent them in a sequence of bits (and not int) we need to convert them in a binary string.
-    txt_bits = "".join(f'{byte:08b}' for byte in txt_bin) #byte:08b ensures each type is represented in exactly 8 bits.
+    chunk=(index, count, codec) embeds one chunk of a payload split over several images (see frames):
+    data is the chunk as it is, and codec is the compression of the whole payload, recorded in the flags.
+    mode_code is the NATIVE_MODES code of the carrier, recorded in the flags.
+    checksum=True stores the CRC-32 of the (compressed) payload in the header, computed before the error correction.
+    progress is called as in encode_bytes; when it raises, the pixels may be partially written.
+    """
 
-    #Preliminary check to see if the message can be contained in the image
-    if len(txt_bits) > height * width * 3:
+    max_bits = _max_bits_per_channel(pixels.dtype)
+    if not 1 <= bits_per_channel <= max_bits:
+        raise ValueError(f"bits_per_channel must be between 1 and {max_bits}.")
+    if bits_per_channel > 1 and not header:
+        raise ValueError("bits_per_channel larger than 1 is stored in the header, use header=True.")
+    if key is not None and not header:
+        raise ValueError("The keyed mode needs the header, use header=True.")
+    if compression is not None and not header:
+        raise ValueError("The compression codec is stored in the header, use header=True.")
+    if checksum and not header:
+        raise ValueError("The checksum is stored in the header, use header=True.")
+    fec_code = _fec.scheme(fec)
+    if fec_code and not header:
+        raise ValueError("The error correction scheme is stored in the header, use header=True.")
+
+    if chunk is None:
+        data = _as_byte_array(data) #Checked first, so a str payload gets the TypeError of _as_byte_array.
+        with tracing.span("compress", bytes=data.nbytes) if compression is not None else tracing.NULL_SPAN:
+            codec, data = _compression.choose(data, compression)
+        if compression is not None and progress is not None:
+            progress("compress", 1, 1)
+    else:
+        if not header or compression is not None:
+            raise ValueError("Chunks are compressed as a whole and need the header.")
+        *chunk, codec = chunk
+    payload = _as_byte_array(data)
+    if header:
+        flags = _make_flags(bits_per_channel, codec, mode_code, fec_code)
+        crc = zlib.crc32(payload) if checksum else None
+        #Compression first (it removes redundancy), then the error correction adds its own.
+        if fec_code:
+            with tracing.span("fec", bytes=len(payload)):
+                payload = _fec.encode(payload, fec_code)
+        prefix = np.frombuffer(_pack_header(len(payload), flags, chunk, crc), dtype=np.uint8)
+        suffix_bits = 0
+    else:
+        if np.any(payload == 0):
+            raise ValueError("The payload contains a NUL byte, which would terminate it early. Use header=True.")
+        if payload[:len(MAGIC)].tobytes() == MAGIC:
+            raise ValueError("The payload starts with the header MAGIC and would be decoded as a header. Use header=True.")
+        prefix = np.empty(0, dtype=np.uint8)
+        suffix_bits = 8 #Terminating byte
+
+    #Preliminary check to see if the message can be contained in the image.
+    #The header takes one channel per bit, the payload one channel every bits_per_channel bits.
+    payload_start = len(prefix) * 8
+    payload_channels = -(-(len(payload) * 8 + suffix_bits) // bits_per_channel)
+    if payload_start + payload_channels > pixels.size:
         raise ValueError("The image is too small to contain the message in the UTF Encoding. Choose another image or make this one larger.")
 
-    #Counter of how many bit we parsed
-    bit_count = 0
-    for h in range(height):
-        if bit_count >= len(txt_bits):
+    if stats is not None:
+        stats.update(compression=_compression.NAMES.get(codec), fec=_fec.NAMES.get(fec_code), stored_bytes=len(payload))
+        stats.update(channels=pixels.size, payload_channels=payload_start + payload_channels,
+                     changed_channels=0, sse=0, max_value=int(np.iinfo(pixels.dtype).max))
+
+    with tracing.span("embed", bytes=len(prefix) + len(payload), channels=payload_start + payload_channels):
+        #With a key the channels are visited in the keyed order, only the positions needed are generated.
+        order = None if key is None else scatter.positions(pixels.shape, key, payload_start + payload_channels)
+
+        #unpackbits turns every byte in its 8 bits, most significant first (same order as f'{byte:08b}').
+        #The header and the payload are written one after the other, so the payload is never concatenated (copied).
+        #The payload is unpacked and written in chunks: the bits take 8 times the payload, only one chunk of them is in memory.
+        _embed_bits(pixels, np.unpackbits(prefix), stats=stats, order=order)
+        for first, last in _payload_chunks(len(payload), bits_per_channel):
+            if progress is not None:
+                progress("embed", first, len(payload))
+            _embed_bits(pixels, np.unpackbits(payload[first:last]), start=payload_start + first * 8 // bits_per_channel,
+                        bits_per_channel=bits_per_channel, stats=stats, order=order)
+        if suffix_bits:
+            _embed_bits(pixels, np.zeros(suffix_bits, dtype=np.uint8), start=payload_start + len(payload) * 8, stats=stats)
+    if progress is not None:
+        progress("embed", len(payload), len(payload))
+
+def _extract_payload(pixels: np.ndarray, key=None, info: dict = None, mode_code: int = 0, progress=None) -> bytes:
+    """
+    Read the payload from the LSBs of a pixel array, touching only the channels that hold it.
+    See decode_bytes.
+
+    If the image holds a chunk (see frames), the chunk is returned as it is (not decompressed), and info,
+    if given, is filled with "chunk_index", "chunk_count" and "codec".
+    Payloads with error correction are corrected; info, if given, gets the number of "corrected_errors" (bits).
+    Payloads with a checksum are verified, a mismatch raises ValueError.
+    mode_code is the NATIVE_MODES code of the pixels, it must match the one in the header.
+    progress is called as in decode_bytes.
+    """
+
+    total_bytes = pixels.size // 8
+    header_bytes = min(HEADER_MAX_BYTES, total_bytes)
+    with tracing.span("extract") as s:
+        order = None if key is None else scatter.positions(pixels.shape, key, header_bytes * 8)
+
+        #Images with a header are recognised by MAGIC, otherwise we fall back to the NUL terminated format.
+        parsed = _parse_header(_read_bytes(pixels, 0, header_bytes, order=order))
+        if parsed is None:
+            if key is not None:
+                raise ValueError("No payload found with this key.")
+            payload = _read_until_nul(pixels, progress=progress)
+            s.add(bytes=len(payload))
+            return payload
+
+        flags, length, header_size, chunk, crc = parsed
+        header_mode = (flags & FLAG_MODE) >> FLAG_MODE_SHIFT
+        if header_mode != mode_code:
+            modes = {v: k for k, v in NATIVE_MODES.items()}
+            raise ValueError(f"The payload was embedded in a {modes.get(header_mode, header_mode)} carrier, "
+                             f"the image is read as {modes.get(mode_code, mode_code)}.")
+        bits_per_channel = _flags_bits_per_channel(flags)
+        payload_start = header_size * 8
+        needed = payload_start + -(-length * 8 // bits_per_channel)
+        if needed > pixels.size:
+            raise ValueError("Corrupted header: the declared message is larger than the image.")
+        if key is not None:
+            order = scatter.positions(pixels.shape, key, needed)
+        parts = []
+        for first, last in _payload_chunks(length, bits_per_channel):
+            if progress is not None:
+                progress("extract", first, length)
+            parts.append(_read_bytes(pixels, payload_start + first * 8 // bits_per_channel, last - first, bits_per_channel, order))
+        payload = b"".join(parts)
+        s.add(bytes=header_size + length, channels=needed)
+    if progress is not None:
+        progress("extract", length, length)
+    fec_code = (flags & FLAG_FEC) >> FLAG_FEC_SHIFT
+    if fec_code:
+        if fec_code not in _fec.NAMES:
+            raise ValueError(f"Unsupported error correction scheme {fec_code}.")
+        with tracing.span("fec", bytes=len(payload)):
+            payload, corrected = _fec.decode(np.frombuffer(payload, dtype=np.uint8), fec_code)
+            payload = payload.tobytes()
+        if info is not None:
+            info["corrected_errors"] = corrected
+    if crc is not None and zlib.crc32(payload) != crc:
+        raise ValueError("Checksum mismatch: the payload is corrupted.")
+
+    codec = (flags & FLAG_COMPRESSION) >> FLAG_COMPRESSION_SHIFT
+    if chunk is not None:
+        if info is not None:
+            info.update(chunk_index=chunk[0], chunk_count=chunk[1], codec=codec)
+        return payload
+    if codec:
+        with tracing.span("decompress", bytes=len(payload)):
+            payload = _compression.decompress(payload, codec)
+        if progress is not None:
+            progress("decompress", 1, 1)
+    return payload
+
+def _header_mode_code(pixels: np.ndarray, key=None):
+    """
+    Return the mode code stored in the header of the pixels, or None if they don't start with a valid header.
+    """
+
+    header_bytes = min(HEADER_MAX_BYTES, pixels.size // 8)
+    order = None if key is None else scatter.positions(pixels.shape, key, header_bytes * 8)
+    try:
+        parsed = _parse_header(_read_bytes(pixels, 0, header_bytes, order=order))
+    except ValueError:
+        return None
+    if parsed is None:
+        return None
+    return (parsed[0] & FLAG_MODE) >> FLAG_MODE_SHIFT
+
+def _capacity_bytes(channels: int, bits_per_channel: int = 1, header: bool = True, extra_header_bytes: int = 0, mode_code: int = 0, checksum: bool = False, fec: int = 0) -> int:
+    """
+    Exact number of payload bytes that fit in an image with the given number of channels.
+    It mirrors the check of _embed_payload. extra_header_bytes are reserved for the chunk fields.
+    fec is a scheme id of fec: the capacity is the payload before the error correction.
+    """
+
+    channels -= (extra_header_bytes + (CRC_BYTES if checksum else 0)) * 8
+
+    if not header:
+        return max(channels // 8 - 1, 0) #One byte is the terminator.
+
+    k = bits_per_channel
+    base_bits = (len(MAGIC) + 1 + len(_varint(_make_flags(k, mode_code=mode_code, fec=fec) | (FLAG_CRC if checksum else 0)))) * 8
+    best = 0
+    #The header grows with the varint of the length: try every varint size and keep the lengths it can encode.
+    for varint_bytes in range(1, 11):
+        free_channels = channels - base_bits - varint_bytes * 8
+        if free_channels <= 0:
             break
-        for w in range(width):
-            if bit_count >= len(txt_bits):
-                break
-            else:
-                #extract the channel.
-                rd, gr, bl = pixels[h, w]
-                if bit_count < len(txt_bits):
-
-                    #254 is 11111110, so the bitwise AND clears and set the LSB to 0
-                    #txt_bits[bit_count] returns the i-th bit, the OR operation then will be between
-                    # original pixel channel OR original bit (00000001 or 00000000), if the i-th bit is zero,
-                    # then the code will start to make them appear.
-                    
-                    rd= (rd & 254) | int(txt_bits[bit_count]) 
-                    bit_count += 1
-                if bit_count < len(txt_bits):
-                    gr = (gr & 254) | int(txt_bits[bit_count])
-                    bit_count += 1
-                if bit_count < len(txt_bits):
-                    bl = (bl & 254) | int(txt_bits[bit_count])
-                    bit_count += 1
-
-                pixels[h,w] = (rd,gr,bl)
-
-    new_img = Image.fromarray(pixels, "RGB") #Recreate the new image
+        low = 0 if varint_bytes == 1 else 1 << (7 * (varint_bytes - 1))
+        high = (1 << (7 * varint_bytes)) - 1
+        n = min(free_channels * k // 8, high)
+        if n >= low:
+            best = max(best, n)
+    return _fec.decoded_size(best, fec)
+
+def _image_info(img_or_path):
+    """
+    Return ((width, height), mode) of an image or of an image file. Files are opened lazily: only the header is read.
+    """
+
+    if isinstance(img_or_path, Image.Image):
+        return img_or_path.size, img_or_path.mode
+    with Image.open(img_or_path) as im:
+        return im.size, im.mode
+
+def capacity(img_or_path, bits_per_channel: int = 1, header: bool = True, native: bool = False, checksum: bool = False, fec: str = None) -> int:
+    """
+    Return how many payload bytes can be embedded in an image, without decoding its pixels.
+
+    Parameters:
+            img_or_path(Image.Image, str or file): The carrier. Files are opened lazily, only their header is read.
+
+            bits_per_channel(int): As in encode_bytes (1 to 4, up to 8 for native 16 bit carriers).
+
+            header(bool): As in encode_bytes. The legacy format reserves one byte for the terminator.
+
+            native(bool): As in encode_bytes: count the channels of the mode of the image (alpha included)
+                instead of the three RGB channels.
+
+            checksum(bool): As in encode_bytes, the checksum takes 4 bytes of the header.
+
+            fec(str): As in encode_bytes, the capacity is then the payload before the error correction.
+
+    Returns:
+        int: The exact capacity in bytes (0 if not even the header fits).
+    """
+
+    (width, height), mode = _image_info(img_or_path)
+    if native and mode in NATIVE_MODES:
+        bands = Image.getmodebands(mode)
+        max_bits = MAX_BITS_PER_CHANNEL_16 if mode == "I;16" else MAX_BITS_PER_CHANNEL
+        mode_code = NATIVE_MODES[mode]
+    else:
+        bands, max_bits, mode_code = 3, MAX_BITS_PER_CHANNEL, 0
+    if not 1 <= bits_per_channel <= max_bits:
+        raise ValueError(f"bits_per_channel must be between 1 and {max_bits}.")
+    return _capacity_bytes(width * height * bands, bits_per_channel, header, mode_code=mode_code, checksum=checksum, fec=_fec.scheme(fec))
+
+def can_fit(img_or_path, payload, bits_per_channel: int = 1, header: bool = True, compression: str = None, native: bool = False, checksum: bool = False, fec: str = None) -> bool:
+    """
+    Check if a payload (bytes-like, or str encoded in UTF-8) fits in an image, without decoding its pixels.
+    Only the size is checked: in the legacy format (header=False) the payload must also not contain NUL bytes.
+    With compression, the payload is compressed as encode_bytes would do and the compressed size is checked.
+    """
+
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    if compression is not None:
+        _, payload = _compression.choose(payload, compression)
+    return memoryview(payload).nbytes <= capacity(img_or_path, bits_per_channel, header, native, checksum, fec)
+
+def encode_bytes(img: Image.Image, data, header: bool = True, bits_per_channel: int = 1, stats: dict = None, key=None, compression: str = None, native: bool = False, progress=None, checksum: bool = False, fec: str = None) -> Image.Image:
+    """
+    Embed a binary payload on LSB of the image.
+
+    Parameters:
+            Image(Image.Image): The input image.
+
+            data(bytes-like): The payload. Any object supporting the buffer protocol (bytes, bytearray, memoryview...)
+                is accepted and read without copies.
+
+            header(bool): If True (default), the payload is preceded by the versioned header and it may contain any byte.
+                If False, the payload is terminated by b'\\x00' (legacy format), so it cannot contain NUL bytes.
+
+            bits_per_channel(int): How many LSBs of every channel carry the payload, from 1 (default) to 4.
+                The capacity grows linearly, but so does the distortion (see PSNR). It is recorded in the header,
+                so values larger than 1 require header=True.
+
+            stats(dict): If given, it is filled with the distortion of the embedding: "channels", "payload_channels",
+                "changed_channels", "sse" (sum of squared differences) and "max_value". metrics.psnr_from_stats turns
+                it in the PSNR without comparing the two images.
+
+            key(str, bytes or int): If given, the header and the payload are scattered over the whole image in a
+                pseudo-random order derived from the key, instead of filling the first rows. The same key is needed
+                to decode. It requires header=True.
+
+            compression(str): Compress the payload before embedding it: "zlib", "lzma", "zstd" (needs the zstandard
+                package) or "auto" (a fast codec, kept only when it saves enough). The codec is stored in the header,
+                decode_bytes expands the payload automatically. It requires header=True.
+
+            native(bool): If True, RGBA, L, LA and I;16 images are embedded as they are, using all their channels
+                (alpha included) and, for 16 bit images, up to 8 bits per channel. The image is not converted to RGB
+                and the output keeps its mode. The mode is recorded in the header. It requires header=True.
+                Other modes are still converted to RGB.
+
+            progress(callable): If given, called as progress(phase, done, total) while the payload is embedded:
+                "compress" (once, with compression) and "embed" (done and total in payload bytes, every
+                PROGRESS_CHUNK_CHANNELS channels). Raise Cancelled from it to stop; the input image is not modified.
+
+            checksum(bool): Store the CRC-32 of the payload in the header (4 more bytes). decode_bytes then
+                raises ValueError if the payload read back does not match. It requires header=True.
+
+            fec(str): Add error correction to the (compressed) payload, so a few flipped LSBs are corrected when
+                decoding: "hamming" (Hamming(7,4), 1.75x the size, one flipped bit in every 7 corrected) or
+                "repeat3", "repeat5", "repeat7" (the payload stored 3, 5 or 7 times, majority vote). The scheme is
+                stored in the header (which itself is not protected). It requires header=True.
+
+    Returns:
+        Image(Image.Image): The new image with the encoded payload.
+    """
+
+    n_pixels = img.width * img.height
+    if tracing.enabled():
+        #Decode the file now, otherwise its time would be counted in the conversion.
+        with tracing.span("load", pixels=n_pixels):
+            img.load()
+    if native and img.mode in NATIVE_MODES and img.mode != "RGB":
+        if not header:
+            raise ValueError("The native mode is stored in the header, use header=True.")
+        with tracing.span("array", pixels=n_pixels):
+            pixels = np.array(img)
+        _embed_payload(pixels, data, bits_per_channel=bits_per_channel, stats=stats, key=key, compression=compression,
+                       mode_code=NATIVE_MODES[img.mode], progress=progress, checksum=checksum, fec=fec)
+        with tracing.span("fromarray", pixels=n_pixels):
+            return Image.fromarray(pixels) #The mode follows from the shape and dtype of the array.
+
+    with tracing.span("convert", pixels=n_pixels):
+        img = _to_rgb(img)
+
+    #Transforms the pixel in a matrix containing 3-vector values.
+    with tracing.span("array", pixels=n_pixels):
+        pixels = np.array(img)
+
+    _embed_payload(pixels, data, header=header, bits_per_channel=bits_per_channel, stats=stats, key=key, compression=compression, progress=progress, checksum=checksum, fec=fec)
+
+    with tracing.span("fromarray", pixels=n_pixels):
+        new_img = Image.fromarray(pixels, "RGB") #Recreate the new image
     return new_img
 
-def Decode_Image(img : Image.Image) -> str:
+def decode_bytes(img: Image.Image, key=None, progress=None, info: dict = None) -> bytes:
+    """
+    Decode a binary payload from the LSBs of the image.
+
+    Parameters:
+            Image(Image.Image): The input image.
+
+            key(str, bytes or int): The key used to encode the image, if any.
+
+            progress(callable): If given, called as progress(phase, done, total): "extract" (done and total in bytes)
+                and "decompress" (once, for compressed payloads). Raise Cancelled from it to stop.
+
+            info(dict): If given, it gets "corrected_errors", the bits fixed by the error correction (see encode_bytes fec).
+
+    Returns:
+        bytes: The payload. Images written with the header are recognised by their MAGIC and only the
+        declared length is read (with the bits_per_channel stored in the header), the others are read
+        up to the terminating byte. RGBA, L, LA and I;16 images encoded with native=True are recognised
+        by the mode in their header and read without converting them.
+    """
+
+    n_pixels = img.width * img.height
+    if tracing.enabled():
+        with tracing.span("load", pixels=n_pixels):
+            img.load()
+    if img.mode in NATIVE_MODES and img.mode != "RGB":
+        with tracing.span("array", pixels=n_pixels):
+            pixels = np.array(img)
+        if _header_mode_code(pixels, key) == NATIVE_MODES[img.mode]:
+            return _extract_payload(pixels, key=key, mode_code=NATIVE_MODES[img.mode], progress=progress, info=info)
+
+    with tracing.span("convert", pixels=n_pixels):
+        img = _to_rgb(img)
+
+    with tracing.span("array", pixels=n_pixels):
+        pixels = np.array(img)
+
+    return _extract_payload(pixels, key=key, progress=progress, info=info)
+
+def Encode_Image(img: Image.Image, txt : str, header: bool = False, bits_per_channel: int = 1, key=None, compression: str = None, native: bool = False, progress=None, fec: str = None) -> Image.Image:
+    """
+    Embed a message on LSB of the image. 
+
+    Parameters: 
+            Image(Image.Image): The input image.
+
+            txt(str): The text we want to include in UTF-8 encoding. The length of the text must not be larger than the HxWx3.
+
+            header(bool): If True, the message is preceded by a versioned header with its length instead of
+                being terminated by b'\\x00'. The text may then contain NUL characters, and the decoder reads exactly
+                the bits it needs. Default is False (legacy format).
+
+            bits_per_channel(int): How many LSBs of every channel carry the text (1 to 4). Values larger than 1
+                need header=True.
+
+            key(str, bytes or int): Scatter the text over the image in a keyed pseudo-random order (needs header=True).
+
+            compression(str): Compress the text before embedding it ("zlib", "lzma", "zstd" or "auto", needs header=True).
+
+            native(bool): Embed RGBA, L, LA and I;16 images in their own mode instead of converting them to RGB (needs header=True).
+
+            progress(callable): Called as progress(phase, done, total) while embedding, see encode_bytes. It may raise Cancelled.
+
+            fec(str): Add error correction ("hamming", "repeat3", "repeat5" or "repeat7", needs header=True), see encode_bytes.
+
+    Returns: 
+        Image(Image.Image): The new image with the encoded message.
+
+        The lenght of the text cannot be larger than three times the pixels in the image.
+
+    """
+
+    return encode_bytes(img, txt.encode('utf-8'), header=header, bits_per_channel=bits_per_channel, key=key, compression=compression, native=native, progress=progress, fec=fec)
+
+def Decode_Image(img : Image.Image, key=None, progress=None) -> str:
 
     """
     Decode a text message from the LSBs of the image.
@@ -86,9 +729,16 @@ def Decode_Image(img : Image.Image) -> str:
     Parameters:
             Image(Image.Image): The input image.
 
+            key(str, bytes or int): The key used to encode the image, if any.
+
+            progress(callable): Called as progress(phase, done, total) while decoding, see decode_bytes. It may raise Cancelled.
+
     Returns:
         text: The text from the devised message.
 
+    Both formats are decoded: images written with header=True are recognised by their MAGIC and only the
+    declared length is read, the others are read up to the terminating byte.
+
     Note that it may output valid strings although the image had not been encoded yet.
     Use only with images you can verify have been encoded.
 
@@ -97,67 +747,26 @@ def Decode_Image(img : Image.Image) -> str:
     """
 
     try:
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-    except:
-            raise ValueError("The Image is not in RGB format nor it can be converted. Please use another image.")
-
-        
-
-    pixels = np.array(img)
-    height, width, _ = pixels.shape
-
-
-    text_bits = '' #the bitstring
-
-    for h in range(height):
-        for w in range(width):
-            rd, gr, bl = pixels[h, w]
-            if rd%2 == 0: #If the value is even, the LSB must be 0, if not, add 1
-                text_bits = text_bits + "0"
-            else:
-                text_bits = text_bits + "1"
-            if gr%2 == 0:
-                text_bits = text_bits + "0"
-            else:
-                text_bits = text_bits + "1"
-            if bl%2 == 0:
-                text_bits = text_bits + "0"
-            else:
-                text_bits = text_bits + "1"
-
-    decoded_bytes = [] #UTF stores its characters in bytearray
-    for i in range(0,len(text_bits),8):
-        byte = text_bits[i:i+8]
-        if len(byte) <8:
-            break
-        decoded_byte = int(byte,2) #2 denotes the base of the numerical system, in this case binary
-        if decoded_byte == 0:
-            break
-        decoded_bytes.append(decoded_byte)
-
-    try:
-        message = bytes(decoded_bytes).decode('utf-8')
+        message = decode_bytes(img, key=key, progress=progress).decode('utf-8')
     except UnicodeDecodeError as e:
         raise ValueError(f"Error decoding message. Invalid UTF-8 sequence: {e}")
 
     return message
 
 def PSNR(original_img, new_img):
+    """
+    Compute the Peak Signal to Noise Ratio (in dB) between the original and the encoded image.
 
-    o_pixels = np.array(original_img).astype(np.float64) #Declaring the type of the image made the test pass. Idk why, something with the data types probably. We need to investigate further. 
-    n_pixels = np.array(new_img).astype(np.float64)
-
-    # Compute Mean Squared Error (MSE)
-    mse = np.mean((o_pixels - n_pixels) ** 2)
+    It measures the quality cost of the embedding: with bits_per_channel=k every modified channel can
+    change up to 2^k - 1 levels, so for the same image the PSNR drops as k grows (about 6 dB per extra bit
+    on fully used carriers), while the capacity grows k times.
 
-    if mse == 0:
-        return float('inf')  # No error => infinite PSNR
-    
-    # Max possible pixel value
+    The error is accumulated in integers strip by strip (see metrics.psnr), without float64 copies of the images.
 
-    s = 255.0
+    Returns:
+        float: The PSNR, inf if the images are equal.
+    """
 
-    #PSNR formula
-    psnr = 20 * np.log10(s / np.sqrt(mse))
-    return psnr
+    # Max possible pixel value is 255
+    with tracing.span("psnr"):
+        return psnr(original_img, new_img, max_value=255.0)
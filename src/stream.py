@@ -0,0 +1,159 @@
+## Streaming encoding/decoding for carriers larger than RAM.
+## Uncompressed carriers (binary PPM, .npy, raw RGB) are memory mapped: only the rows holding the payload are
+## read and written, so the memory used depends on the payload and not on the size of the image.
+
+import os
+import shutil
+
+import numpy as np
+
+from .steg import _embed_payload, _extract_payload, _as_byte_array, _capacity_bytes
+
+RAW_EXTENSIONS = (".rgb", ".raw")
+
+
+def _read_ppm_header(f):
+    """
+    Parse the header of a binary PPM (P6) file.
+
+    Returns:
+        (width, height, offset): The size of the image and the position of the first pixel byte.
+    """
+
+    tokens = []
+    while len(tokens) < 4:
+        token = b""
+        while True:
+            c = f.read(1)
+            if not c:
+                raise ValueError("Truncated PPM header.")
+            if c == b"#" and not token: #Comments go on until the end of the line.
+                while c not in (b"\n", b"\r", b""):
+                    c = f.read(1)
+                continue
+            if c.isspace():
+                if token:
+                    break
+                continue
+            token += c
+        tokens.append(token)
+
+    magic, width, height, maxval = tokens
+    if magic != b"P6":
+        raise ValueError("Only binary RGB PPM files (P6) are supported.")
+    if int(maxval) != 255:
+        raise ValueError("Only 8 bit PPM files (maxval 255) are supported.")
+    #Exactly one whitespace separates maxval from the pixels, and it has already been read.
+    return int(width), int(height), f.tell()
+
+
+def open_carrier(path: str, mode: str = "r", shape: tuple = None) -> np.memmap:
+    """
+    Memory map the pixels of an uncompressed carrier as a HxWx3 uint8 array. Nothing is read until it is accessed.
+
+    Parameters:
+            path(str): A binary PPM (.ppm), NumPy (.npy) or raw RGB (.rgb, .raw) file.
+
+            mode(str): "r" to read, "r+" to write in place.
+
+            shape(tuple): (height, width) of raw RGB files, which have no header.
+
+    Returns:
+        np.memmap: The pixels of the image.
+    """
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        pixels = np.load(path, mmap_mode=mode)
+        if pixels.dtype != np.uint8 or pixels.ndim != 3 or pixels.shape[2] != 3:
+            raise ValueError("The .npy carrier must be a HxWx3 uint8 array.")
+        if not pixels.flags.c_contiguous:
+            raise ValueError("The .npy carrier must be stored in C order.")
+        return pixels
+
+    if ext == ".ppm":
+        with open(path, "rb") as f:
+            width, height, offset = _read_ppm_header(f)
+    elif ext in RAW_EXTENSIONS:
+        if shape is None:
+            raise ValueError("Raw RGB carriers have no header: pass shape=(height, width).")
+        height, width = shape
+        offset = 0
+    else:
+        raise ValueError(f"Unsupported streaming carrier '{ext}'. Use .ppm, .npy, .rgb or .raw files.")
+
+    #np.memmap would silently extend a shorter file in "r+" mode (or map garbage past a longer one).
+    expected = offset + height * width * 3
+    size = os.path.getsize(path)
+    if size != expected:
+        raise ValueError(f"{path} holds {size} bytes, a {width}x{height} RGB carrier takes {expected}. Check the shape (height, width).")
+    return np.memmap(path, dtype=np.uint8, mode=mode, offset=offset, shape=(height, width, 3))
+
+
+def encode_file(path: str, data, output_path: str = None, header: bool = True, bits_per_channel: int = 1, shape: tuple = None, key=None, compression: str = None) -> str:
+    """
+    Embed a payload in an uncompressed carrier file without loading it in memory.
+
+    Parameters:
+            path(str): The carrier, see open_carrier.
+
+            data(bytes-like): The payload.
+
+            output_path(str): Where to write the encoded carrier. The file is copied by the OS (without going
+                through Python memory) and then modified in place; it is removed if the encoding fails. If None, path itself
+                is modified.
+
+            header(bool), bits_per_channel(int), key, compression: As in encode_bytes. With a key the payload is scattered,
+                so the pages touched are spread over the whole file.
+
+            shape(tuple): (height, width) of raw RGB files.
+
+    Returns:
+        str: The path of the encoded file.
+    """
+
+    #Checked on the source, so a payload that cannot be embedded never costs a copy of the carrier.
+    source = open_carrier(path, mode="r", shape=shape)
+    channels = source.size
+    del source
+    payload = _as_byte_array(data)
+    if compression is None and payload.nbytes > _capacity_bytes(channels, bits_per_channel, header):
+        raise ValueError("The image is too small to contain the message in the UTF Encoding. Choose another image or make this one larger.")
+
+    copied = output_path is not None and os.path.abspath(output_path) != os.path.abspath(path)
+    if copied:
+        shutil.copyfile(path, output_path)
+    else:
+        output_path = path
+
+    try:
+        pixels = open_carrier(output_path, mode="r+", shape=shape)
+        try:
+            _embed_payload(pixels, payload, header=header, bits_per_channel=bits_per_channel, key=key, compression=compression)
+            pixels.flush()
+        finally:
+            del pixels #Closes the map.
+    except BaseException:
+        if copied:
+            os.remove(output_path) #A carrier left unencoded would look like a successful output.
+        raise
+    return output_path
+
+
+def decode_file(path: str, shape: tuple = None, key=None) -> bytes:
+    """
+    Decode the payload of an uncompressed carrier file, reading only the rows that hold it.
+
+    Parameters:
+            path(str): The carrier, see open_carrier.
+
+            shape(tuple): (height, width) of raw RGB files.
+
+            key: The key used to encode the carrier, if any.
+
+    Returns:
+        bytes: The payload.
+    """
+
+    pixels = open_carrier(path, mode="r", shape=shape)
+    return _extract_payload(pixels, key=key)
@@ -0,0 +1,374 @@
+## Tracing of the phases of the pipeline (PIL decode, conversion, np.array, compression, embedding, extraction,
+## Image.fromarray, PSNR, save...). Every phase runs inside span(name, **counters); when a span ends it is sent to
+## the registered hooks: logging, a Prometheus text file, a cProfile (or pyinstrument) session, or any callable.
+## Without hooks span() returns a shared no-op context, so tracing costs one check per phase when it is off.
+## Nothing heavy is imported here (see core.py).
+
+import contextlib
+import io
+import os
+import threading
+import time
+
+PROMETHEUS_INTERVAL = 10.0 #Minimum seconds between two writes of the Prometheus file.
+
+_hooks = () #Replaced, never modified, so the spans iterate it without the lock.
+_hooks_lock = threading.Lock()
+_collecting = 0 #Active collect() blocks, in every thread: the spans only look at the thread when it is not 0.
+
+
+class _Local(threading.local):
+    collectors = () #The Breakdowns of the collect() blocks of this thread.
+
+_local = _Local()
+
+
+class Span:
+    """
+    One run of a phase. The hooks get it when it ends.
+
+    Attributes:
+            name(str): The phase ("load", "convert", "array", "compress", "fec", "embed", "fromarray", "extract",
+                "decompress", "psnr", "save"...).
+
+            counters(dict): What the phase handled, e.g. "bytes" (payload bytes) and "pixels". See add.
+
+            seconds(float): The duration, set when the span ends.
+
+            failed(bool): True if the phase raised.
+    """
+
+    __slots__ = ("name", "counters", "start", "seconds", "failed")
+
+    def __init__(self, name: str, counters: dict):
+        self.name = name
+        self.counters = counters
+        self.start = self.seconds = None
+        self.failed = False
+
+    def add(self, **counters) -> None:
+        """
+        Add to the counters of the span (e.g. the bytes of a payload known only inside the phase).
+        """
+
+        for counter, value in counters.items():
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def __enter__(self):
+        for hook in _hooks:
+            start = getattr(hook, "start", None)
+            if start is not None:
+                start(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        self.failed = exc_type is not None
+        for hook in _hooks:
+            hook(self)
+        for breakdown in _local.collectors:
+            breakdown(self)
+        return False
+
+
+class _NullSpan:
+    #Returned by span() when nobody listens.
+    __slots__ = ()
+
+    def add(self, **counters) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+
+def span(name: str, **counters):
+    """
+    Context manager timing a phase of the pipeline, with optional counters (bytes=..., pixels=...).
+
+    Usage:
+            with tracing.span("embed", bytes=len(payload)) as s:
+                ...
+                s.add(pixels=width * height)
+
+    Returns:
+        Span, or the shared no-op span when no hook is registered and no collect() is active on this thread.
+    """
+
+    if _hooks or (_collecting and _local.collectors):
+        return Span(name, counters)
+    return NULL_SPAN
+
+
+def enabled() -> bool:
+    """
+    Return True if the spans of this thread are recorded.
+    """
+
+    return bool(_hooks) or bool(_collecting and _local.collectors)
+
+
+def add_hook(hook) -> None:
+    """
+    Register a hook for the spans of every thread.
+
+    A hook is a callable, called with the Span when it ends. If it has a start method, start(span) is called
+    when the span begins (e.g. to start a profiler). Hooks run on the thread of the span.
+    """
+
+    global _hooks
+    with _hooks_lock:
+        _hooks = _hooks + (hook,)
+
+
+def remove_hook(hook) -> None:
+    global _hooks
+    with _hooks_lock:
+        _hooks = tuple(h for h in _hooks if h is not hook)
+
+
+@contextlib.contextmanager
+def hooked(hook):
+    """
+    Register a hook for the duration of a with block. Yields the hook.
+    """
+
+    add_hook(hook)
+    try:
+        yield hook
+    finally:
+        remove_hook(hook)
+
+
+class Breakdown:
+    """
+    Hook adding up the spans of every phase: calls, seconds and counters. It is thread safe.
+
+    phases() returns {phase: {"calls", "seconds", counters...}}, in the order the phases first ran. The command
+    line (--trace) and the GUI report the breakdown of every job in this form.
+    """
+
+    def __init__(self):
+        self._phases = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, span: Span) -> None:
+        self.merge({span.name: dict(span.counters, calls=1, seconds=span.seconds)})
+
+    def merge(self, phases: dict) -> None:
+        """
+        Add a breakdown (the result of phases(), e.g. from another process) to this one.
+        """
+
+        with self._lock:
+            for name, values in phases.items():
+                totals = self._phases.setdefault(name, {"calls": 0, "seconds": 0.0})
+                for counter, value in values.items():
+                    totals[counter] = totals.get(counter, 0) + value
+
+    def phases(self) -> dict:
+        with self._lock:
+            return {name: dict(values) for name, values in self._phases.items()}
+
+
+@contextlib.contextmanager
+def collect():
+    """
+    Record the spans of the current thread only (other threads and the global hooks are not affected),
+    for a per-job breakdown. Yields the Breakdown.
+    """
+
+    global _collecting
+    breakdown = Breakdown()
+    _local.collectors = _local.collectors + (breakdown,)
+    with _hooks_lock:
+        _collecting += 1
+    try:
+        yield breakdown
+    finally:
+        _local.collectors = tuple(b for b in _local.collectors if b is not breakdown)
+        with _hooks_lock:
+            _collecting -= 1
+
+
+def format_breakdown(phases: dict) -> str:
+    """
+    One line summary of a breakdown, e.g. "load 3.2 ms, convert 1.0 ms, embed 12.5 ms".
+    """
+
+    return ", ".join(f"{name} {values['seconds'] * 1000:.1f} ms" for name, values in phases.items())
+
+
+class LoggingHook:
+    """
+    Hook logging every span: phase, duration and counters.
+
+    Parameters:
+            logger(logging.Logger): Where to log (default: the logger of this module).
+
+            level(int): The level of the records (default: logging.DEBUG).
+    """
+
+    def __init__(self, logger=None, level: int = None):
+        import logging #Imported here, it is the slowest import of the module.
+
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.level = logging.DEBUG if level is None else level
+
+    def __call__(self, span: Span) -> None:
+        if self.logger.isEnabledFor(self.level):
+            counters = " ".join(f"{k}={v}" for k, v in span.counters.items())
+            self.logger.log(self.level, "%s %.6f s%s%s", span.name, span.seconds, " " + counters if counters else "",
+                            " (failed)" if span.failed else "")
+
+
+def write_prometheus(phases: dict, path) -> None:
+    """
+    Write a breakdown in the Prometheus text format (for the textfile collector of node_exporter):
+    steg_phase_calls_total, steg_phase_seconds_total and steg_phase_<counter>_total, labelled by phase.
+    The file is replaced atomically, so a scrape never reads it half written.
+    """
+
+    counters = {}
+    for name, values in phases.items():
+        for counter, value in values.items():
+            counters.setdefault(counter, []).append((name, value))
+    lines = []
+    for counter, samples in counters.items():
+        metric = f"steg_phase_{counter}_total"
+        lines.append(f"# HELP {metric} Total {counter} of every phase of the pipeline.")
+        lines.append(f"# TYPE {metric} counter")
+        lines.extend(f'{metric}{{phase="{name}"}} {value}' for name, value in samples)
+    tmp = f"{os.fspath(path)}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+class PrometheusHook(Breakdown):
+    """
+    Hook adding up the spans (see Breakdown) and exporting them to a Prometheus text file, at most every
+    interval seconds and on close().
+
+    Parameters:
+            path(str): The file, e.g. in the textfile directory of node_exporter.
+
+            interval(float): Minimum seconds between two writes.
+    """
+
+    def __init__(self, path, interval: float = PROMETHEUS_INTERVAL):
+        super().__init__()
+        self.path = path
+        self.interval = interval
+        self._written = time.monotonic()
+
+    def __call__(self, span: Span) -> None:
+        super().__call__(span)
+        now = time.monotonic()
+        if now - self._written >= self.interval:
+            self._written = now
+            self.write()
+
+    def write(self) -> None:
+        write_prometheus(self.phases(), self.path)
+
+    def close(self) -> None:
+        self.write()
+
+
+class ProfileHook:
+    """
+    Hook profiling the code run inside the spans, with cProfile or pyinstrument.
+
+    The profiler runs from the start of a span to its end (nested spans are profiled once). Profilers follow one
+    thread: while a thread is profiled, the spans of the other threads are not.
+
+    Parameters:
+            phases(iterable): Only profile these phases (default: every phase).
+
+            profiler(str): "cprofile" (default) or "pyinstrument" (needs the pyinstrument package).
+
+    Usage:
+            with tracing.hooked(ProfileHook(phases=["embed"])) as profile:
+                encode_bytes(img, payload)
+            print(profile.report())
+    """
+
+    def __init__(self, phases=None, profiler: str = "cprofile"):
+        self.phases = None if phases is None else set(phases)
+        self.profiler = profiler
+        if profiler == "cprofile":
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+        elif profiler == "pyinstrument":
+            try:
+                import pyinstrument
+            except ImportError:
+                raise ImportError("The pyinstrument profiler needs the pyinstrument package: 'pip install pyinstrument'.")
+            self._profiler = pyinstrument.Profiler()
+        else:
+            raise ValueError("profiler must be 'cprofile' or 'pyinstrument'.")
+        self._lock = threading.Lock()
+        self._owner = None #Thread being profiled.
+        self._depth = 0
+
+    def start(self, span: Span) -> None:
+        if self.phases is not None and span.name not in self.phases:
+            return
+        thread = threading.get_ident()
+        with self._lock:
+            if self._owner not in (None, thread):
+                return
+            self._owner = thread
+            self._depth += 1
+            if self._depth == 1:
+                if self.profiler == "cprofile":
+                    self._profiler.enable()
+                else:
+                    self._profiler.start()
+
+    def __call__(self, span: Span) -> None:
+        if self.phases is not None and span.name not in self.phases:
+            return
+        with self._lock:
+            if self._owner != threading.get_ident():
+                return
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                if self.profiler == "cprofile":
+                    self._profiler.disable()
+                else:
+                    self._profiler.stop()
+
+    def report(self, limit: int = 30) -> str:
+        """
+        Return the profile as text: the functions with the largest cumulative time for cProfile,
+        the call tree for pyinstrument.
+        """
+
+        if self.profiler == "pyinstrument":
+            return self._profiler.output_text()
+        import pstats
+
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def dump(self, path) -> None:
+        """
+        Save the profile: cProfile stats (for pstats, snakeviz...) or the pyinstrument text report.
+        """
+
+        if self.profiler == "pyinstrument":
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self._profiler.output_text())
+        else:
+            self._profiler.dump_stats(path)
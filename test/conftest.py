@@ -0,0 +1,43 @@
+## Fixtures shared by the tests. pytest loads this file before the tests of the folder.
+
+try:
+    import numpy as np
+    from PIL import Image
+    import pytest
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+@pytest.fixture
+def noise():
+    """
+    Factory of random noise carriers.
+
+    Usage:
+            img = noise(30, 40) #A 40x30 (width x height) RGB image.
+            frames = noise(30, 40, count=4) #Four different images.
+            alpha = noise(30, 40, mode="RGBA", seed=2)
+
+    Parameters:
+            height(int), width(int): The size of the images.
+
+            seed(int): The seed of the generator: the same seed gives the same images.
+
+            mode(str): "RGB", "RGBA", "L" or "LA" (8 bits per channel).
+
+            count(int): None for one image, or the number of images of a list.
+
+    Returns:
+        Image, or a list of count Images.
+    """
+
+    def make(height, width, seed=0, mode="RGB", count=None):
+        rng = np.random.default_rng(seed)
+        images = []
+        for _ in range(1 if count is None else count):
+            pixels = rng.integers(0, 256, size=(height, width, len(mode)), dtype=np.uint8)
+            images.append(Image.fromarray(pixels[..., 0] if len(mode) == 1 else pixels, mode))
+        return images[0] if count is None else images
+
+    return make
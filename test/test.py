@@ -8,8 +8,9 @@ try:
     from PIL import Image
     import pytest
     import math
+    import array
 #We need to import also the functions:
-    from src.steg import Encode_Image,Decode_Image,PSNR  #relative import, use it only if you install the repo as package!
+    from src.steg import Encode_Image,Decode_Image,PSNR, encode_bytes, decode_bytes, capacity, can_fit, Cancelled, _read_until_nul, _extract_payload  #relative import, use it only if you install the repo as package!
 
 except ImportError as e:
     raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
@@ -222,6 +223,324 @@ def test_psnr_opposite_images():
     assert psnr == 0
 
 
+def test_vectorized_encode_matches_loop():
+    """
+    Test that the vectorized encoder writes exactly the same pixels of the original per-channel loop.
+
+    Input: A 17x13 RGB image with random noise (fixed seed).
+    Text: "Ciao, amole. こんにちは"
+
+    The reference writes the bits one channel at a time in raster order, as the first version of Encode_Image did.
+    """
+
+    rng = np.random.default_rng(0)
+    arr = rng.integers(0, 256, size=(13, 17, 3), dtype=np.uint8)
+    img = Image.fromarray(arr, "RGB")
+    message = "Ciao, amole. こんにちは"
+
+    txt_bits = "".join(f'{byte:08b}' for byte in message.encode('utf-8') + b'\x00')
+    expected = arr.copy().reshape(-1)
+    for i, bit in enumerate(txt_bits):
+        expected[i] = (expected[i] & 254) | int(bit)
+
+    encoded_img = Encode_Image(img, message)
+
+    assert np.array_equal(np.array(encoded_img).reshape(-1), expected)
+
+
+def test_chunked_decode_matches_full_scan():
+    """
+    Test that the chunked decoder stops at the same byte of the original full scan of the image.
+
+    Input: 7x5 RGB images with random noise (fixed seeds), plus one with every LSB set to 1 (no terminator).
+
+    The chunks are kept very small (3 bytes) so that the terminator falls in different chunks.
+    """
+
+    def full_scan(arr):
+        text_bits = "".join(str(v & 1) for v in arr.reshape(-1))
+        decoded_bytes = []
+        for i in range(0, len(text_bits), 8):
+            byte = text_bits[i:i+8]
+            if len(byte) < 8:
+                break
+            if int(byte, 2) == 0:
+                break
+            decoded_bytes.append(int(byte, 2))
+        return bytes(decoded_bytes)
+
+    rng = np.random.default_rng(1)
+    arrays = [rng.integers(0, 256, size=(5, 7, 3), dtype=np.uint8) | (rng.random((5, 7, 3)) < 0.9) for _ in range(20)]
+    arrays.append(np.full((5, 7, 3), 255, dtype=np.uint8))
+
+    for arr in arrays:
+        arr = arr.astype(np.uint8)
+        assert _read_until_nul(arr, chunk_bytes=3) == full_scan(arr)
+
+
+def test_header_encode_decode():
+    """
+    Test the encoding with the versioned header, also with a NUL character inside the text.
+
+    Input: A 20x20 white RGB photo.
+    Text: "Ciao,\\x00amole." and "こんにちは世界"
+    """
+
+    img = Image.new("RGB", (20, 20), color="white")
+    for message in ["Ciao,\x00amole.", "こんにちは世界", ""]:
+        encoded_img = Encode_Image(img, message, header=True)
+        assert Decode_Image(encoded_img) == message
+
+def test_header_message_too_large():
+    """
+    Test that the header is counted in the capacity of the image.
+
+    Input: a 4x4 image, 6 bytes of capacity.
+    Text: "Hi", 2 bytes which fit without header but not with it.
+    """
+
+    img = Image.new("RGB", (4, 4), color="white")
+    Encode_Image(img, "Hi")
+    with pytest.raises(ValueError):
+        Encode_Image(img, "Hi", header=True)
+
+def test_header_corrupted_length():
+    """
+    Test that a header declaring more bytes than the image holds raises a ValueError.
+    """
+
+    img = Image.new("RGB", (20, 20), color="white")
+    arr = np.array(Encode_Image(img, "Ciao", header=True))
+    flat = arr.reshape(-1)
+    #The length is the 7th byte of the header (MAGIC, VERSION, flags), set its high bits.
+    flat[6 * 8:6 * 8 + 4] |= 1
+    with pytest.raises(ValueError):
+        Decode_Image(Image.fromarray(arr, "RGB"))
+
+
+def test_encode_decode_bytes_buffers():
+    """
+    Test the binary API with the different buffer types it accepts.
+
+    Input: A 40x40 white RGB photo.
+    Payload: 256 bytes with every value (NUL included), as bytes, bytearray, memoryview and array.array.
+    """
+
+    img = Image.new("RGB", (40, 40), color="white")
+    payload = bytes(range(256))
+
+    for data in [payload, bytearray(payload), memoryview(payload), memoryview(payload)[10:20], array.array('H', payload)]:
+        encoded_img = encode_bytes(img, data)
+        assert decode_bytes(encoded_img) == bytes(data)
+
+def test_encode_bytes_nul_without_header():
+    """
+    Test that a payload with a NUL byte, or starting with MAGIC, is refused in the legacy (NUL terminated) format.
+    """
+
+    img = Image.new("RGB", (20, 20), color="white")
+    with pytest.raises(ValueError):
+        encode_bytes(img, b"Ciao\x00amole", header=False)
+
+    assert decode_bytes(encode_bytes(img, b"Ciao", header=False)) == b"Ciao"
+
+    #A legacy payload starting with MAGIC would be read back as a header.
+    with pytest.raises(ValueError, match="MAGIC"):
+        encode_bytes(img, b"\x89STG binary", header=False)
+    assert decode_bytes(encode_bytes(img, b"\x89STG binary")) == b"\x89STG binary"
+
+
+def test_bits_per_channel_encode_decode():
+    """
+    Test the k-LSB mode for every supported bits_per_channel, on random carriers.
+
+    Input: A 30x30 RGB image with random noise (fixed seed).
+    Payload: random bytes filling most of the capacity of every mode.
+
+    The PSNR must drop as more bits per channel are used.
+    """
+
+    rng = np.random.default_rng(2)
+    img = Image.fromarray(rng.integers(0, 256, size=(30, 30, 3), dtype=np.uint8), "RGB")
+
+    psnrs = []
+    for k in range(1, 5):
+        payload = rng.integers(0, 256, size=(30 * 30 * 3 - 80) * k // 8, dtype=np.uint8).tobytes() #80 channels for the header
+        encoded_img = encode_bytes(img, payload, bits_per_channel=k)
+        assert decode_bytes(encoded_img) == payload
+        psnrs.append(PSNR(img, encoded_img))
+
+    assert psnrs == sorted(psnrs, reverse=True)
+
+def test_bits_per_channel_layout():
+    """
+    Test that with bits_per_channel=2 every channel after the header holds two payload bits, most significant first.
+
+    Input: A 10x10 black RGB image.
+    Payload: b"\\xb4" = 10110100, expected in the channels as 2, 3, 1, 0.
+    """
+
+    img = Image.new("RGB", (10, 10), color="black")
+    flat = np.array(encode_bytes(img, b"\xb4", bits_per_channel=2)).reshape(-1)
+    header_bits = 7 * 8 #MAGIC, VERSION, flags, length
+
+    assert list(flat[header_bits:header_bits + 4]) == [2, 3, 1, 0]
+
+def test_bits_per_channel_invalid():
+    """
+    Test that bits_per_channel outside 1-4, or larger than 1 without header, raises a ValueError.
+    """
+
+    img = Image.new("RGB", (20, 20), color="white")
+    with pytest.raises(ValueError):
+        encode_bytes(img, b"Ciao", bits_per_channel=5)
+    with pytest.raises(ValueError):
+        Encode_Image(img, "Ciao", bits_per_channel=2)
+    assert Decode_Image(Encode_Image(img, "Ciao", header=True, bits_per_channel=3)) == "Ciao"
+
+
+def test_capacity_matches_encoder():
+    """
+    Test that capacity is exact: a payload of capacity bytes is embedded, one more byte is refused.
+
+    Input: RGB images from 1x1 to 300x300, with and without header, for every bits_per_channel.
+    """
+
+    for side in [1, 4, 10, 37, 300]:
+        img = Image.new("RGB", (side, side), color="white")
+        for header, k in [(False, 1), (True, 1), (True, 2), (True, 3), (True, 4)]:
+            n = capacity(img, bits_per_channel=k, header=header)
+            if n:
+                assert decode_bytes(encode_bytes(img, b"a" * n, header=header, bits_per_channel=k)) == b"a" * n
+            assert can_fit(img, b"a" * n, bits_per_channel=k, header=header)
+            assert not can_fit(img, b"a" * (n + 1), bits_per_channel=k, header=header)
+            with pytest.raises(ValueError):
+                encode_bytes(img, b"a" * (n + 1), header=header, bits_per_channel=k)
+
+def test_capacity_from_path(tmp_path):
+    """
+    Test capacity from a file path, which only reads the header of the file.
+
+    Input: A 4x4 PNG file, (4*4*3)//8 - 1 = 5 bytes in the legacy format.
+    """
+
+    path = tmp_path / "small.png"
+    Image.new("RGB", (4, 4), color="white").save(path)
+    assert capacity(str(path), header=False) == 5
+    assert can_fit(str(path), "Honey", header=False)
+    assert not can_fit(str(path), "Honey!", header=False)
+
+def test_native_modes_encode_decode():
+    """
+    Test the native carriers: the image keeps its mode, the alpha channel holds payload too, and the
+    capacity counts the channels of the mode.
+
+    Input: 30x30 RGBA, LA, L and I;16 images, filled to their native capacity.
+    """
+
+    rng = np.random.default_rng(16)
+    for mode in ["RGBA", "LA", "L", "I;16"]:
+        if mode == "I;16":
+            img = Image.fromarray(rng.integers(0, 65536, (30, 30), dtype=np.uint16))
+        else:
+            img = Image.new(mode, (30, 30), color=(200,) * Image.getmodebands(mode))
+        n = capacity(img, native=True)
+        payload = rng.integers(0, 256, n, dtype=np.uint8).tobytes()
+        encoded = encode_bytes(img, payload, native=True)
+        assert encoded.mode == mode
+        assert decode_bytes(encoded) == payload
+        assert decode_bytes(encode_bytes(img, b"Honey", native=True, key="k"), key="k") == b"Honey"
+        with pytest.raises(ValueError):
+            encode_bytes(img, payload + b"!", native=True)
+    rgba = Image.new("RGBA", (30, 30), color=(200, 200, 200, 255))
+    assert capacity(rgba, native=True) > capacity(rgba) #The alpha channel adds a third of the capacity.
+
+def test_native_16_bit_depth():
+    """
+    Test that 16 bit carriers accept up to 8 bits per channel, and that the LSBs above 8 stay untouched.
+
+    Input: A 20x20 I;16 image, 8 bits per channel.
+    """
+
+    pixels = np.full((20, 20), 0xABCD, dtype=np.uint16)
+    img = Image.fromarray(pixels)
+    n = capacity(img, bits_per_channel=8, native=True)
+    assert n > 300
+    encoded = encode_bytes(img, b"x" * n, bits_per_channel=8, native=True)
+    assert np.all(np.array(encoded) >> 8 == 0xAB)
+    assert decode_bytes(encoded) == b"x" * n
+    with pytest.raises(ValueError):
+        encode_bytes(Image.new("RGBA", (20, 20)), b"x", bits_per_channel=5, native=True)
+
+def test_native_default_and_fallback():
+    """
+    Test that without native=True RGBA images are still converted to RGB, and that their payload is
+    still decoded from the RGB image; native payloads need the header and record their mode.
+
+    Input: A 20x20 RGBA image.
+    """
+
+    img = Image.new("RGBA", (20, 20), color=(10, 20, 30, 255))
+    encoded = encode_bytes(img, b"Honey")
+    assert encoded.mode == "RGB"
+    assert decode_bytes(encoded) == b"Honey"
+    assert decode_bytes(encoded.convert("RGBA")) == b"Honey" #No native header: read as RGB.
+    with pytest.raises(ValueError):
+        encode_bytes(img, b"Honey", header=False, native=True)
+    native = encode_bytes(img, b"Honey", native=True)
+    with pytest.raises(ValueError):
+        _extract_payload(np.array(native), mode_code=0) #The header records an RGBA carrier.
+
+
+def test_progress_and_cancel():
+    """
+    Test the progress callback: the embed and extract phases end at the payload size, and raising Cancelled
+    stops the encoding without modifying the input image.
+
+    Input: A 600x600 image and a payload of more than one progress chunk.
+    """
+
+    import src.steg as steg
+    img = Image.new("RGB", (600, 600), color="white")
+    payload = b"Honey" * 20000
+    calls = []
+    encoded = encode_bytes(img, payload, progress=lambda *args: calls.append(args))
+    assert [c for c in calls if c[0] == "embed"][-1] == ("embed", len(payload), len(payload))
+    assert len(calls) > 1 + len(payload) * 8 // steg.PROGRESS_CHUNK_CHANNELS
+    calls.clear()
+    assert decode_bytes(encoded, progress=lambda *args: calls.append(args)) == payload
+    assert calls[-1] == ("extract", len(payload), len(payload))
+
+    def cancel(phase, done, total):
+        if done:
+            raise Cancelled()
+    with pytest.raises(Cancelled):
+        encode_bytes(img, payload, progress=cancel)
+    with pytest.raises(Cancelled):
+        Decode_Image(Encode_Image(img, "Honey" * 20000), progress=cancel)
+    assert np.all(np.array(img) == 255)
+
+def test_checksum():
+    """
+    Test the CRC-32 of the header: the payload round trips, capacity stays exact, and a flipped payload bit is detected.
+
+    Input: A 30x30 image, filled to its capacity with a checksum.
+    """
+
+    img = Image.new("RGB", (30, 30), color="white")
+    n = capacity(img, checksum=True)
+    assert n == capacity(img) - 5 #4 bytes of CRC, and the flags take 2 bytes.
+    encoded = encode_bytes(img, b"a" * n, checksum=True)
+    assert decode_bytes(encoded) == b"a" * n
+    with pytest.raises(ValueError):
+        encode_bytes(img, b"a" * (n + 1), checksum=True)
+    with pytest.raises(ValueError):
+        encode_bytes(img, b"a", header=False, checksum=True)
+    pixels = np.array(encoded)
+    pixels[20, 0, 0] ^= 1
+    with pytest.raises(ValueError):
+        decode_bytes(Image.fromarray(pixels, "RGB"))
+
 
 if __name__ == "__main__":
     test_encode_decode_ascii() 
@@ -235,4 +554,20 @@ if __name__ == "__main__":
     test_maximum_capacity_message()
     test_psnr_equal_images()
     test_psnr_opposite_images()
+    test_vectorized_encode_matches_loop()
+    test_chunked_decode_matches_full_scan()
+    test_header_encode_decode()
+    test_header_message_too_large()
+    test_header_corrupted_length()
+    test_encode_decode_bytes_buffers()
+    test_encode_bytes_nul_without_header()
+    test_bits_per_channel_encode_decode()
+    test_bits_per_channel_layout()
+    test_bits_per_channel_invalid()
+    test_capacity_matches_encoder()
+    test_native_modes_encode_decode()
+    test_native_16_bit_depth()
+    test_native_default_and_fallback()
+    test_progress_and_cancel()
+    test_checksum()
     print("All tests passed!")
@@ -0,0 +1,116 @@
+## Tests of the asyncio facade. Run them with 'pytest test/test_aio.py' in the root folder.
+
+try:
+    import asyncio
+    import threading
+    from PIL import Image
+    import pytest
+
+    from src.aio import AsyncSteg
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_concurrent_encode_decode(tmp_path, executor):
+    """
+    Test many concurrent round trips, with images and paths, in a thread and a process pool.
+    """
+
+    async def run():
+        async with AsyncSteg(executor, max_workers=2, max_in_flight=3) as steg:
+            img = Image.new("RGB", (40, 40), color="white")
+            messages = [f"Ciao {i}" for i in range(10)]
+            encoded = await asyncio.gather(*(steg.encode(img, m) for m in messages))
+            encoded[0].save(tmp_path / "first.png")
+            decoded = await asyncio.gather(*(steg.decode_text(e) for e in encoded))
+            from_path = await steg.decode(str(tmp_path / "first.png"))
+            return messages, decoded, from_path, steg.metrics
+
+    messages, decoded, from_path, metrics = asyncio.run(run())
+    assert decoded == messages
+    assert from_path == b"Ciao 0"
+    assert metrics["completed"] == 21 and metrics["in_flight"] == 0 and metrics["waiting"] == 0
+
+
+def test_backpressure_and_cancellation():
+    """
+    Test that only max_in_flight jobs reach the pool, that the others wait, and that a waiting job can be cancelled.
+    """
+
+    release = threading.Event()
+
+    async def run():
+        steg = AsyncSteg("thread", max_workers=4, max_in_flight=2)
+        tasks = [asyncio.create_task(steg._run(release.wait)) for _ in range(4)]
+        await asyncio.sleep(0.05)
+        busy = steg.metrics
+
+        tasks[3].cancel()
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        steg.close()
+        return busy, results, steg.metrics
+
+    busy, results, metrics = asyncio.run(run())
+    assert busy["in_flight"] == 2 and busy["waiting"] == 2
+    assert results[:3] == [True, True, True]
+    assert isinstance(results[3], asyncio.CancelledError)
+    assert metrics["completed"] == 3 and metrics["cancelled"] == 1
+
+
+def test_failed_job():
+    """
+    Test that errors of the jobs are raised to the caller and counted.
+    """
+
+    async def run():
+        async with AsyncSteg("thread", max_workers=1) as steg:
+            with pytest.raises(ValueError):
+                await steg.encode(Image.new("RGB", (1, 1)), "Ciao, tesoro.")
+            return steg.metrics
+
+    assert asyncio.run(run())["failed"] == 1
+
+
+def test_cancelled_running_job_keeps_its_slot():
+    """
+    Test that cancelling the task of a running job does not free its slot before the job ends: the pool never
+    runs more than max_in_flight jobs and in_flight counts the running job.
+    """
+
+    release = threading.Event()
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def job():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        release.wait(5)
+        with lock:
+            running.pop()
+        return True
+
+    async def run():
+        steg = AsyncSteg("thread", max_workers=2, max_in_flight=1)
+        first = asyncio.create_task(steg._run(job))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        second = asyncio.create_task(steg._run(job))
+        await asyncio.sleep(0.05)
+        busy = steg.metrics
+        release.set()
+        result = await second
+        await asyncio.sleep(0.05)
+        steg.close()
+        return busy, result, first.cancelled(), steg.metrics
+
+    busy, result, cancelled, metrics = asyncio.run(run())
+    assert cancelled and result is True
+    assert busy["in_flight"] == 1 and busy["waiting"] == 1
+    assert max(peak) == 1
+    assert metrics["in_flight"] == 0 and metrics["cancelled"] == 1 and metrics["completed"] == 1
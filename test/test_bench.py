@@ -0,0 +1,48 @@
+## Tests of the performance suite against the committed baseline. Run them with 'pytest test/test_bench.py' in the root folder.
+## The timing gate only runs with STEG_BENCH=1 (e.g. 'STEG_BENCH=1 pytest test/test_bench.py'): bench/baseline.json was
+## recorded with 'python bench/bench.py --quick --save bench/baseline.json' and timings only compare on the same machine.
+
+try:
+    import importlib.util
+    import json
+    import os
+    import pytest
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "bench", "baseline.json")
+THRESHOLD = 1.0 #Allowed slowdown of the gate (1.0 = twice as slow): it catches gross regressions, not noise.
+
+
+def _bench():
+    spec = importlib.util.spec_from_file_location("bench", os.path.join(ROOT, "bench", "bench.py"))
+    bench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+    return bench
+
+
+def test_baseline_covers_the_quick_matrix():
+    """
+    Test that the baseline has a case for every case of the quick matrix, legacy format included.
+    """
+
+    bench = _bench()
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+    results = bench.run_suite(bench.QUICK_SIZES, bench.PAYLOADS, repeats=1)
+    assert set(results) == set(baseline["results"])
+    assert any(case.startswith("decode_legacy/") for case in results)
+
+
+def test_compare():
+    bench = _bench()
+    baseline = {"results": {"encode/256/16": {"seconds": 1.0}, "decode/256/16": {"seconds": 1.0}}}
+    results = {"encode/256/16": {"seconds": 1.2}, "decode/256/16": {"seconds": 1.3}}
+    assert bench.compare(results, baseline, 0.25) == [("decode/256/16", 1.0, 1.3)]
+
+
+@pytest.mark.skipif(os.environ.get("STEG_BENCH") != "1", reason="Set STEG_BENCH=1 to run the timing gate.")
+def test_quick_matrix_against_baseline():
+    assert _bench().main(["--quick", "--compare", BASELINE, "--threshold", str(THRESHOLD)]) == 0
@@ -0,0 +1,74 @@
+## Tests of the decode cache. Run them with 'pytest test/test_cache.py' in the root folder.
+
+try:
+    from PIL import Image
+    import pytest
+
+    from src.steg import encode_bytes
+    from src.cache import DecodeCache, content_hash
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+def test_cache_hits_and_misses(tmp_path, noise):
+    """
+    Test that a repeated decode is a hit, for paths, file objects and PIL images, and that the key is part of the cache key.
+    """
+
+    path = tmp_path / "a.png"
+    encode_bytes(noise(40, 40), b"Honey", key="k").save(path)
+    cache = DecodeCache()
+    assert cache.decode(str(path), key="k") == b"Honey"
+    assert cache.decode(str(path), key="k") == b"Honey"
+    with open(path, "rb") as f:
+        assert cache.decode(f, key="k") == b"Honey" #Same bytes as the path.
+        assert f.tell() == 0
+    with Image.open(path) as im:
+        assert cache.decode_text(im, key="k") == "Honey"
+        assert cache.decode_text(im, key="k") == "Honey"
+    assert content_hash(str(path)) != content_hash(str(path), key="k")
+    with pytest.raises(ValueError):
+        cache.decode(str(path), key="other") #Errors are not cached.
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (3, 3, 2)
+
+
+def test_cache_lru_budget(noise):
+    """
+    Test that the least recently used payloads are evicted to stay within the byte budget.
+    """
+
+    images = [encode_bytes(noise(40, 40, seed=i), bytes([65 + i]) * 100) for i in range(4)]
+    cache = DecodeCache(max_bytes=250)
+    for img in images[:2]:
+        cache.decode(img)
+    cache.decode(images[0]) #images[1] is now the least recently used.
+    cache.decode(images[2])
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["bytes"] == 200
+    cache.decode(images[0])
+    assert cache.stats()["hits"] == 2
+    cache.decode(images[1])
+    assert cache.stats()["misses"] == 4
+    cache.decode(encode_bytes(noise(40, 40, seed=9), b"x" * 300)) #Larger than the budget: not kept.
+    assert cache.stats()["bytes"] <= 250
+
+
+def test_cache_disk_tier(tmp_path, noise):
+    """
+    Test that the SQLite tier survives a new cache and refills the memory tier.
+    """
+
+    img = encode_bytes(noise(40, 40), b"Ciao, amole.")
+    db = tmp_path / "cache.sqlite"
+    with DecodeCache(path=str(db)) as cache:
+        assert cache.decode(img) == b"Ciao, amole."
+    with DecodeCache(path=str(db)) as cache:
+        assert cache.decode(img) == b"Ciao, amole."
+        assert cache.decode(img) == b"Ciao, amole."
+        stats = cache.stats()
+        assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (2, 1, 0)
+        cache.clear()
+        assert cache.decode(img) == b"Ciao, amole."
+        assert cache.stats()["misses"] == 1
@@ -0,0 +1,168 @@
+## Tests of the batch command line interface. Run them with 'pytest test/test_cli.py' in the root folder.
+
+try:
+    import json
+    from PIL import Image
+    import pytest
+
+    from src.cli import main, expand_inputs
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+def _save(images, directory):
+    paths = [directory / f"img{i}.png" for i in range(len(images))]
+    for img, path in zip(images, paths):
+        img.save(path)
+    return paths
+
+
+def _results(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_expand_inputs(tmp_path, noise):
+    """
+    Test that directories, globs and plain files are expanded in the same sorted list of images.
+    """
+
+    paths = _save(noise(40, 40, count=3), tmp_path)
+    (tmp_path / "notes.txt").write_text("not an image")
+
+    expected = sorted(str(p) for p in paths)
+    assert expand_inputs([str(tmp_path)]) == expected
+    assert expand_inputs([str(tmp_path / "*.png")]) == expected
+    assert expand_inputs([str(paths[0]), str(paths[0])]) == [str(paths[0])]
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_encode_decode_directory(tmp_path, capsys, jobs, noise):
+    """
+    Test encoding a whole directory and decoding the outputs, in process and with a process pool.
+    """
+
+    (tmp_path / "in").mkdir()
+    _save(noise(40, 40, count=3), tmp_path / "in")
+    out = tmp_path / "out"
+
+    assert main(["encode", str(tmp_path / "in"), "-m", "Ciao, amole.", "-o", str(out), "-j", jobs]) == 0
+    results = _results(capsys)
+    assert len(results) == 3
+    assert all(r["ok"] and r["psnr"] > 40 and r["seconds"] >= 0 for r in results)
+
+    assert main(["decode", str(out / "*.png"), "-j", jobs]) == 0
+    assert [r["message"] for r in _results(capsys)] == ["Ciao, amole."] * 3
+
+
+def test_manifest(tmp_path, capsys, noise):
+    """
+    Test a manifest with a text message, a binary payload file and a missing image.
+    """
+
+    _save(noise(40, 40, count=2), tmp_path)
+    (tmp_path / "blob.bin").write_bytes(bytes(range(10)))
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text("\n".join([
+        json.dumps({"image": "img0.png", "message": "こんにちは"}),
+        json.dumps({"image": "img1.png", "payload_file": "blob.bin"}),
+        json.dumps({"image": "missing.png", "message": "x"}),
+    ]))
+
+    assert main(["encode", "--manifest", str(manifest), "-o", str(tmp_path / "out"), "-j", "1"]) == 1
+    results = _results(capsys)
+    assert [r["ok"] for r in results] == [True, True, False]
+
+    assert main(["decode", str(tmp_path / "out"), "-o", str(tmp_path / "txt"), "-j", "1"]) == 0
+    _results(capsys)
+    assert (tmp_path / "txt" / "img0_converted_decoded.txt").read_text(encoding="utf-8") == "こんにちは"
+    assert (tmp_path / "txt" / "img1_converted_decoded.txt").read_bytes() == bytes(range(10))
+
+
+def test_encode_format_and_profile(tmp_path, capsys, noise):
+    """
+    Test that --format and --profile pick the lossless output, and that its size and write time are reported.
+    """
+
+    _save(noise(40, 40, count=1), tmp_path)
+    out = tmp_path / "out"
+    assert main(["encode", str(tmp_path / "img0.png"), "-m", "Ciao", "-o", str(out), "-f", "tiff", "--profile", "small", "-j", "1"]) == 0
+    result, = _results(capsys)
+    assert result["output"].endswith("img0_converted.tif")
+    assert result["file_bytes"] == (out / "img0_converted.tif").stat().st_size
+    assert result["write_seconds"] >= 0
+    assert main(["decode", result["output"], "-j", "1"]) == 0
+    assert _results(capsys)[0]["message"] == "Ciao"
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_trace_and_metrics(tmp_path, capsys, jobs, noise):
+    """
+    Test that --trace adds the phases of every job to the results and --metrics writes their totals.
+    """
+
+    _save(noise(40, 40, count=2), tmp_path)
+    out = tmp_path / "out"
+    metrics = tmp_path / "steg.prom"
+    assert main(["encode", str(tmp_path / "*.png"), "-m", "Ciao", "-o", str(out), "--trace", "--metrics", str(metrics), "-j", jobs]) == 0
+    results = _results(capsys)
+    for result in results:
+        assert list(result["phases"]) == ["load", "convert", "array", "embed", "fromarray", "save"]
+        assert result["phases"]["array"]["pixels"] == 40 * 40
+    text = metrics.read_text()
+    assert 'steg_phase_calls_total{phase="embed"} 2' in text
+    assert f'steg_phase_bytes_total{{phase="save"}} {sum(r["file_bytes"] for r in results)}' in text
+
+    #Without --trace the phases are only collected for the metrics file.
+    assert main(["decode", str(out), "--metrics", str(metrics), "-j", jobs]) == 0
+    assert all("phases" not in r for r in _results(capsys))
+    assert 'steg_phase_calls_total{phase="extract"} 2' in metrics.read_text()
+
+
+def test_output_tree_is_mirrored(tmp_path, capsys, noise):
+    """
+    Test that inputs of the same name in different subdirectories get their own outputs, and that two inputs
+    that would still write the same file are refused before any job runs.
+    """
+
+    for sub in ["a", "b"]:
+        (tmp_path / "in" / sub).mkdir(parents=True)
+        _save(noise(40, 40, count=1), tmp_path / "in" / sub)
+    out = tmp_path / "out"
+    assert main(["encode", str(tmp_path / "in"), "-m", "Ciao", "-o", str(out), "-j", "2"]) == 0
+    assert sorted(r["output"] for r in _results(capsys)) == [str(out / "a" / "img0_converted.png"), str(out / "b" / "img0_converted.png")]
+    assert main(["decode", str(out / "**" / "*.png"), "-o", str(tmp_path / "txt"), "-j", "1"]) == 0
+    _results(capsys)
+    assert (tmp_path / "txt" / "a" / "img0_converted_decoded.txt").read_text() == "Ciao"
+    assert (tmp_path / "txt" / "b" / "img0_converted_decoded.txt").read_text() == "Ciao"
+
+    Image.open(tmp_path / "in" / "a" / "img0.png").save(tmp_path / "in" / "a" / "img0.bmp")
+    with pytest.raises(SystemExit, match="img0_converted.png"):
+        main(["encode", str(tmp_path / "in" / "a"), "-m", "Ciao", "-o", str(tmp_path / "clash"), "-j", "1"])
+    assert not (tmp_path / "clash").exists() or not any((tmp_path / "clash").rglob("*.png"))
+
+
+def test_relative_inputs(tmp_path, capsys, monkeypatch, noise):
+    """
+    Test bare file names and globs in the current directory, as the shell expands 'steg encode *.png'.
+    """
+
+    monkeypatch.chdir(tmp_path)
+    _save(noise(40, 40, count=2), tmp_path)
+    assert main(["encode", "img0.png", "img1.png", "-m", "Ciao", "-o", "out", "-j", "1"]) == 0
+    assert all(r["ok"] for r in _results(capsys))
+    assert sorted(p.name for p in (tmp_path / "out").iterdir()) == ["img0_converted.png", "img1_converted.png"]
+    assert main(["encode", "*.png", "-m", "Ciao", "-o", "glob", "-j", "1"]) == 0
+    _results(capsys)
+    assert sorted(p.name for p in (tmp_path / "glob").iterdir()) == ["img0_converted.png", "img1_converted.png"]
+    monkeypatch.chdir(tmp_path / "out")
+    assert main(["decode", "img0_converted.png", "-o", "dec", "-j", "1"]) == 0
+    _results(capsys)
+    assert (tmp_path / "out" / "dec" / "img0_converted_decoded.txt").read_text() == "Ciao"
+
+
+def test_encode_needs_inputs(capsys):
+    with pytest.raises(SystemExit) as e:
+        main(["encode", "-m", "Ciao"])
+    assert e.value.code == 2
+    assert "--manifest" in capsys.readouterr().err
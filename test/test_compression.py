@@ -0,0 +1,74 @@
+## Tests of the compression stage. Run them with 'pytest test/test_compression.py' in the root folder.
+
+try:
+    import json
+    import numpy as np
+    from PIL import Image
+    import pytest
+
+    from src.steg import Encode_Image, Decode_Image, encode_bytes, decode_bytes, can_fit
+    from src import compression
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+LOG = json.dumps([{"level": "INFO", "message": f"request {i} served", "status": 200} for i in range(50)]).encode("utf-8")
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma", "auto"])
+def test_compressed_round_trip(codec):
+    """
+    Test that compressed payloads are expanded by the decoder, and that fewer channels are modified.
+
+    Input: A 100x100 white RGB image.
+    Payload: a JSON log of about 3 KB, which compresses well.
+    """
+
+    img = Image.new("RGB", (100, 100), color="white")
+    plain, packed = {}, {}
+    encode_bytes(img, LOG, stats=plain)
+    encoded = encode_bytes(img, LOG, compression=codec, stats=packed)
+
+    assert decode_bytes(encoded) == LOG
+    assert packed["stored_bytes"] < len(LOG) / 3
+    assert packed["changed_channels"] < plain["changed_channels"] / 3
+
+
+def test_auto_keeps_incompressible_payloads():
+    """
+    Test that "auto" leaves random (incompressible) and very short payloads uncompressed.
+    """
+
+    noise = np.random.default_rng(10).integers(0, 256, 2000, dtype=np.uint8).tobytes()
+    assert compression.choose(noise, "auto") == (compression.NONE, noise)
+    assert compression.choose(b"Ciao", "auto") == (compression.NONE, b"Ciao")
+    assert compression.choose(LOG, "auto")[0] != compression.NONE
+
+
+def test_compression_capacity_and_text():
+    """
+    Test that a payload too large for the image fits once compressed, with the text API too.
+
+    Input: A 40x40 image, 600 bytes of capacity.
+    """
+
+    img = Image.new("RGB", (40, 40), color="white")
+    text = LOG.decode("utf-8")
+    assert not can_fit(img, text)
+    assert can_fit(img, text, compression="lzma")
+    assert Decode_Image(Encode_Image(img, text, header=True, compression="lzma")) == text
+
+
+def test_compression_errors():
+    """
+    Test the invalid options: unknown codec, legacy format, and a corrupted compressed payload.
+    """
+
+    img = Image.new("RGB", (40, 40), color="white")
+    with pytest.raises(ValueError):
+        encode_bytes(img, LOG, compression="rar")
+    with pytest.raises(ValueError):
+        encode_bytes(img, b"Ciao", header=False, compression="zlib")
+    with pytest.raises(ValueError):
+        compression.decompress(b"not zlib data", compression.ZLIB)
@@ -0,0 +1,81 @@
+## Tests of the error correction layer. Run them with 'pytest test/test_fec.py' in the root folder.
+
+try:
+    import numpy as np
+    from PIL import Image
+    import pytest
+
+    from src.steg import encode_bytes, decode_bytes, capacity, can_fit
+    from src import fec
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+@pytest.mark.parametrize("name", list(fec.SCHEMES))
+def test_fec_round_trip_and_sizes(name):
+    """
+    Test that every scheme round trips and that encoded_size and decoded_size are inverse.
+    """
+
+    scheme = fec.SCHEMES[name]
+    rng = np.random.default_rng(22)
+    for length in [0, 1, 3, 4, 7, 1000]:
+        data = rng.integers(0, 256, length, dtype=np.uint8)
+        stored = fec.encode(data, scheme)
+        assert len(stored) == fec.encoded_size(length, scheme)
+        assert fec.decoded_size(len(stored), scheme) == length
+        decoded, corrected = fec.decode(stored, scheme)
+        assert np.array_equal(decoded, data) and corrected == 0
+
+
+def test_hamming_corrects_one_bit_per_codeword():
+    """
+    Test that one flipped bit in every 7 bit codeword is corrected and counted.
+    """
+
+    data = np.arange(256, dtype=np.uint8)
+    bits = np.unpackbits(fec.encode(data, fec.HAMMING))
+    bits[np.arange(0, 256 * 14, 7) + np.arange(256 * 2) % 7] ^= 1
+    decoded, corrected = fec.decode(np.packbits(bits), fec.HAMMING)
+    assert np.array_equal(decoded, data) and corrected == 512
+
+
+def test_repeat_majority_vote():
+    """
+    Test that a burst destroying one whole copy is corrected by the majority vote.
+    """
+
+    data = np.frombuffer(b"Ciao, amole.", dtype=np.uint8)
+    stored = fec.encode(data, fec.REPEAT3).copy()
+    stored[:len(data)] ^= 0xFF
+    decoded, corrected = fec.decode(stored, fec.REPEAT3)
+    assert decoded.tobytes() == b"Ciao, amole." and corrected == len(data) * 8
+
+
+@pytest.mark.parametrize("name", ["hamming", "repeat3"])
+def test_encode_bytes_survives_flipped_lsbs(name):
+    """
+    Test the whole pipeline (compression, error correction, embedding): flipped payload LSBs are corrected
+    and reported, and capacity is exact.
+    """
+
+    rng = np.random.default_rng(2)
+    img = Image.fromarray(rng.integers(0, 256, (60, 60, 3), dtype=np.uint8), "RGB")
+    n = capacity(img, fec=name, checksum=True)
+    assert can_fit(img, b"a" * n, fec=name, checksum=True) and not can_fit(img, b"a" * (n + 1), fec=name, checksum=True)
+    payload = rng.bytes(n)
+    encoded = np.array(encode_bytes(img, payload, fec=name, checksum=True))
+    with pytest.raises(ValueError):
+        encode_bytes(img, payload + b"!", fec=name, checksum=True)
+    flat = encoded.reshape(-1)
+    flat[200:10000:97] ^= 1 #Far apart: at most one flip per codeword, and per bit over the copies.
+    info = {}
+    assert decode_bytes(Image.fromarray(encoded, "RGB"), info=info) == payload
+    assert info["corrected_errors"] == len(range(200, 10000, 97))
+    text = b"Ciao, amole. " * 20
+    assert decode_bytes(encode_bytes(img, text, fec=name, compression="zlib")) == text
+    with pytest.raises(ValueError):
+        encode_bytes(img, b"Ciao", header=False, fec=name)
+    with pytest.raises(ValueError):
+        encode_bytes(img, b"Ciao", fec="golay")
@@ -0,0 +1,69 @@
+## Tests of the multi-frame carriers. Run them with 'pytest test/test_frames.py' in the root folder.
+
+try:
+    from PIL import Image
+    import pytest
+
+    from src.steg import capacity
+    from src.frames import encode_frames, decode_frames, save_frames, split_sizes
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+@pytest.mark.parametrize("name", ["animated.png", "pages.tiff"])
+def test_sequence_round_trip(tmp_path, name, noise):
+    """
+    Test a payload larger than one frame, spread over an APNG and a multi-page TIFF.
+
+    Input: 4 frames of 40x30, about 440 bytes of capacity each.
+    Payload: 1280 bytes.
+    """
+
+    frames = noise(30, 40, count=4)
+    payload = bytes(range(256)) * 5
+    assert len(payload) > capacity(frames[0])
+
+    path = tmp_path / name
+    save_frames(encode_frames(frames, payload), str(path))
+    with Image.open(path) as im:
+        assert im.n_frames == 4
+        assert decode_frames(im) == payload
+    assert decode_frames(str(path), workers=1) == payload
+
+
+def test_frames_key_and_compression(noise):
+    """
+    Test that the key and the compression apply to the whole payload spread over the frames.
+    """
+
+    payload = b"Ciao, amole. " * 300
+    encoded = encode_frames(noise(30, 40, count=4), payload, bits_per_channel=2, key="chiave", compression="zlib")
+    assert decode_frames(encoded, key="chiave") == payload
+
+
+def test_missing_and_foreign_frames(noise):
+    """
+    Test that a missing frame, or a frame that does not hold a chunk, raise a ValueError.
+    """
+
+    encoded = encode_frames(noise(30, 40, count=4), bytes(1000))
+    with pytest.raises(ValueError):
+        decode_frames(encoded[:3])
+    with pytest.raises(ValueError):
+        decode_frames(encoded + noise(30, 40, count=1))
+
+
+def test_split_and_capacity(noise):
+    """
+    Test the split of the payload over frames of different capacities, and the errors on too small or lossy carriers.
+    """
+
+    assert split_sizes(10, [100, 100, 100]) == [4, 4, 2]
+    assert split_sizes(10, [1, 100, 100]) == [1, 5, 4]
+    with pytest.raises(ValueError):
+        split_sizes(10, [3, 3])
+    with pytest.raises(ValueError):
+        encode_frames(noise(4, 4, count=2), b"Ciao, tesoro.")
+    with pytest.raises(ValueError):
+        save_frames(noise(30, 40, count=2), "animated.gif")
@@ -0,0 +1,98 @@
+## Tests of the background jobs of the GUI (no window is opened). Run them with 'pytest test/test_gui_worker.py' in the root folder.
+
+try:
+    import time
+    import threading
+    from PIL import Image
+    import pytest
+
+    from gui.worker import JobQueue, encode_file, decode_file
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+def _wait(jobs, timeout=10):
+    events = []
+    end = time.monotonic() + timeout
+    while jobs.pending() and time.monotonic() < end:
+        time.sleep(0.01)
+    return events + jobs.drain()
+
+
+def test_job_queue_encode_decode(tmp_path):
+    """
+    Test that queued encode and decode jobs report their progress and results through the events.
+    """
+
+    path = tmp_path / "in.png"
+    Image.new("RGB", (50, 50), color="white").save(path)
+    jobs = JobQueue()
+    first = jobs.submit(encode_file, str(path), str(tmp_path / "out.png"), "Ciao, amole.", "fast")
+    events = _wait(jobs)
+    second = jobs.submit(decode_file, str(tmp_path / "out.png"), str(tmp_path / "out.txt"))
+    events += _wait(jobs)
+    jobs.shutdown(wait=True)
+
+    kinds = [(e[0], e[1]) for e in events]
+    assert ("done", first) in kinds and ("done", second) in kinds
+    assert any(e[0] == "progress" and e[2] == "embed" for e in events)
+    assert any(e[0] == "progress" and e[2] == "extract" for e in events)
+    assert (tmp_path / "out.txt").read_text(encoding="utf-8") == "Ciao, amole."
+
+
+def test_job_queue_cancel(tmp_path):
+    """
+    Test that cancelling stops the running job at its next progress call and drops the queued ones,
+    without writing their outputs.
+    """
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(name, progress=None):
+        started.set()
+        release.wait(5)
+        progress("embed", 0, 1) #Raises Cancelled
+        (tmp_path / name).write_text("written")
+
+    jobs = JobQueue()
+    ids = [jobs.submit(slow, f"out{i}.txt") for i in range(3)]
+    assert started.wait(5)
+    jobs.cancel()
+    release.set()
+    events = _wait(jobs)
+    jobs.shutdown(wait=True)
+
+    assert sorted(e[1] for e in events if e[0] == "cancelled") == ids
+    assert not list(tmp_path.iterdir())
+
+
+def test_job_queue_error(tmp_path):
+    """
+    Test that a failing job is reported as an error event.
+    """
+
+    jobs = JobQueue()
+    job_id = jobs.submit(decode_file, str(tmp_path / "missing.png"), str(tmp_path / "out.txt"))
+    events = _wait(jobs)
+    jobs.shutdown(wait=True)
+    assert [e[:2] for e in events if e[0] == "error"] == [("error", job_id)]
+
+
+def test_job_queue_trace(tmp_path):
+    """
+    Test that a traced queue posts the phases of every job just before its result.
+    """
+
+    path = tmp_path / "in.png"
+    Image.new("RGB", (50, 50), color="white").save(path)
+    jobs = JobQueue(trace=True)
+    job_id = jobs.submit(encode_file, str(path), str(tmp_path / "out.png"), "Ciao", "fast")
+    events = _wait(jobs)
+    jobs.shutdown(wait=True)
+
+    kinds = [e[0] for e in events if e[0] != "progress"]
+    assert kinds == ["started", "phases", "done"]
+    phases = next(e[2] for e in events if e[0] == "phases")
+    assert phases["array"]["pixels"] == 50 * 50 and phases["save"]["bytes"] == (tmp_path / "out.png").stat().st_size
@@ -0,0 +1,68 @@
+## Tests of the lazy imports of the package. Run them with 'pytest test/test_imports.py' in the root folder.
+## The import costs are measured with 'python -X importtime' in a fresh interpreter.
+
+try:
+    import os
+    import subprocess
+    import sys
+    import pytest
+
+    import src
+    from src import core
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("numpy", "PIL", "tkinter", "customtkinter")
+#Cumulative import time allowed (microseconds). NumPy alone takes about 100 ms, the lazy imports about 5 ms
+#for 'src' and 30 ms for the command line, so the budgets leave room for slow machines.
+BUDGETS = {"src": 50_000, "src.cli": 100_000, "gui.worker": 50_000}
+
+
+def _import_times(module):
+    """
+    Import module in a fresh interpreter with -X importtime. Returns {module name: cumulative microseconds}.
+    """
+
+    run = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                         capture_output=True, text=True, check=True)
+    times = {}
+    for line in run.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("module", sorted(BUDGETS))
+def test_headless_import_is_light(module):
+    times = _import_times(module)
+    heavy = sorted(name for name in times if name.split(".")[0] in HEAVY)
+    assert heavy == [], f"import {module} loads {heavy}"
+    assert times[module] < BUDGETS[module], f"import {module} took {times[module] / 1000:.1f} ms"
+
+
+def test_lazy_exports():
+    from src import steg, shard
+
+    assert src.encode_bytes is steg.encode_bytes
+    assert src.decode_sharded is shard.decode_sharded
+    assert core.Cancelled is steg.Cancelled
+    assert set(src.__all__) <= set(dir(src))
+    namespace = {}
+    exec("from src import *", namespace)
+    assert set(src.__all__) <= set(namespace)
+    with pytest.raises(AttributeError):
+        src.not_exported
+    with pytest.raises(AttributeError):
+        core.not_exported
+
+
+def test_core_modules():
+    import numpy as np
+    from PIL import Image
+
+    assert core.np is np
+    assert core.Image is Image
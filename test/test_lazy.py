@@ -0,0 +1,93 @@
+## Tests of the lazy (row by row) decoding. Run them with 'pytest test/test_lazy.py' in the root folder.
+
+try:
+    import numpy as np
+    from PIL import Image
+    import pytest
+
+    from src.steg import encode_bytes, decode_bytes
+    from src import tracing
+    from src.lazy import read_rows, decode_path
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+def test_read_rows_png(tmp_path, noise):
+    """
+    Test that the rows decompressed lazily are the first rows of the full image, for RGB and RGBA PNGs.
+    """
+
+    img = noise(60, 10)
+    for mode in ["RGB", "RGBA"]:
+        path = tmp_path / f"rows_{mode}.png"
+        img.convert(mode).save(path)
+        full = np.array(img)
+        assert np.array_equal(read_rows(str(path), 7), full[:7])
+        assert np.array_equal(read_rows(str(path), 1000), full)
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"bits_per_channel": 3}, {"header": False}])
+def test_decode_path_matches_decode_bytes(tmp_path, kwargs, noise):
+    """
+    Test that the lazy decoder returns the same payload of decode_bytes, for header and legacy images,
+    with short and long messages (the legacy ones need several doubling strips).
+    """
+
+    img = noise(60, 10)
+    for payload in [b"Ciao", b"a" * 150]:
+        path = tmp_path / "encoded.png"
+        encode_bytes(img, payload, **kwargs).save(path)
+        with Image.open(path) as im:
+            assert decode_path(str(path)) == decode_bytes(im) == payload
+        with open(path, "rb") as f:
+            assert decode_path(f) == payload
+
+
+def test_decode_path_without_terminator(tmp_path):
+    """
+    Test an image without a terminator: the whole image is returned, as decode_bytes does.
+    """
+
+    path = tmp_path / "white.png"
+    Image.new("RGB", (10, 10), color="white").save(path)
+    assert decode_path(str(path)) == b"\xff" * (10 * 10 * 3 // 8)
+
+
+def test_decode_path_other_formats(tmp_path, noise):
+    """
+    Test that formats without incremental decoding (BMP) fall back to the full decode.
+    """
+
+    path = tmp_path / "encoded.bmp"
+    encode_bytes(noise(60, 10), b"Ciao").save(path)
+    assert decode_path(str(path)) == b"Ciao"
+
+def test_decode_path_native_modes(tmp_path):
+    """
+    Native RGBA and 16 bit PNGs are decoded in their own mode.
+    """
+
+    rng = np.random.default_rng(16)
+    for name, img in [("rgba.png", Image.fromarray(rng.integers(0, 256, (40, 10, 4), dtype=np.uint8))),
+                      ("deep.png", Image.fromarray(rng.integers(0, 65536, (40, 10), dtype=np.uint16)))]:
+        path = tmp_path / name
+        encode_bytes(img, b"Honey" * 10, bits_per_channel=2, native=True).save(path)
+        assert decode_path(str(path)) == b"Honey" * 10
+
+
+def test_decode_path_alpha_pngs_are_read_lazily(tmp_path):
+    """
+    Alpha and 16 bit PNGs only load the rows holding the payload, encoded natively or through the RGB conversion.
+    """
+
+    rng = np.random.default_rng(16)
+    rgba = Image.fromarray(rng.integers(0, 256, (2000, 10, 4), dtype=np.uint8))
+    deep = Image.fromarray(rng.integers(0, 65536, (2000, 10), dtype=np.uint16))
+    for name, img, native in [("native.png", rgba, True), ("converted.png", rgba, False), ("deep.png", deep, True)]:
+        path = tmp_path / name
+        encode_bytes(img, b"Honey" * 10, native=native).save(path)
+        with tracing.collect() as breakdown:
+            assert decode_path(str(path)) == b"Honey" * 10
+        loaded = breakdown.phases()["load"]
+        assert loaded["pixels"] < 2000 * 10 // 10, name
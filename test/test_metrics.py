@@ -0,0 +1,77 @@
+## Tests of the quality metrics. Run them with 'pytest test/test_metrics.py' in the root folder.
+
+try:
+    import math
+    import numpy as np
+    from PIL import Image
+    import pytest
+
+    from src.steg import encode_bytes, PSNR
+    from src.metrics import mse, psnr, psnr_from_stats, channel_stats, ssim
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+def test_chunked_mse_matches_float(noise):
+    """
+    Test that the integer, strip by strip MSE and PSNR equal the float64 full-frame formulas.
+    """
+
+    a = np.array(noise(37, 29))
+    b = np.array(noise(37, 29, seed=1))
+    expected = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+
+    assert mse(a, b, chunk_rows=5) == pytest.approx(expected)
+    assert psnr(a, b, chunk_rows=5) == pytest.approx(20 * np.log10(255.0 / np.sqrt(expected)))
+    assert psnr(a, a) == float('inf')
+
+
+def test_psnr_from_stats(noise):
+    """
+    Test that the PSNR computed from the encoder stats is the PSNR of the two images, for every bits_per_channel.
+    """
+
+    img = noise(37, 29)
+    for k in range(1, 5):
+        stats = {}
+        encoded = encode_bytes(img, bytes(range(200)), bits_per_channel=k, stats=stats)
+        assert psnr_from_stats(stats) == pytest.approx(PSNR(img, encoded))
+        assert stats["changed_channels"] == sum(c["changed"] for c in channel_stats(img, encoded))
+
+
+def test_channel_stats():
+    """
+    Test the per channel stats on an image where only the green channel changes by 2.
+    """
+
+    a = np.zeros((10, 10, 3), dtype=np.uint8)
+    b = a.copy()
+    b[:5, :, 1] = 2
+
+    red, green, blue = channel_stats(a, b, chunk_rows=3)
+    assert red == {"mse": 0.0, "psnr": float('inf'), "max_abs_diff": 0, "changed": 0}
+    assert green["changed"] == 50 and green["max_abs_diff"] == 2 and green["mse"] == 2.0
+    assert green["psnr"] == pytest.approx(20 * math.log10(255 / math.sqrt(2)))
+
+
+def test_ssim(noise):
+    """
+    Test that SSIM is 1 for equal images, slightly lower after an embedding, and much lower for unrelated images.
+    """
+
+    img = noise(64, 64)
+    encoded = encode_bytes(img, bytes(range(256)) * 4, bits_per_channel=2)
+
+    assert ssim(img, img) == pytest.approx(1.0)
+    assert 0.9 < ssim(img, encoded, chunk_rows=16) < 1.0
+    assert ssim(img, noise(64, 64, seed=1)) < 0.2
+
+
+def test_mismatched_images():
+    """
+    Test that images with different shapes raise a ValueError.
+    """
+
+    with pytest.raises(ValueError):
+        psnr(Image.new("RGB", (10, 10)), Image.new("RGB", (10, 11)))
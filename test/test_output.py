@@ -0,0 +1,64 @@
+## Tests of the lossless saving of the encoded images. Run them with 'pytest test/test_output.py' in the root folder.
+
+try:
+    import numpy as np
+    from PIL import Image, features
+    import pytest
+
+    from src.steg import encode_bytes, decode_bytes
+    from src.output import save_encoded, output_format, PROFILES
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+@pytest.mark.parametrize("ext", [".png", ".tif", ".bmp", ".webp"])
+@pytest.mark.parametrize("profile", PROFILES)
+def test_save_encoded_round_trip(tmp_path, ext, profile, noise):
+    """
+    Test that every format and profile keeps the payload, and that the report matches the file.
+    """
+
+    if ext == ".webp" and not features.check("webp"):
+        pytest.skip("PIL is built without WebP.")
+    path = tmp_path / f"out{ext}"
+    for mode in ["RGB", "RGBA"] if ext != ".bmp" else ["RGB", "L"]:
+        encoded = encode_bytes(noise(40, 40, mode=mode), b"Ciao, amole.", native=True)
+        saved = save_encoded(encoded, str(path), profile=profile)
+        assert saved["bytes"] == path.stat().st_size
+        assert saved["seconds"] >= 0 and saved["profile"] == profile
+        with Image.open(path) as im:
+            assert im.mode == mode
+            assert np.array_equal(np.array(im), np.array(encoded))
+            assert decode_bytes(im) == b"Ciao, amole."
+
+
+def test_save_encoded_profiles_size(tmp_path):
+    """
+    Test that the small profile does not write a larger PNG than the fast one.
+    """
+
+    img = Image.new("RGB", (200, 200), color="white")
+    encoded = encode_bytes(img, b"Ciao" * 100)
+    fast = save_encoded(encoded, str(tmp_path / "fast.png"), profile="fast")
+    small = save_encoded(encoded, str(tmp_path / "small.png"), profile="small")
+    assert small["bytes"] <= fast["bytes"]
+
+
+def test_save_encoded_refuses_lossy(tmp_path, noise):
+    """
+    Test that lossy formats, unknown profiles and modes the format would convert are refused.
+    """
+
+    encoded = encode_bytes(noise(40, 40), b"Ciao, amole.", native=True)
+    for name in ["out.jpg", "out.jpeg", "out.gif", "out.unknown"]:
+        with pytest.raises(ValueError):
+            save_encoded(encoded, str(tmp_path / name))
+    with pytest.raises(ValueError):
+        save_encoded(encoded, str(tmp_path / "out.png"), format="JPEG")
+    with pytest.raises(ValueError):
+        save_encoded(encoded, str(tmp_path / "out.png"), profile="tiny")
+    with pytest.raises(ValueError):
+        save_encoded(encode_bytes(noise(40, 40, mode="RGBA"), b"Ciao, amole.", native=True), str(tmp_path / "out.bmp"))
+    assert not list(tmp_path.iterdir())
+    assert output_format("a.TIFF") == "TIFF" and output_format("a", "tif") == "TIFF"
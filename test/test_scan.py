@@ -0,0 +1,82 @@
+## Tests of the triage scanner. Run them with 'pytest test/test_scan.py' in the root folder.
+
+try:
+    import json
+    import math
+    import numpy as np
+    from PIL import Image
+    import pytest
+
+    from src.steg import encode_bytes, Encode_Image
+    from src.scan import scan_image, chi_square, _gammaincc
+    from src.cli import main
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+def _smooth(height=200, width=300):
+    #A carrier with a natural looking (uneven) histogram.
+    rng = np.random.default_rng(19)
+    y, x = np.mgrid[0:height, 0:width]
+    base = (np.sin(x / 17) * 50 + np.cos(y / 23) * 40 + 128).astype(np.uint8)
+    noise = rng.integers(0, 2, size=(height, width), dtype=np.uint8) * 2 #Even steps keep the pairs uneven.
+    return Image.fromarray(np.stack([base, base // 2 + 40, 255 - base], -1) + noise[..., None], "RGB")
+
+
+def test_gammaincc_known_values():
+    """
+    Test the p-values against known quantiles of the chi-square distribution.
+    """
+
+    assert _gammaincc(0.5, 3.841459 / 2) == pytest.approx(0.05, abs=1e-6)
+    assert _gammaincc(5, 18.307038 / 2) == pytest.approx(0.05, abs=1e-6) #df=10
+    assert _gammaincc(50, 50) == pytest.approx(0.4812, abs=1e-3)
+    assert _gammaincc(1, 2) == pytest.approx(math.exp(-2))
+    assert _gammaincc(3, 0) == 1.0
+
+
+def test_scan_verdicts():
+    """
+    Test every verdict: header, legacy, suspicious (a keyed payload filling the image) and clean.
+    """
+
+    img = _smooth()
+    assert scan_image(img)["verdict"] == "clean"
+    result = scan_image(encode_bytes(img, b"x" * 300, compression="zlib", bits_per_channel=2))
+    assert result["verdict"] == "header"
+    assert result["header"]["bits_per_channel"] == 2 and result["header"]["compression"] == "zlib"
+    legacy = scan_image(Encode_Image(img, "Ciao, amole."))
+    assert legacy["verdict"] == "legacy" and legacy["legacy"] == {"bytes": 12, "terminated": True}
+    rng = np.random.default_rng(0)
+    full = encode_bytes(img, rng.bytes(300 * 200 * 3 // 8 - 64), key="k")
+    assert scan_image(full)["verdict"] == "suspicious"
+    assert scan_image(encode_bytes(img.convert("RGBA"), b"Honey", native=True))["verdict"] == "header"
+
+
+def test_chi_square_pairs():
+    """
+    Test that evened pairs give a p-value close to 1 and uneven pairs close to 0.
+    """
+
+    even = np.repeat(np.arange(256, dtype=np.uint8), 100)
+    _, df, p, _ = chi_square(even)
+    assert df == 127 and p == pytest.approx(1.0)
+    uneven = np.repeat(np.arange(0, 256, 2, dtype=np.uint8), 100)
+    assert chi_square(uneven)[2] < 1e-6
+    assert chi_square(np.zeros(10, dtype=np.uint8))[2] is None
+
+
+def test_scan_cli_report(tmp_path):
+    """
+    Test the scan subcommand: a JSON line per image in the report file, from the file paths (first rows only).
+    """
+
+    img = _smooth()
+    img.save(tmp_path / "clean.png")
+    encode_bytes(img, b"Honey").save(tmp_path / "encoded.png")
+    report = tmp_path / "report.jsonl"
+    assert main(["scan", str(tmp_path / "*.png"), "--report", str(report), "-j", "2"]) == 0
+    results = {r["input"].rsplit("/", 1)[-1]: r for r in map(json.loads, report.read_text().splitlines())}
+    assert results["clean.png"]["verdict"] == "clean"
+    assert results["encoded.png"]["verdict"] == "header"
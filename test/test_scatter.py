@@ -0,0 +1,122 @@
+## Tests of the keyed scattering. Run them with 'pytest test/test_scatter.py' in the root folder.
+
+try:
+    import numpy as np
+    from PIL import Image
+    import pytest
+
+    from src.steg import Encode_Image, Decode_Image, encode_bytes, decode_bytes, capacity
+    from src import scatter
+    from src.scatter import KeyedOrder, positions
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+def test_order_is_a_prefix_consistent_permutation():
+    """
+    Test that the keyed order is a permutation of all the channels and that every prefix is the same,
+    whatever lengths are asked (sparse and dense phases included).
+    """
+
+    full = KeyedOrder(5000, "chiave").take(5000)
+    assert np.array_equal(np.sort(full), np.arange(5000))
+
+    partial = KeyedOrder(5000, "chiave")
+    for n in [1, 17, 2400, 2500, 2501, 4999, 5000]:
+        assert np.array_equal(partial.take(n), full[:n])
+
+    assert not np.array_equal(KeyedOrder(5000, "altra").take(100), full[:100])
+
+
+def test_positions_cache():
+    """
+    Test that positions are cached by (shape, key) and that the cached order is extended consistently.
+    """
+
+    first = positions((50, 50, 3), b"k", 10).copy()
+    assert np.array_equal(positions((50, 50, 3), b"k", 100)[:10], first)
+    assert np.array_equal(positions((50, 50, 3), b"k", 10), KeyedOrder(50 * 50 * 3, b"k").take(10))
+
+
+def test_order_is_stable():
+    """
+    Test that the order does not change between versions: images encoded with a key must stay decodable.
+    """
+
+    assert KeyedOrder(5000, "chiave").take(8).tolist() == [810, 4207, 905, 610, 2740, 1197, 2515, 2532]
+    assert KeyedOrder(36_000_000, "k").take(400_000)[-4:].tolist() == [3283527, 2726791, 5210429, 28106513]
+    #Through the sorted array, the bit mask and the final permutation.
+    assert KeyedOrder(3_000_000, "k").take(2_000_000)[[100_000, 1_400_000, -1]].tolist() == [2762402, 759463, 275335]
+
+
+def test_small_orders_do_not_depend_on_the_image():
+    """
+    Test that a few positions of a large image take memory for the positions only, and stay cached.
+    """
+
+    order = KeyedOrder(10000 * 10000 * 3, "k")
+    order.take(400)
+    assert order.nbytes <= 2 * scatter.BATCH * 8
+    scatter.clear_cache()
+    positions((10000, 10000, 3), "k", 400)
+    assert len(scatter._cache) == 1
+    scatter.clear_cache()
+
+    order = KeyedOrder(2_000_000, "chiave")
+    steps = [order.take(n).copy() for n in (10, 20_000, 200_000, 2_000_000)]
+    assert all(np.array_equal(step, steps[-1][:len(step)]) for step in steps)
+    assert np.array_equal(np.sort(steps[-1]), np.arange(2_000_000))
+
+
+def test_positions_cache_is_bounded_by_bytes(monkeypatch):
+    """
+    Test that the cache drops the least recently used orders beyond CACHE_BYTES and never keeps a larger one.
+    """
+
+    scatter.clear_cache()
+    order = KeyedOrder(100 * 100 * 3, "a")
+    order.take(10)
+    monkeypatch.setattr(scatter, "CACHE_BYTES", 2 * order.nbytes + 1000)
+    for key in ["a", "b", "c"]:
+        positions((100, 100, 3), key, 10)
+    assert [k for _, k in scatter._cache] == [b"b", b"c"]
+    positions((200, 200, 3), "big", 10)
+    assert all(shape == (100, 100, 3) for shape, _ in scatter._cache)
+    assert sum(o.nbytes for o in scatter._cache.values()) <= scatter.CACHE_BYTES
+    scatter.clear_cache()
+
+
+@pytest.mark.parametrize("k", [1, 3])
+def test_keyed_encode_decode(k):
+    """
+    Test a keyed round trip: the payload is spread over the image, and a wrong key finds nothing.
+
+    Input: A 60x60 RGB image with random noise.
+    Payload: 100 bytes.
+    """
+
+    rng = np.random.default_rng(9)
+    img = Image.fromarray(rng.integers(0, 256, size=(60, 60, 3), dtype=np.uint8), "RGB")
+    payload = rng.integers(0, 256, 100, dtype=np.uint8).tobytes()
+
+    encoded = encode_bytes(img, payload, bits_per_channel=k, key="chiave")
+    assert decode_bytes(encoded, key="chiave") == payload
+
+    changed_rows = np.flatnonzero((np.array(encoded) != np.array(img)).any(axis=(1, 2)))
+    assert changed_rows.max() > 50 #Not only the first rows.
+
+    with pytest.raises(ValueError):
+        decode_bytes(encoded, key="sbagliata")
+
+
+def test_keyed_text_and_capacity():
+    """
+    Test the keyed text API, a payload filling the whole capacity, and that the keyed mode needs the header.
+    """
+
+    img = Image.new("RGB", (10, 10), color="white")
+    message = "a" * capacity(img)
+    assert Decode_Image(Encode_Image(img, message, header=True, key=42), key=42) == message
+    with pytest.raises(ValueError):
+        Encode_Image(img, "Ciao", key=42)
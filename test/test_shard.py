@@ -0,0 +1,68 @@
+## Tests of the sharding of one payload over many images. Run them with 'pytest test/test_shard.py' in the root folder.
+
+try:
+    import numpy as np
+    from PIL import Image
+    import pytest
+
+    from src.steg import encode_bytes
+    from src.shard import encode_sharded, decode_sharded
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_sharded_round_trip_any_order(workers, noise):
+    """
+    Test that a payload larger than any carrier is split, and reassembled from the images in any order.
+    """
+
+    carriers = noise(30, 40, count=4)
+    payload = np.random.default_rng(0).bytes(1500) #One 40x30 carrier holds less than 450 bytes.
+    encoded = encode_sharded(carriers, payload, key="k", workers=workers)
+    assert len(encoded) == 4
+    assert decode_sharded(encoded[::-1], key="k", workers=workers) == payload
+    assert decode_sharded([encoded[2], encoded[0], encoded[3], encoded[1]], key="k", workers=workers) == payload
+
+
+def test_sharded_paths(tmp_path, noise):
+    """
+    Test sharding from and to files, with compression.
+    """
+
+    inputs = []
+    for i, img in enumerate(noise(30, 40, count=3)):
+        inputs.append(str(tmp_path / f"in{i}.png"))
+        img.save(inputs[-1])
+    outputs = [str(tmp_path / f"out{i}.png") for i in range(3)]
+    payload = b"Ciao, amole. " * 200
+    reports = encode_sharded(inputs, payload, output_paths=outputs, compression="zlib", workers=2)
+    assert [r["path"] for r in reports] == outputs
+    assert decode_sharded(outputs[::-1], workers=2) == payload
+
+
+def test_sharded_failures(noise):
+    """
+    Test the errors: too large payload, missing, duplicated, corrupted and foreign shards.
+    """
+
+    carriers = noise(30, 40, count=3)
+    payload = b"x" * 900
+    with pytest.raises(ValueError):
+        encode_sharded(carriers, b"x" * 5000, workers=1)
+    encoded = encode_sharded(carriers, payload, workers=1)
+    with pytest.raises(ValueError, match="Missing shards"):
+        decode_sharded(encoded[:2], workers=1)
+    with pytest.raises(ValueError, match="twice"):
+        decode_sharded([encoded[0], encoded[0], encoded[1]], workers=1)
+    pixels = np.array(encoded[1])
+    pixels[-1, -1, -1] ^= 1 #Outside the shard: ignored.
+    pixels[0, 30, 0] ^= 1 #Inside the shard: the checksum fails.
+    with pytest.raises(ValueError, match="Checksum"):
+        decode_sharded([encoded[0], Image.fromarray(pixels, "RGB"), encoded[2]], workers=1)
+    other = encode_sharded(carriers, b"y" * 900, compression="zlib", workers=1)
+    with pytest.raises(ValueError, match="different payloads"):
+        decode_sharded([encoded[0], other[1], encoded[2]], workers=1)
+    with pytest.raises(ValueError, match="shard"):
+        decode_sharded([encode_bytes(carriers[0], b"plain")], workers=1)
@@ -0,0 +1,103 @@
+## Tests of the streaming (memory mapped) carriers. Run them with 'pytest test/test_stream.py' in the root folder.
+
+try:
+    import numpy as np
+    from PIL import Image
+    import pytest
+
+    from src.steg import encode_bytes, decode_bytes
+    from src.stream import open_carrier, encode_file, decode_file
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+def test_ppm_matches_in_memory_encoding(tmp_path, noise):
+    """
+    Test that the streaming encoding of a PPM writes the same pixels of encode_bytes, and that PIL reads it back.
+    """
+
+    arr = np.array(noise(30, 20))
+    path = tmp_path / "carrier.ppm"
+    Image.fromarray(arr, "RGB").save(path)
+    payload = "Ciao, amole. こんにちは".encode("utf-8")
+
+    out = encode_file(str(path), payload, str(tmp_path / "encoded.ppm"), bits_per_channel=2)
+
+    with Image.open(out) as im:
+        assert np.array_equal(np.array(im), np.array(encode_bytes(Image.fromarray(arr, "RGB"), payload, bits_per_channel=2)))
+        assert decode_bytes(im) == payload
+    assert decode_file(out) == payload
+    #The input carrier is left untouched.
+    assert np.array_equal(np.array(open_carrier(str(path))), arr)
+
+
+def test_ppm_header_with_comment(tmp_path, noise):
+    """
+    Test a PPM header with a comment and unusual whitespace.
+    """
+
+    arr = np.array(noise(4, 5))
+    path = tmp_path / "comment.ppm"
+    path.write_bytes(b"P6\n# made by hand\n5  4\n255\n" + arr.tobytes())
+
+    assert np.array_equal(np.array(open_carrier(str(path))), arr)
+
+
+def test_npy_and_raw_in_place(tmp_path, noise):
+    """
+    Test the in-place encoding of .npy and raw RGB carriers, and that raw files need their shape.
+    """
+
+    arr = np.array(noise(30, 20))
+    npy = tmp_path / "carrier.npy"
+    np.save(npy, arr)
+    raw = tmp_path / "carrier.rgb"
+    raw.write_bytes(arr.tobytes())
+
+    encode_file(str(npy), b"\x00binary\xff")
+    assert decode_file(str(npy)) == b"\x00binary\xff"
+
+    encode_file(str(raw), b"Ciao", header=False, shape=(30, 20))
+    assert decode_file(str(raw), shape=(30, 20)) == b"Ciao"
+    with pytest.raises(ValueError):
+        decode_file(str(raw))
+
+
+def test_stream_message_too_large(tmp_path, noise):
+    """
+    Test that a payload larger than the carrier (or not bytes-like, or with a bad option) raises before the
+    carrier is copied, and that no output file is left behind.
+    """
+
+    path = tmp_path / "small.npy"
+    np.save(path, np.array(noise(2, 2)))
+    out = tmp_path / "small_out.npy"
+    with pytest.raises(ValueError):
+        encode_file(str(path), b"Ciao, tesoro.", str(out))
+    with pytest.raises(TypeError):
+        encode_file(str(path), "Ciao", str(out))
+    with pytest.raises(ValueError):
+        encode_file(str(path), b"C", str(out), bits_per_channel=9)
+    with pytest.raises(ValueError):
+        encode_file(str(path), b"Ciao, tesoro.")
+    assert not out.exists()
+    assert np.array_equal(np.load(path), np.array(noise(2, 2)))
+
+
+def test_carrier_size_is_checked(tmp_path, noise):
+    """
+    Test that a raw or PPM carrier whose size does not match its shape is refused and never extended.
+    """
+
+    raw = tmp_path / "small.raw"
+    raw.write_bytes(np.array(noise(10, 10)).tobytes())
+    with pytest.raises(ValueError, match="300 bytes"):
+        encode_file(str(raw), b"hi", shape=(100, 100))
+    assert raw.stat().st_size == 300
+
+    ppm = tmp_path / "truncated.ppm"
+    ppm.write_bytes(b"P6\n5 4\n255\n" + np.array(noise(4, 5)).tobytes()[:-1])
+    with pytest.raises(ValueError):
+        open_carrier(str(ppm), mode="r+")
+    assert ppm.stat().st_size == 11 + 59
@@ -0,0 +1,155 @@
+## Tests of the tracing of the pipeline phases. Run them with 'pytest test/test_tracing.py' in the root folder.
+
+try:
+    import logging
+    import threading
+    import pytest
+
+    from src import tracing
+    from src.steg import encode_bytes, decode_bytes, PSNR
+
+except ImportError as e:
+    raise ImportError(f"The following module cannot be imported: {e}. Install the required dependencies with 'pip install -r requirements.txt'. ")
+
+
+def test_disabled_is_a_no_op():
+    """
+    Test that without hooks every span is the shared no-op span.
+    """
+
+    assert not tracing.enabled()
+    assert tracing.span("embed", bytes=1) is tracing.NULL_SPAN
+    with tracing.span("embed") as s:
+        s.add(bytes=1)
+
+
+def test_collect_phases(noise):
+    """
+    Test the breakdown of an encode and a decode: every phase, with its bytes and pixels.
+    """
+
+    img = noise(48, 64)
+    payload = bytes(range(256)) * 4
+    with tracing.collect() as breakdown:
+        encoded = encode_bytes(img, payload, compression="zlib", fec="hamming")
+    phases = breakdown.phases()
+    assert list(phases) == ["load", "convert", "array", "compress", "fec", "embed", "fromarray"]
+    assert all(p["calls"] == 1 and p["seconds"] >= 0 for p in phases.values())
+    assert phases["array"]["pixels"] == 64 * 48
+    assert phases["compress"]["bytes"] == len(payload)
+
+    with tracing.collect() as breakdown:
+        assert decode_bytes(encoded) == payload
+        PSNR(img, encoded)
+    phases = breakdown.phases()
+    assert list(phases) == ["load", "convert", "array", "extract", "fec", "decompress", "psnr"]
+    assert not tracing.enabled()
+
+
+def test_payload_errors_are_unchanged(noise):
+    """
+    Test that a payload which is not bytes-like gets the same TypeError with and without tracing.
+    """
+
+    for compression in (None, "zlib"):
+        with pytest.raises(TypeError, match="The payload must be a bytes-like object"):
+            encode_bytes(noise(48, 64), "text", compression=compression)
+        with tracing.collect():
+            with pytest.raises(TypeError, match="The payload must be a bytes-like object"):
+                encode_bytes(noise(48, 64), "text", compression=compression)
+
+
+def test_collect_is_per_thread(noise):
+    """
+    Test that collect() only records the spans of its own thread.
+    """
+
+    img = noise(48, 64)
+    with tracing.collect() as breakdown:
+        thread = threading.Thread(target=encode_bytes, args=(img, b"other thread"))
+        thread.start()
+        thread.join()
+    assert breakdown.phases() == {}
+
+
+def test_hooks_and_failed_spans():
+    """
+    Test that a global hook gets the spans of every thread (start then end), failed ones included, until removed.
+    """
+
+    calls = []
+
+    class Hook:
+        def start(self, span):
+            calls.append(("start", span.name))
+
+        def __call__(self, span):
+            calls.append(("end", span.name, span.failed))
+
+    def worker():
+        with tracing.span("worker"):
+            pass
+
+    hook = Hook()
+    with tracing.hooked(hook):
+        assert tracing.enabled()
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        with pytest.raises(ValueError):
+            with tracing.span("failing"):
+                raise ValueError("boom")
+    with tracing.span("ignored"):
+        pass
+    assert calls == [("start", "worker"), ("end", "worker", False), ("start", "failing"), ("end", "failing", True)]
+
+
+def test_logging_hook(caplog, noise):
+    with caplog.at_level(logging.DEBUG, logger="src.tracing"):
+        with tracing.hooked(tracing.LoggingHook()):
+            encode_bytes(noise(48, 64), b"Ciao")
+    messages = [r.getMessage() for r in caplog.records]
+    assert any(m.startswith("embed ") and "bytes=" in m for m in messages)
+
+
+def test_prometheus_hook(tmp_path, noise):
+    path = tmp_path / "steg.prom"
+    hook = tracing.PrometheusHook(path, interval=3600)
+    with tracing.hooked(hook):
+        for _ in range(3):
+            encode_bytes(noise(48, 64), b"Ciao")
+    assert not path.exists() #The interval has not elapsed yet.
+    hook.close()
+    text = path.read_text()
+    assert "# TYPE steg_phase_seconds_total counter" in text
+    assert 'steg_phase_calls_total{phase="embed"} 3' in text
+    assert f'steg_phase_pixels_total{{phase="array"}} {3 * 64 * 48}' in text
+
+
+def test_profile_hook(tmp_path, noise):
+    """
+    Test that the profiler only runs inside the selected phases.
+    """
+
+    profile = tracing.ProfileHook(phases=["embed"])
+    with tracing.hooked(profile):
+        encode_bytes(noise(48, 64), b"Ciao" * 100)
+    report = profile.report()
+    assert "_embed_bits" in report and "fromarray" not in report
+    profile.dump(tmp_path / "embed.prof")
+    assert (tmp_path / "embed.prof").stat().st_size > 0
+
+
+def test_profile_hook_pyinstrument(noise):
+    try:
+        import pyinstrument
+    except ImportError:
+        with pytest.raises(ImportError, match="pyinstrument"):
+            tracing.ProfileHook(profiler="pyinstrument")
+    else:
+        profile = tracing.ProfileHook(profiler="pyinstrument")
+        with tracing.hooked(profile):
+            encode_bytes(noise(48, 64), b"Ciao")
+        assert profile.report()
+    with pytest.raises(ValueError):
+        tracing.ProfileHook(profiler="perf")